@@ -0,0 +1,52 @@
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from ..services.analytics import analytics_service
+from ..utils.database import get_db
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+ACTION_TYPES = "^(placement|retrieval|rearrangement|disposal)$"
+
+@router.get("/items")
+async def item_activity(
+    startDate: date,
+    endDate: date,
+    actionType: Optional[str] = Query(None, regex=ACTION_TYPES),
+    itemId: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Daily action counts per item, e.g. retrievals per item per day"""
+    return {
+        "success": True,
+        "activity": analytics_service.item_activity(db, startDate, endDate, actionType, itemId)
+    }
+
+@router.get("/zones")
+async def zone_activity(
+    startDate: date,
+    endDate: date,
+    actionType: Optional[str] = Query(None, regex=ACTION_TYPES),
+    period: str = Query("day", regex="^(day|week)$"),
+    db: Session = Depends(get_db)
+):
+    """Action counts per zone for each day or week, e.g. disposals per zone per week"""
+    return {
+        "success": True,
+        "activity": analytics_service.zone_activity(db, startDate, endDate, actionType, period)
+    }
+
+@router.get("/top-items")
+async def top_items(
+    startDate: date,
+    endDate: date,
+    actionType: Optional[str] = Query(None, regex=ACTION_TYPES),
+    limit: int = Query(10, gt=0, le=1000),
+    db: Session = Depends(get_db)
+):
+    """The most active items in the range"""
+    return {
+        "success": True,
+        "items": analytics_service.top_items(db, startDate, endDate, actionType, limit)
+    }
@@ -2,28 +2,42 @@ from fastapi import FastAPI, UploadFile, File, Query, Depends, Request, HTTPExce
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from typing import List, Optional
+import asyncio
+import json
 import logging
 import traceback
 from sqlalchemy.orm import Session
 from .schemas import (
     PlacementRequest, PlacementResponse,
     SearchResponse, RetrievalRequest,
-    PlaceItemRequest, WasteResponse,
+    PlaceItemRequest, WasteResponse, WastePageResponse,
     ReturnPlanRequest, ReturnPlanResponse,
     SimulationRequest, SimulationResponse,
-    LogResponse
+    ForecastRequest, ForecastResponse,
+    LogResponse, RetrievalSessionRequest, RetrievalSessionResponse
 )
 from .models import Item, Container
 from .services.placement import PlacementService
 from .services.search import SearchService
-from .services.waste import WasteManagementService
+from .services.retrieval import RetrievalSessionService
+from .services.waste import WasteManagementService, WASTE_PAGE_SIZE
 from .services.simulation import SimulationService
-from .services.logging import LoggingService
-from .utils.database import get_db, init_db
+from .services.inventory_snapshot import snapshot_cache
+from .services.forecast import forecast_service
+from .services.logging import LoggingService, LOG_PAGE_SIZE
+from .services.log_archive import log_archive
+from .services.log_writer import log_writer
+from .services.scheduler import scheduler
+from .utils.database import get_db, init_db, writer_engine
+from .api.analytics import router as analytics_router
 from .utils.csv_handler import CSVHandler
 from .utils.error_handling import InventoryError
+from .utils.events import publish_inventory_change
+from .utils.metrics import metrics
 from .middleware.error_handler import error_handler_middleware
 import os
 
@@ -34,7 +48,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Space Station Inventory Management System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Drain buffered audit logs in the background and flush them on shutdown
+    log_writer.start()
+    # Periodic maintenance such as the background waste sweep
+    scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        forecast_service.shutdown()
+        await log_writer.stop()
+
+app = FastAPI(title="Space Station Inventory Management System", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -51,9 +78,13 @@ templates = Jinja2Templates(directory="templates")
 # Add error handling middleware
 app.middleware("http")(error_handler_middleware)
 
+# Activity analytics served from the rollup tables
+app.include_router(analytics_router)
+
 # Initialize services
 placement_service = PlacementService()
 search_service = SearchService()  # Initialize as instance
+retrieval_session_service = RetrievalSessionService()
 waste_service = WasteManagementService()
 simulation_service = SimulationService()
 logging_service = LoggingService()
@@ -149,6 +180,7 @@ async def placement_recommendations(
                 }
                 db.add(item)
 
+        publish_inventory_change(db, "placement")
         db.commit()
 
         return PlacementResponse(
@@ -219,6 +251,28 @@ async def identify_waste(db: Session = Depends(get_db)):
     waste_items = waste_service.identify_waste_items(db)
     return WasteResponse(success=True, wasteItems=waste_items)
 
+@app.get("/api/waste/items", response_model=WastePageResponse)
+async def list_waste(
+    cursor: Optional[str] = None,
+    limit: int = Query(WASTE_PAGE_SIZE, gt=0, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Page through the items flagged as waste; pass ``nextCursor`` back to continue"""
+    waste_items, next_cursor = waste_service.list_waste(db, cursor, limit)
+    return WastePageResponse(success=True, wasteItems=waste_items, nextCursor=next_cursor)
+
+@app.get("/api/waste/items/stream")
+async def stream_waste(db: Session = Depends(get_db)):
+    """Stream every waste item as NDJSON"""
+    async def ndjson():
+        try:
+            for batch in waste_service.iter_waste(db):
+                yield "".join(json.dumps(record) + "\n" for record in batch)
+        finally:
+            db.close()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.post("/api/waste/return-plan", response_model=ReturnPlanResponse)
 async def get_return_plan(
     request: ReturnPlanRequest,
@@ -235,6 +289,23 @@ async def get_return_plan(
         returnManifest=manifest
     )
 
+@app.post("/api/waste/return-plan/stream")
+async def stream_return_plan(
+    request: ReturnPlanRequest,
+    db: Session = Depends(get_db)
+):
+    """Stream the return plan as NDJSON: the manifest, then one record per move"""
+    records = waste_service.iter_return_plan(db, request)
+    # Plan (and fail) before the response starts
+    _, manifest = next(records)
+
+    async def ndjson():
+        yield json.dumps({"type": "manifest", **manifest.model_dump(mode="json", by_alias=True)}) + "\n"
+        for kind, record in records:
+            yield json.dumps({"type": kind, **record}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.post("/api/waste/complete-undocking")
 async def complete_undocking(
     undockingContainerId: str,
@@ -254,9 +325,19 @@ async def simulate_days(
     db: Session = Depends(get_db)
 ):
     try:
+        if request.dry_run:
+            # Projections only read the snapshot, so they run off the event loop
+            snapshot = snapshot_cache.get(db)
+            start = simulation_service.current_time(db)
+            return await asyncio.to_thread(simulation_service.project, snapshot, request, start)
         response = simulation_service.simulate_time(db, request)
         logger.info("Simulation completed successfully")
         return response
+    except InventoryError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": str(e), "details": e.details}
+        )
     except Exception as e:
         logger.error(f"Error in simulation: {str(e)}\n{traceback.format_exc()}")
         raise HTTPException(
@@ -264,6 +345,66 @@ async def simulate_days(
             detail={"message": f"Simulation failed: {str(e)}"}
         )
 
+@app.post("/api/simulate/stream")
+async def stream_simulation(
+    request: SimulationRequest,
+    db: Session = Depends(get_db)
+):
+    """Stream a simulation as NDJSON: one record per simulated day, then a summary"""
+    if request.dry_run:
+        records = simulation_service.iter_projection(
+            snapshot_cache.get(db), request, simulation_service.current_time(db)
+        )
+    else:
+        records = simulation_service.iter_simulation(db, request)
+
+    async def ndjson():
+        try:
+            for record in records:
+                yield json.dumps(record) + "\n"
+                # Let other requests run between days
+                await asyncio.sleep(0)
+        except InventoryError as e:
+            yield json.dumps({"type": "error", "message": str(e), "details": e.details}) + "\n"
+        finally:
+            records.close()
+            db.close()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/api/simulation/clock")
+async def get_simulation_clock(db: Session = Depends(get_db)):
+    """The simulated date reached so far and the checkpoints that can be rolled back to"""
+    return {
+        "simulatedTime": simulation_service.current_time(db),
+        "checkpoints": simulation_service.list_checkpoints(db)
+    }
+
+@app.post("/api/simulation/rollback")
+async def rollback_simulation(
+    checkpointId: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Undo the simulation runs after a checkpoint, or all of them when none is given"""
+    try:
+        simulated_time = simulation_service.rollback(db, checkpointId)
+    except InventoryError as e:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": str(e), "details": e.details}
+        )
+    return {"success": True, "simulatedTime": simulated_time}
+
+@app.post("/api/simulate/forecast", response_model=ForecastResponse)
+async def forecast_consumption(
+    request: ForecastRequest,
+    db: Session = Depends(get_db)
+):
+    """Monte Carlo forecast of depletion and expiry dates under random daily usage"""
+    snapshot = snapshot_cache.get(db)
+    start = simulation_service.current_time(db)
+    return await asyncio.to_thread(forecast_service.forecast, snapshot, request, start)
+
 @app.get("/api/simulation/status")
 async def get_simulation_status(db: Session = Depends(get_db)):
     """Get current simulation status including totals for items used, depleted and expired"""
@@ -326,6 +467,14 @@ async def export_arrangement(db: Session = Depends(get_db)):
     csv_content = CSVHandler.export_arrangement(db)
     return {"content": csv_content}
 
+@app.get("/api/arrangement/verify")
+async def verify_arrangement(
+    containerId: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Verify every placed item, or those of one container, against the exported arrangement"""
+    return CSVHandler.verify_arrangement_bulk(db, containerId)
+
 @app.get("/api/logs", response_model=LogResponse)
 async def get_logs(
     startDate: datetime,
@@ -333,17 +482,89 @@ async def get_logs(
     itemId: Optional[str] = None,
     userId: Optional[str] = None,
     actionType: Optional[str] = Query(None, regex="^(placement|retrieval|rearrangement|disposal)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(LOG_PAGE_SIZE, gt=0, le=10000),
+    fromContainer: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    return logging_service.get_logs(
-        db,
-        startDate,
-        endDate,
-        itemId,
-        userId,
-        actionType
+    """One page of logs; pass ``nextCursor`` back as ``cursor`` to continue.
+
+    ``fromContainer`` keeps the logs of items moved, retrieved or disposed out of that container.
+    """
+    try:
+        return logging_service.get_logs(
+            db,
+            startDate,
+            endDate,
+            itemId,
+            userId,
+            actionType,
+            cursor,
+            limit,
+            fromContainer
+        )
+    except InventoryError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+@app.get("/api/logs/export")
+async def export_logs(
+    startDate: datetime,
+    endDate: datetime,
+    itemId: Optional[str] = None,
+    userId: Optional[str] = None,
+    actionType: Optional[str] = Query(None, regex="^(placement|retrieval|rearrangement|disposal)$"),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    gzip: bool = False,
+    fromContainer: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Stream every matching log as NDJSON or CSV, optionally gzip-compressed"""
+    chunks = logging_service.export_logs(
+        db, startDate, endDate, itemId, userId, actionType, fmt=format, compress=gzip, from_container=fromContainer
+    )
+
+    async def body():
+        try:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+                await asyncio.sleep(0)
+        finally:
+            chunks.close()
+            db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"logs.{format}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
+@app.post("/api/logs/archive")
+async def archive_logs(
+    before: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Move logs older than ``before`` (default: the retention window) into archive segments"""
+    bind = db.get_bind()
+
+    def archive() -> dict:
+        logging_service.flush()
+        # A session of its own, since the work runs outside the request's thread
+        with Session(bind=writer_engine(bind)) as session:
+            return log_archive.archive(session, before)
+
+    result = await asyncio.to_thread(archive)
+    return {"success": True, **result}
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Runtime statistics such as search cache hit rates and log writer throughput"""
+    return metrics.snapshot()
+
 @app.get("/api/containers/check")
 async def check_containers(db: Session = Depends(get_db)):
     count = db.query(Container).count()
@@ -369,24 +590,7 @@ async def get_container(container_id: str, db: Session = Depends(get_db)):
 
 @app.get("/api/containers/{container_id}/items")
 async def get_container_items(container_id: str, db: Session = Depends(get_db)):
-    items = db.query(Item).filter(
-        Item.container_id == container_id,
-        Item.is_waste == False
-    ).all()
-    return [{
-        "itemId": item.itemId,
-        "name": item.name,
-        "width": item.width,
-        "depth": item.depth,
-        "height": item.height,
-        "mass": item.mass,
-        "priority": item.priority,
-        "position": item.position,
-        "expiryDate": item.expiry_date.isoformat() if item.expiry_date else None,
-        "usageLimit": item.usage_limit,
-        "usesRemaining": item.uses_remaining,
-        "preferredZone": item.preferred_zone
-    } for item in items]
+    return search_service.list_container_items(db, container_id)
 
 @app.post("/api/placement/optimize")
 async def optimize_placement(db: Session = Depends(get_db)):
@@ -448,6 +652,7 @@ async def optimize_placement(db: Session = Depends(get_db)):
                 }
                 db.add(item)
                 
+        publish_inventory_change(db, "placement")
         db.commit()
         return {
             "success": True,
@@ -568,6 +773,21 @@ async def initiate_retrieval(
             detail={"message": f"Error initiating retrieval: {str(e)}"}
         )
 
+@app.post("/api/retrieval/session", response_model=RetrievalSessionResponse)
+async def plan_retrieval_session(
+    request: RetrievalSessionRequest,
+    db: Session = Depends(get_db)
+):
+    """Plan the retrieval of several items, visiting each container once"""
+    try:
+        return retrieval_session_service.plan_session(db, request)
+    except Exception as e:
+        logger.error(f"Error planning retrieval session: {traceback.format_exc()}")
+        raise HTTPException(
+            status_code=500,
+            detail={"message": f"Error planning retrieval session: {str(e)}"}
+        )
+
 @app.post("/api/retrieval/confirm")
 async def confirm_retrieval(
     itemId: str,
@@ -625,6 +845,7 @@ async def confirm_retrieval(
             }
         )
 
+        publish_inventory_change(db, "retrieval", item_ids=[itemId])
         db.commit()
 
         return {
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Float, Integer, DateTime, Boolean, JSON, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, String, Float, Integer, Date, DateTime, Boolean, JSON, ForeignKey, Index, LargeBinary
+from sqlalchemy.orm import declarative_base, relationship, synonym
 
 Base = declarative_base()
 
@@ -24,10 +24,14 @@ class Item(Base):
 
     container = relationship("Container", back_populates="items")
 
-    @property
-    def id(self):
-        """Backward compatibility for id attribute"""
-        return self.itemId
+    __table_args__ = (
+        # Waste detection scans active items by expiry date and by remaining uses
+        Index("ix_items_waste_expiry", "is_waste", "expiry_date"),
+        Index("ix_items_waste_uses", "is_waste", "uses_remaining"),
+    )
+
+    # Backward compatible alias of itemId, usable in queries too
+    id = synonym("itemId")
 
 class Container(Base):
     __tablename__ = "containers"
@@ -49,5 +53,66 @@ class Log(Base):
     action_type = Column(String, nullable=False)
     item_id = Column(String, ForeignKey("items.itemId"), nullable=False)
     details = Column(JSON, nullable=True)
+    # Hot detail fields promoted out of ``details``; see app/utils/log_details.py
+    promoted = Column(Integer, nullable=True)
+    from_container = Column(String, nullable=True)
+    to_container = Column(String, nullable=True)
+    from_position = Column(LargeBinary, nullable=True)
+    to_position = Column(LargeBinary, nullable=True)
+    old_uses = Column(Integer, nullable=True)
+    new_uses = Column(Integer, nullable=True)
+
+    item = relationship("Item")
+
+    __table_args__ = (
+        # One index per filter combination of /api/logs, each ending in the
+        # (timestamp, id) page order so a page is a single index range scan
+        Index("ix_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_logs_item_timestamp", "item_id", "timestamp", "id"),
+        Index("ix_logs_user_timestamp", "user_id", "timestamp", "id"),
+        Index("ix_logs_action_timestamp", "action_type", "timestamp", "id"),
+        Index("ix_logs_from_container_timestamp", "from_container", "timestamp", "id"),
+    )
+
+# Log counts per UTC day, kept current as logs are written
+class ItemActivityRollup(Base):
+    __tablename__ = "item_activity_rollups"
+
+    day = Column(Date, primary_key=True)
+    action_type = Column(String, primary_key=True)
+    item_id = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_item_rollups_item_day", "item_id", "day"),
+    )
+
+class ZoneActivityRollup(Base):
+    __tablename__ = "zone_activity_rollups"
 
-    item = relationship("Item")
\ No newline at end of file
+    day = Column(Date, primary_key=True)
+    zone = Column(String, primary_key=True)
+    action_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class StateCounter(Base):
+    __tablename__ = "state_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class SimulationCheckpoint(Base):
+    __tablename__ = "simulation_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    simulated_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # Changed rows as {itemId: [old uses, new uses, old is_waste, new is_waste]}
+    delta = Column(JSON, nullable=False, default=dict)
@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field, validator
 
@@ -128,6 +128,45 @@ class SearchResponse(BaseModel):
     total_items: int = Field(alias="totalItems")
     active_items: int = Field(alias="activeItems")
 
+class RetrievalTarget(BaseModel):
+    item_id: Optional[str] = Field(None, alias="itemId")
+    item_name: Optional[str] = Field(None, alias="itemName")
+
+    @validator('item_name', always=True)
+    def validate_target(cls, v, values):
+        if not v and not values.get('item_id'):
+            raise ValueError("Either itemId or itemName must be provided")
+        return v
+
+class RetrievalSessionRequest(BaseModel):
+    targets: List[RetrievalTarget]
+    user_id: Optional[str] = Field(None, alias="userId")
+    search_budget: Optional[int] = Field(None, alias="searchBudget", gt=0)
+
+    @validator('targets')
+    def validate_targets(cls, v):
+        if not v:
+            raise ValueError("At least one target must be provided")
+        return v
+
+class SessionStep(BaseModel):
+    step: int
+    action: str
+    item_id: str = Field(alias="itemId")
+    item_name: str = Field(alias="itemName")
+    container_id: Optional[str] = Field(None, alias="containerId")
+    mass: float = 0
+
+class RetrievalSessionResponse(BaseModel):
+    success: bool
+    steps: List[SessionStep]
+    container_order: List[str] = Field(alias="containerOrder")
+    retrieved_items: List[str] = Field(alias="retrievedItems")
+    unresolved_targets: List[Dict] = Field(default_factory=list, alias="unresolvedTargets")
+    moved_mass: float = Field(alias="movedMass")
+    blockers_moved: int = Field(alias="blockersMoved")
+    budget_exhausted: bool = Field(False, alias="budgetExhausted")
+
 class RetrievalRequest(BaseModel):
     item_id: str = Field(alias="itemId")
     user_id: str = Field(alias="userId")
@@ -151,10 +190,24 @@ class WasteResponse(BaseModel):
     success: bool
     waste_items: List[WasteItem] = Field(alias="wasteItems")
 
+class WasteListItem(BaseModel):
+    itemId: str
+    name: str
+    reason: str
+    containerId: Optional[str] = None
+    position: Optional[Position] = None
+
+class WastePageResponse(BaseModel):
+    success: bool
+    waste_items: List[WasteListItem] = Field(alias="wasteItems")
+    next_cursor: Optional[str] = Field(None, alias="nextCursor")
+
 class ReturnPlanRequest(BaseModel):
     undocking_container_id: str = Field(alias="undockingContainerId")
     undocking_date: datetime = Field(alias="undockingDate")
     max_weight: float = Field(alias="maxWeight")
+    objective: str = Field("mass", pattern="^(mass|count)$")
+    time_budget_ms: Optional[int] = Field(None, alias="timeBudgetMs", gt=0)
 
 class ReturnManifest(BaseModel):
     undocking_container_id: str = Field(alias="undockingContainerId")
@@ -162,6 +215,7 @@ class ReturnManifest(BaseModel):
     return_items: List[Dict] = Field(alias="returnItems")
     total_volume: float = Field(alias="totalVolume")
     total_weight: float = Field(alias="totalWeight")
+    optimization: Dict = Field(default_factory=dict)
 
 class ReturnPlanResponse(BaseModel):
     success: bool
@@ -170,13 +224,18 @@ class ReturnPlanResponse(BaseModel):
     return_manifest: ReturnManifest = Field(alias="returnManifest")
 
 class SimulationRequest(BaseModel):
-    num_of_days: int = Field(alias="numOfDays", gt=0)
+    num_of_days: Optional[int] = Field(None, alias="numOfDays", gt=0)
+    to_timestamp: Optional[datetime] = Field(None, alias="toTimestamp")
     items_to_be_used_per_day: List[Dict[str, str]] = Field(alias="itemsToBeUsedPerDay")
+    dry_run: bool = Field(False, alias="dryRun")
+    profile: bool = False
 
     @validator('items_to_be_used_per_day')
-    def validate_items(cls, v):
+    def validate_items(cls, v, values):
         if not all('itemId' in item for item in v):
             raise ValueError("All items must have an itemId")
+        if not values.get('num_of_days') and not values.get('to_timestamp'):
+            raise ValueError("Either numOfDays or toTimestamp must be provided")
         return v
 
     class Config:
@@ -195,6 +254,7 @@ class SimulationChanges(BaseModel):
     totalItemsUsed: int
     totalItemsDepleted: int
     totalItemsExpired: int
+    unknownItems: List[str] = Field(default_factory=list)
 
     class Config:
         populate_by_name = True
@@ -204,11 +264,46 @@ class SimulationResponse(BaseModel):
     success: bool
     newDate: datetime
     changes: SimulationChanges
+    dryRun: bool = False
+    checkpointId: Optional[int] = None
+    profile: Optional[Dict] = None
 
     class Config:
         populate_by_name = True
         allow_population_by_field_name = True
 
+class ForecastRequest(BaseModel):
+    num_of_days: int = Field(alias="numOfDays", gt=0, le=3650)
+    usage_rates: List[Dict[str, Any]] = Field(alias="usageRates")
+    trials: int = Field(1000, gt=0, le=100000)
+    seed: int = Field(0, ge=0)
+    percentiles: List[float] = Field(default_factory=lambda: [10.0, 50.0, 90.0])
+
+    @validator('usage_rates')
+    def validate_rates(cls, v):
+        for entry in v:
+            if 'itemId' not in entry or float(entry.get('ratePerDay', -1)) < 0:
+                raise ValueError("Every usage rate needs an itemId and a non-negative ratePerDay")
+        return v
+
+    @validator('percentiles')
+    def validate_percentiles(cls, v):
+        if not v or not all(0 <= p <= 100 for p in v):
+            raise ValueError("Percentiles must be between 0 and 100")
+        return v
+
+    class Config:
+        populate_by_name = True
+        allow_population_by_field_name = True
+
+class ForecastResponse(BaseModel):
+    success: bool
+    startDate: datetime
+    trials: int
+    seed: int
+    items: List[Dict]
+    weeklyWasteMass: List[Dict]
+
 class LogEntry(BaseModel):
     timestamp: datetime
     user_id: str = Field(alias="userId")
@@ -217,4 +312,5 @@ class LogEntry(BaseModel):
     details: Dict
 
 class LogResponse(BaseModel):
-    logs: List[LogEntry]
\ No newline at end of file
+    logs: List[LogEntry]
+    nextCursor: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""Activity rollups: log counts per day by item and by zone.
+
+The rollup tables are updated right after every log insert, in a
+transaction or savepoint of their own so a failed update never loses a log
+row. To rebuild them from the logs and the log archive, run:
+
+    python -m app.services.analytics
+"""
+import argparse
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from ..models import Container, Item, ItemActivityRollup, Log, ZoneActivityRollup
+from .log_archive import LogArchive, log_archive
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Zone counted for logs of items that no longer exist
+UNKNOWN_ZONE = "unknown"
+
+def _day(timestamp: datetime) -> date:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date()
+
+def _zones(conn: Any, item_ids: Iterable[str]) -> Dict[str, str]:
+    """Zone of each item: that of its container, or its preferred zone while unplaced"""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    rows = conn.execute(
+        select(Item.itemId, func.coalesce(Container.zone, Item.preferred_zone))
+        .outerjoin(Container, Item.container_id == Container.id)
+        .where(Item.itemId.in_(item_ids))
+    ).all()
+    return {item_id: zone for item_id, zone in rows}
+
+def _upsert(conn: Any, model: Any, keys: Tuple[str, ...], counts: Counter) -> None:
+    if not counts:
+        return
+    stmt = insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(model, key) for key in keys],
+        set_={"count": model.count + stmt.excluded.count}
+    )
+    conn.execute(stmt, [{**dict(zip(keys, key)), "count": count} for key, count in counts.items()])
+
+def _zone_counts(conn: Any, item_counts: Counter) -> Counter:
+    zones = _zones(conn, {item_id for _, _, item_id in item_counts})
+    zone_counts: Counter = Counter()
+    for (day, action_type, item_id), count in item_counts.items():
+        zone_counts[(day, zones.get(item_id, UNKNOWN_ZONE), action_type)] += count
+    return zone_counts
+
+def record_rollups(conn: Any, rows: List[Dict]) -> None:
+    """Count log rows into the rollups within the caller's transaction.
+
+    ``conn`` is the Connection or Session the rows are inserted through and
+    ``rows`` are the insert parameters of the logs table.
+    """
+    item_counts = Counter((_day(row["timestamp"]), row["action_type"], row["item_id"]) for row in rows)
+    if not item_counts:
+        return
+    _upsert(conn, ItemActivityRollup, ("day", "action_type", "item_id"), item_counts)
+    _upsert(conn, ZoneActivityRollup, ("day", "zone", "action_type"), _zone_counts(conn, item_counts))
+
+class AnalyticsService:
+    """Answers activity questions from the rollups instead of scanning logs"""
+
+    def item_activity(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        action_type: Optional[str] = None,
+        item_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Daily counts per item between ``start`` and ``end`` inclusive"""
+        stmt = select(
+            ItemActivityRollup.day, ItemActivityRollup.item_id, ItemActivityRollup.action_type, ItemActivityRollup.count
+        ).where(ItemActivityRollup.day >= start, ItemActivityRollup.day <= end)
+        if action_type:
+            stmt = stmt.where(ItemActivityRollup.action_type == action_type)
+        if item_id:
+            stmt = stmt.where(ItemActivityRollup.item_id == item_id)
+        rows = db.execute(stmt.order_by(ItemActivityRollup.day, ItemActivityRollup.item_id)).all()
+        return [
+            {"day": row.day.isoformat(), "itemId": row.item_id, "actionType": row.action_type, "count": row.count}
+            for row in rows
+        ]
+
+    def zone_activity(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        action_type: Optional[str] = None,
+        period: str = "day"
+    ) -> List[Dict[str, Any]]:
+        """Counts per zone and action type for each day, or each week starting on Monday"""
+        stmt = select(
+            ZoneActivityRollup.day, ZoneActivityRollup.zone, ZoneActivityRollup.action_type, ZoneActivityRollup.count
+        ).where(ZoneActivityRollup.day >= start, ZoneActivityRollup.day <= end)
+        if action_type:
+            stmt = stmt.where(ZoneActivityRollup.action_type == action_type)
+
+        counts: Counter = Counter()
+        for row in db.execute(stmt):
+            bucket = row.day - timedelta(days=row.day.weekday()) if period == "week" else row.day
+            counts[(bucket, row.zone, row.action_type)] += row.count
+        return [
+            {period: bucket.isoformat(), "zone": zone, "actionType": action, "count": count}
+            for (bucket, zone, action), count in sorted(counts.items())
+        ]
+
+    def top_items(
+        self,
+        db: Session,
+        start: date,
+        end: date,
+        action_type: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Items with the most logged actions in the range"""
+        total = func.sum(ItemActivityRollup.count).label("total")
+        stmt = select(ItemActivityRollup.item_id, total).where(
+            ItemActivityRollup.day >= start, ItemActivityRollup.day <= end
+        )
+        if action_type:
+            stmt = stmt.where(ItemActivityRollup.action_type == action_type)
+        rows = db.execute(
+            stmt.group_by(ItemActivityRollup.item_id).order_by(total.desc(), ItemActivityRollup.item_id).limit(limit)
+        ).all()
+        return [{"itemId": row.item_id, "count": int(row.total)} for row in rows]
+
+    def backfill(self, db: Session, archive: LogArchive = None) -> Dict[str, int]:
+        """Rebuild both rollups from the logs table and the archived segments"""
+        from .log_writer import log_writer
+        log_writer.flush()
+        archive = archive or log_archive
+
+        item_counts: Counter = Counter()
+        logs_counted = 0
+        for logs in archive.query(datetime.min, datetime.max):
+            for log in logs:
+                item_counts[(log.timestamp.date(), log.action_type, log.item_id)] += 1
+            logs_counted += len(logs)
+
+        day = func.date(Log.timestamp)
+        for log_day, action_type, item_id, count in db.execute(
+            select(day, Log.action_type, Log.item_id, func.count()).group_by(day, Log.action_type, Log.item_id)
+        ):
+            item_counts[(date.fromisoformat(log_day), action_type, item_id)] += count
+            logs_counted += count
+
+        zone_counts = _zone_counts(db, item_counts)
+        db.execute(delete(ItemActivityRollup))
+        db.execute(delete(ZoneActivityRollup))
+        _upsert(db, ItemActivityRollup, ("day", "action_type", "item_id"), item_counts)
+        _upsert(db, ZoneActivityRollup, ("day", "zone", "action_type"), zone_counts)
+        db.commit()
+
+        logger.info(f"Rebuilt activity rollups from {logs_counted} logs")
+        return {"logsCounted": logs_counted, "itemRows": len(item_counts), "zoneRows": len(zone_counts)}
+
+analytics_service = AnalyticsService()
+
+def main() -> None:
+    argparse.ArgumentParser(description="Rebuild the activity rollups from the logs and the log archive").parse_args()
+    from ..utils.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        result = analytics_service.backfill(db)
+    finally:
+        db.close()
+    print(f"Counted {result['logsCounted']} logs into {result['itemRows']} item and {result['zoneRows']} zone rollup rows")
+
+if __name__ == "__main__":
+    main()
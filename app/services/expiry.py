@@ -0,0 +1,86 @@
+import heapq
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models import Item
+from ..utils.events import read_version, INVENTORY_VERSION
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+class ExpiryIndex:
+    """In-memory min-heap of the expiry dates of active items.
+
+    The heap is built from the ``(is_waste, expiry_date)`` index and stamped
+    with the inventory version it reflects. Each scan pops only the items
+    whose expiry passed since the previous scan. The heap is rebuilt when
+    the inventory version moved on for any reason other than this index's
+    own waste marking, so items imported or changed by other workers are
+    picked up too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[datetime, str]] = []
+        # URL of the database the heap was built from
+        self._url = None
+        self._version: Optional[int] = None
+        self.last_scan: Optional[datetime] = None
+        self.rebuilds = 0
+
+    def pop_due(self, db: Session, now: datetime) -> List[str]:
+        """Remove and return the ids of items whose expiry is at or before ``now``"""
+        now = _as_utc(now)
+        with self._lock:
+            version = read_version(db, INVENTORY_VERSION)
+            # Keyed on the database, not the Engine: the scheduler's writer engine reaches the same one
+            if self._url != db.get_bind().url or self._version != version:
+                self._rebuild(db, version)
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+            self.last_scan = now
+            return due
+
+    def acknowledge(self, db: Session, previous_version: int) -> None:
+        """Adopt the version produced by our own waste marking without a rebuild.
+
+        Only a single bump since ``previous_version`` can be ours; anything
+        else means another writer changed the inventory and forces a rebuild.
+        """
+        with self._lock:
+            version = read_version(db, INVENTORY_VERSION)
+            if self._version == previous_version and version == previous_version + 1:
+                self._version = version
+
+    def next_expiry(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def _rebuild(self, db: Session, version: int) -> None:
+        rows = db.execute(
+            select(Item.expiry_date, Item.itemId).where(
+                Item.is_waste == False,
+                Item.expiry_date.isnot(None)
+            )
+        ).all()
+        self._heap = [(_as_utc(expiry_date), item_id) for expiry_date, item_id in rows]
+        heapq.heapify(self._heap)
+        self._url = db.get_bind().url
+        self._version = version
+        self.rebuilds += 1
+        logger.info(f"Rebuilt expiry index with {len(self._heap)} items")
+
+expiry_index = ExpiryIndex()
@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from ..schemas import ForecastRequest, ForecastResponse
+from .inventory_snapshot import InventorySnapshot
+from .simulation_kernel import run_trials
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for forecasts; 0 or 1 runs every chunk in the calling process
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(os.cpu_count() or 1)))
+# Trials simulated per task; fixed so results do not depend on the worker count
+FORECAST_CHUNK_TRIALS = int(os.getenv("FORECAST_CHUNK_TRIALS", "250"))
+
+def _day_histogram(days: np.ndarray, num_days: int) -> np.ndarray:
+    """Per-item counts of each day value, as an (items, num_days + 1) matrix"""
+    trials, count = days.shape
+    offsets = np.arange(count) * (num_days + 1)
+    return np.bincount((days + offsets).ravel(), minlength=count * (num_days + 1)).reshape(count, num_days + 1)
+
+def _weekly_totals(depleted: np.ndarray, expired: np.ndarray, mass: np.ndarray, num_days: int) -> np.ndarray:
+    """Mass that turns into waste in each (trial, week)"""
+    weeks = (num_days + 6) // 7
+    trials = len(depleted)
+    waste_day = np.minimum(depleted, expired)
+    trial_index, item_index = np.nonzero(waste_day < num_days)
+    week = waste_day[trial_index, item_index] // 7
+    return np.bincount(
+        trial_index * weeks + week,
+        weights=mass[item_index],
+        minlength=trials * weeks
+    ).reshape(trials, weeks)
+
+def _run_chunk(args: Tuple) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Simulate one chunk and reduce it to day histograms and weekly waste totals.
+
+    Only the reductions leave the worker, so memory does not grow with
+    trials times items however many trials are requested.
+    """
+    *trial_args, mass = args
+    depleted, expired = run_trials(*trial_args)
+    num_days = trial_args[4]
+    return (
+        _day_histogram(depleted, num_days),
+        _day_histogram(expired, num_days),
+        _weekly_totals(depleted, expired, mass, num_days)
+    )
+
+def _percentile_days(histogram: np.ndarray, percentiles: List[float]) -> np.ndarray:
+    """``inverted_cdf`` percentiles of the day values counted in ``histogram``"""
+    cumulative = np.cumsum(histogram)
+    ranks = np.maximum(1, np.ceil(cumulative[-1] * np.asarray(percentiles, dtype=float) / 100))
+    return np.searchsorted(cumulative, ranks)
+
+class ForecastService:
+    """Monte Carlo forecast of depletion, expiry and waste under stochastic usage.
+
+    Daily uses of each item are Poisson distributed with the requested rate.
+    Trials are split into fixed-size chunks, each seeded with its own child
+    of ``SeedSequence(seed)``, and the chunks run in a process pool; the
+    same seed therefore always gives the same forecast.
+    """
+
+    def __init__(self, workers: int = FORECAST_WORKERS, chunk_trials: int = FORECAST_CHUNK_TRIALS):
+        self.workers = workers
+        self.chunk_trials = max(1, chunk_trials)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def forecast(
+        self,
+        snapshot: InventorySnapshot,
+        request: ForecastRequest,
+        start: Optional[datetime] = None
+    ) -> ForecastResponse:
+        start = start or datetime.now(timezone.utc)
+        num_days = request.num_of_days
+        rates_by_id = {str(entry["itemId"]): float(entry["ratePerDay"]) for entry in request.usage_rates}
+        rows, kernel = snapshot.checkout(list(rates_by_id), start, num_days)
+        rates = np.array([rates_by_id.get(row.itemId, 0.0) for row in rows])
+        mass = np.array([float(row.mass) for row in rows])
+
+        chunks = [
+            min(self.chunk_trials, request.trials - offset)
+            for offset in range(0, request.trials, self.chunk_trials)
+        ]
+        seeds = np.random.SeedSequence(request.seed).spawn(len(chunks))
+        tasks = [
+            (kernel.uses, kernel.limited, kernel.expiry, rates, num_days, trials, seed, mass)
+            for trials, seed in zip(chunks, seeds)
+        ]
+        if self.workers > 1 and len(tasks) > 1 and len(rows):
+            results = self._executor().map(_run_chunk, tasks)
+        else:
+            results = map(_run_chunk, tasks)
+
+        # Histograms are summed as chunks arrive; weekly totals stay per trial for their percentiles
+        depleted = np.zeros((len(rows), num_days + 1), dtype=np.int64)
+        expired = np.zeros((len(rows), num_days + 1), dtype=np.int64)
+        weekly = []
+        for depleted_counts, expired_counts, totals in results:
+            depleted += depleted_counts
+            expired += expired_counts
+            weekly.append(totals)
+
+        return ForecastResponse(
+            success=True,
+            startDate=start,
+            trials=request.trials,
+            seed=request.seed,
+            items=self._item_forecasts(rows, rates, depleted, expired, start, num_days, request.percentiles),
+            weeklyWasteMass=self._weekly_waste(weekly, request.percentiles)
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forked children of a threaded server can inherit locks held by other threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _item_forecasts(
+        self,
+        rows: List[Any],
+        rates: np.ndarray,
+        depleted: np.ndarray,
+        expired: np.ndarray,
+        start: datetime,
+        num_days: int,
+        percentiles: List[float]
+    ) -> List[Dict[str, Any]]:
+        """Forecast per item from its (items, num_days + 1) day histograms"""
+        def dates(histogram: np.ndarray) -> Dict[str, Optional[str]]:
+            # Observed values only, so a percentile beyond the horizon reads as None
+            values = _percentile_days(histogram, percentiles) if histogram.sum() else []
+            return {
+                f"p{percentile:g}": (start + timedelta(days=int(day))).isoformat() if day < num_days else None
+                for percentile, day in zip(percentiles, values)
+            }
+
+        def probability(histogram: np.ndarray) -> float:
+            trials = histogram.sum()
+            return round(float(1 - histogram[num_days] / trials), 4) if trials else 0.0
+
+        forecasts = []
+        for i, row in enumerate(rows):
+            forecasts.append({
+                "itemId": row.itemId,
+                "name": row.name,
+                "ratePerDay": float(rates[i]),
+                "depletionProbability": probability(depleted[i]),
+                "expiryProbability": probability(expired[i]),
+                "depletionDate": dates(depleted[i]),
+                "expiryDate": dates(expired[i])
+            })
+        return forecasts
+
+    def _weekly_waste(self, weekly: List[np.ndarray], percentiles: List[float]) -> List[Dict[str, Any]]:
+        totals = np.concatenate(weekly) if weekly else np.zeros((0, 0))
+        weeks = totals.shape[1]
+        if not weeks or not len(totals):
+            return []
+
+        values = np.percentile(totals, percentiles, axis=0)
+        return [
+            {
+                "week": w + 1,
+                "mean": round(float(totals[:, w].mean()), 3),
+                **{f"p{percentile:g}": round(float(values[p, w]), 3) for p, percentile in enumerate(percentiles)}
+            }
+            for w in range(weeks)
+        ]
+
+forecast_service = ForecastService()
@@ -0,0 +1,132 @@
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models import Item
+from ..utils.events import read_version, INVENTORY_VERSION
+from ..utils.metrics import metrics
+from .simulation_kernel import SimulationKernel
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_COLUMNS = (
+    Item.itemId,
+    Item.name,
+    Item.mass,
+    Item.usage_limit,
+    Item.uses_remaining,
+    Item.expiry_date,
+    Item.is_waste
+)
+
+def _epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class InventorySnapshot:
+    """Read-only, array-backed copy of the active items at one inventory version.
+
+    The arrays are frozen, so any number of what-if runs can read the same
+    snapshot concurrently. A run copies only the rows it may change (the
+    items it uses and those expiring within its horizon) into a private
+    kernel; untouched rows are never duplicated.
+    """
+
+    def __init__(self, rows: List[Any], version: int):
+        self.version = version
+        self.rows = rows
+        self.index = {row.itemId: i for i, row in enumerate(rows)}
+        self.uses = self._frozen([row.uses_remaining or 0 for row in rows], np.int64)
+        self.limited = self._frozen(
+            [row.usage_limit is not None and row.uses_remaining is not None for row in rows], bool
+        )
+        self.expiry = self._frozen(
+            [_epoch(row.expiry_date) if row.expiry_date else np.inf for row in rows], float
+        )
+
+    @staticmethod
+    def _frozen(values: Sequence, dtype) -> np.ndarray:
+        array = np.array(values, dtype=dtype)
+        array.flags.writeable = False
+        return array
+
+    def checkout(
+        self,
+        usage_ids: Sequence[str],
+        start: datetime,
+        num_days: int
+    ) -> Tuple[List[Any], SimulationKernel]:
+        """Private copies of the rows a run over ``num_days`` from ``start`` can change.
+
+        Rows come back with used items first, in the order they are first
+        used, followed by the items that only expire.
+        """
+        first_use: Dict[str, int] = {}
+        for position, item_id in enumerate(usage_ids):
+            if item_id in self.index:
+                first_use.setdefault(item_id, position)
+
+        # Expiry day of every item, relative to this run's start
+        start_epoch = _epoch(start)
+        days = np.maximum(0, np.ceil((self.expiry - start_epoch) / 86400))
+        expiring = np.flatnonzero(days < num_days)
+
+        used = [self.index[item_id] for item_id in first_use]
+        used_set = set(used)
+        selected = np.array(
+            used + sorted((i for i in expiring.tolist() if i not in used_set), key=lambda i: self.rows[i].itemId),
+            dtype=np.int64
+        )
+
+        rows = [self.rows[i] for i in selected.tolist()]
+        kernel = SimulationKernel(
+            [row.itemId for row in rows],
+            self.uses[selected],  # Fancy indexing copies just these rows
+            self.limited[selected],
+            days[selected],
+            np.zeros(len(selected), dtype=bool)
+        )
+        return rows, kernel
+
+class SnapshotCache:
+    """Keeps the snapshot of the latest inventory version per database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[InventorySnapshot] = None
+        self._bind = None
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, db: Session) -> InventorySnapshot:
+        version = read_version(db, INVENTORY_VERSION)
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version and self._bind is db.get_bind():
+                self.hits += 1
+                return snapshot
+
+            rows = db.execute(
+                select(*_SNAPSHOT_COLUMNS).where(Item.is_waste == False).order_by(Item.itemId)
+            ).all()
+            self._snapshot = InventorySnapshot(rows, version)
+            self._bind = db.get_bind()
+            self.builds += 1
+            logger.info(f"Built inventory snapshot of {len(rows)} items at version {version}")
+            return self._snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "items": len(snapshot.rows) if snapshot else 0,
+            "builds": self.builds,
+            "hits": self.hits
+        }
+
+snapshot_cache = SnapshotCache()
+metrics.register("inventorySnapshot", snapshot_cache.stats)
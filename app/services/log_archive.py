@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from ..models import Log
+from ..utils.log_details import DETAIL_COLUMNS, unpack_details
+from ..utils.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the archived log segments
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "log_archive")
+# Logs older than this many days are moved out of the database
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+
+_DAY = timedelta(days=1)
+_EPOCH = datetime(1970, 1, 1)
+_COLUMNS = ("id", "timestamp", "user_id", "action_type", "item_id", "details")
+_SOURCE_COLUMNS = _COLUMNS + ("promoted",) + DETAIL_COLUMNS
+
+def _micros(value: datetime) -> int:
+    """Microseconds since the epoch of a timestamp stored naive in UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# Archived logs hold their full details, with no typed detail columns
+class ArchivedLog(NamedTuple):
+    id: int
+    timestamp: datetime
+    user_id: str
+    action_type: str
+    item_id: str
+    details: Optional[Dict]
+
+class Segment(NamedTuple):
+    path: Path
+    min_timestamp: int
+    max_timestamp: int
+    item_ids: frozenset
+    from_containers: frozenset
+
+class LogArchive:
+    """Cold storage for old logs as compressed, columnar day segments.
+
+    Each segment is an ``.npz`` file holding one UTC day of logs, one array
+    per column, plus a small footer of its min/max timestamp and the item ids
+    it contains. Queries read only the footers to skip segments that cannot
+    match and load the columns of the rest.
+    """
+
+    def __init__(self, directory: str = LOG_ARCHIVE_DIR, retention_days: float = LOG_RETENTION_DAYS):
+        self.directory = Path(directory)
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._stamp: Optional[int] = None
+        self.logs_archived = 0
+
+    def archive(self, db: Session, before: Optional[datetime] = None) -> Dict[str, Any]:
+        """Move every log older than ``before`` into day segments.
+
+        ``before`` defaults to the retention cutoff and is rounded down to a
+        day boundary. Rows are deleted in the same transaction that follows
+        each segment write, so a failed run leaves them in the database.
+        """
+        if before is None:
+            before = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        cutoff = _naive_utc(before).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        segments = archived = 0
+        day = db.execute(select(func.min(Log.timestamp)).where(Log.timestamp < cutoff)).scalar()
+        while day is not None:
+            day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+            day_end = min(day + _DAY, cutoff)
+            rows = db.execute(
+                select(*(getattr(Log, column) for column in _SOURCE_COLUMNS))
+                .where(Log.timestamp >= day, Log.timestamp < day_end)
+                .order_by(Log.timestamp, Log.id)
+            ).all()
+            if rows:
+                path = self._write_segment(day, rows)
+                try:
+                    db.execute(delete(Log).where(Log.timestamp >= day, Log.timestamp < day_end))
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    path.unlink(missing_ok=True)
+                    raise
+                segments += 1
+                archived += len(rows)
+            day = db.execute(select(func.min(Log.timestamp)).where(
+                Log.timestamp >= day_end, Log.timestamp < cutoff
+            )).scalar()
+
+        self.logs_archived += archived
+        if archived:
+            logger.info(f"Archived {archived} logs into {segments} segments before {cutoff.isoformat()}")
+        return {"segmentsWritten": segments, "logsArchived": archived}
+
+    def query(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        item_id: str = None,
+        user_id: str = None,
+        action_type: str = None,
+        from_container: str = None,
+        after: Optional[Tuple[datetime, int]] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[List[ArchivedLog]]:
+        """Yield the matching archived logs one segment at a time.
+
+        Segments are pruned by their footers; those written before source
+        containers were recorded never match ``from_container``. ``after`` is
+        a ``(timestamp, id)`` keyset position to resume from. With ``limit``,
+        reading stops once that many rows are known to precede everything in
+        the remaining segments.
+        """
+        start, end = _micros(start_date), _micros(end_date)
+        if after is not None:
+            after_timestamp, after_id = _micros(after[0]), after[1]
+            start = max(start, after_timestamp)
+
+        found, latest = 0, None
+        for segment in self.segments():
+            if segment.max_timestamp < start or segment.min_timestamp > end:
+                continue
+            if item_id and item_id not in segment.item_ids:
+                continue
+            if from_container and from_container not in segment.from_containers:
+                continue
+            if limit is not None and found >= limit and segment.min_timestamp > latest:
+                break
+
+            with np.load(segment.path) as data:
+                timestamps = data["timestamp"]
+                mask = (timestamps >= start) & (timestamps <= end)
+                if after is not None:
+                    mask &= (timestamps > after_timestamp) | (data["id"] > after_id)
+                filters = (
+                    ("item_id", item_id), ("user_id", user_id),
+                    ("action_type", action_type), ("from_container", from_container)
+                )
+                for column, value in filters:
+                    if value:
+                        mask &= data[column] == value
+                selected = np.flatnonzero(mask)
+                if not len(selected):
+                    continue
+                columns = {column: data[column][selected] for column in _COLUMNS}
+
+            found += len(selected)
+            segment_latest = int(columns["timestamp"].max())
+            latest = segment_latest if latest is None else max(latest, segment_latest)
+            yield [
+                ArchivedLog(
+                    int(columns["id"][i]),
+                    _EPOCH + timedelta(microseconds=int(columns["timestamp"][i])),
+                    str(columns["user_id"][i]),
+                    str(columns["action_type"][i]),
+                    str(columns["item_id"][i]),
+                    json.loads(columns["details"][i])
+                )
+                for i in range(len(selected))
+            ]
+
+    def segments(self) -> List[Segment]:
+        """Footers of every segment, reloaded when the directory changes"""
+        try:
+            stamp = self.directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if stamp != self._stamp:
+                self._segments = sorted(
+                    (self._read_footer(path) for path in self.directory.glob("logs-*.npz")),
+                    key=lambda segment: (segment.min_timestamp, segment.path.name)
+                )
+                self._stamp = stamp
+            return self._segments
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self.segments()
+        return {
+            "segments": len(segments),
+            "bytes": sum(segment.path.stat().st_size for segment in segments if segment.path.exists()),
+            "logsArchived": self.logs_archived
+        }
+
+    def _write_segment(self, day: datetime, rows: List[Any]) -> Path:
+        columns = {
+            "id": np.array([row.id for row in rows], dtype=np.int64),
+            "timestamp": np.array([_micros(row.timestamp) for row in rows], dtype=np.int64),
+            "user_id": np.array([row.user_id for row in rows], dtype=str),
+            "action_type": np.array([row.action_type for row in rows], dtype=str),
+            "item_id": np.array([row.item_id for row in rows], dtype=str),
+            "details": np.array([json.dumps(unpack_details(row)) for row in rows], dtype=str),
+            # Empty when the log has no source container
+            "from_container": np.array([row.from_container or "" for row in rows], dtype=str)
+        }
+        footer = {
+            "footer_min_timestamp": columns["timestamp"].min(),
+            "footer_max_timestamp": columns["timestamp"].max(),
+            "footer_item_ids": np.unique(columns["item_id"]),
+            "footer_from_containers": np.unique(columns["from_container"])
+        }
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Ids can be reused once archived rows are deleted, so a random suffix keeps names unique
+        path = self.directory / f"logs-{day:%Y%m%d}-{rows[0].id}-{rows[-1].id}-{uuid.uuid4().hex[:8]}.npz"
+        partial = path.with_suffix(".partial")
+        with open(partial, "wb") as file:
+            np.savez_compressed(file, **columns, **footer)
+        os.replace(partial, path)
+        return path
+
+    @staticmethod
+    def _read_footer(path: Path) -> Segment:
+        # Members of an .npz are read lazily, so only the footer is decompressed
+        with np.load(path) as data:
+            return Segment(
+                path,
+                int(data["footer_min_timestamp"]),
+                int(data["footer_max_timestamp"]),
+                frozenset(data["footer_item_ids"].tolist()),
+                frozenset(data["footer_from_containers"].tolist()) if "footer_from_containers" in data else frozenset()
+            )
+
+log_archive = LogArchive()
+metrics.register("logArchive", log_archive.stats)
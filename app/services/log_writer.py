@@ -0,0 +1,212 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from ..models import Log
+from ..utils.database import writer_engine
+from ..utils.metrics import metrics
+from .analytics import record_rollups
+
+logger = logging.getLogger(__name__)
+
+# Write-behind tuning, overridable through the environment
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+LOG_MAX_QUEUE_SIZE = int(os.getenv("LOG_MAX_QUEUE_SIZE", "5000"))
+
+
+class LogWriter:
+    """Buffered writer that bulk-inserts audit log rows.
+
+    Rows are queued in-process and drained by a background task on the
+    application's event loop, either every ``flush_interval_ms`` or as soon as
+    ``batch_size`` rows are waiting. The queue is bounded: once it holds
+    ``max_queue_size`` rows the producer drains it inline before returning,
+    so a slow database pushes back on the callers instead of growing memory.
+
+    Batches are written through ``writer_engine`` of the caller's bind, on a
+    connection of their own. While another connection holds the database's
+    write lock the rows stay queued and are retried on the next drain.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+        max_queue_size: int = LOG_MAX_QUEUE_SIZE
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.max_queue_size = max(self.batch_size, max_queue_size)
+
+        self._queue: Deque[Tuple[Engine, Dict]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Producers skip the inline drain until then, after the write lock was busy
+        self._retry_at = 0.0
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_written = 0
+        self.batches_deferred = 0
+        self.rollup_failures = 0
+
+        atexit.register(self.flush)
+
+    def enqueue(self, bind: Engine, row: Dict) -> None:
+        """Queue a log row for the database behind ``bind``"""
+        with self._lock:
+            self._queue.append((bind, row))
+            pending = len(self._queue)
+
+        if pending >= self.max_queue_size and time.monotonic() >= self._retry_at:
+            # Backpressure: the producer pays for the drain
+            self.flush()
+        elif pending >= self.batch_size:
+            self._notify()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending(),
+            "rowsWritten": self.rows_written,
+            "rowsDropped": self.rows_dropped,
+            "batchesWritten": self.batches_written,
+            "batchesDeferred": self.batches_deferred,
+            "rollupFailures": self.rollup_failures
+        }
+
+    def flush(self) -> int:
+        """Write every queued row and return how many were inserted"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        break
+                    count = min(self.batch_size, len(self._queue))
+                    batch = [self._queue.popleft() for _ in range(count)]
+                batch_written, deferred = self._write_batch(batch)
+                written += batch_written
+                if deferred:
+                    with self._lock:
+                        self._queue.extendleft(reversed(deferred))
+                    self._retry_at = time.monotonic() + self.flush_interval
+                    break
+        return written
+
+    def start(self) -> None:
+        """Start the background drain task on the running event loop"""
+        if self._task and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._wakeup = None
+        self._loop = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Off the event loop: the writer may wait on the database's write lock
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Background log flush failed: {str(e)}")
+
+    def _notify(self) -> None:
+        if not self._loop or not self._wakeup:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _write_batch(self, batch: List[Tuple[Engine, Dict]]) -> Tuple[int, List[Tuple[Engine, Dict]]]:
+        """Insert a batch; returns the rows written and those to retry later"""
+        rows_by_bind: Dict[Engine, List[Dict]] = {}
+        for bind, row in batch:
+            rows_by_bind.setdefault(bind, []).append(row)
+
+        written = 0
+        deferred: List[Tuple[Engine, Dict]] = []
+        for bind, rows in rows_by_bind.items():
+            try:
+                with writer_engine(bind).begin() as conn:
+                    conn.execute(insert(Log), rows)
+                inserted = rows
+                self.batches_written += 1
+            except Exception as e:
+                if isinstance(e, OperationalError) and "locked" in str(e):
+                    logger.warning(f"Database busy, deferring {len(rows)} log rows: {str(e)}")
+                    deferred.extend((bind, row) for row in rows)
+                    self.batches_deferred += 1
+                    continue
+                logger.error(f"Bulk log insert of {len(rows)} rows failed, retrying row by row: {str(e)}")
+                inserted = self._write_rows_individually(bind, rows)
+            written += len(inserted)
+            self._update_rollups(bind, inserted)
+
+        self.rows_written += written
+        return written, deferred
+
+    def _write_rows_individually(self, bind: Engine, rows: List[Dict]) -> List[Dict]:
+        written = []
+        for row in rows:
+            try:
+                with writer_engine(bind).begin() as conn:
+                    conn.execute(insert(Log), [row])
+                written.append(row)
+            except Exception as e:
+                self.rows_dropped += 1
+                logger.error(f"Dropping log row for item {row.get('item_id')}: {str(e)}")
+        return written
+
+    def _update_rollups(self, bind: Engine, rows: List[Dict]) -> None:
+        # A transaction of its own, after the logs committed, so a failure here never costs a log row
+        if not rows:
+            return
+        try:
+            with writer_engine(bind).begin() as conn:
+                record_rollups(conn, rows)
+        except Exception as e:
+            self.rollup_failures += 1
+            logger.error(f"Activity rollups missed {len(rows)} log rows: {str(e)}")
+
+
+log_writer = LogWriter()
+metrics.register("logWriter", log_writer.stats)
@@ -1,34 +1,156 @@
-from typing import List, Optional, Dict
+import base64
+import csv
+import io
+import json
+import os
+import zlib
+from typing import Any, Iterator, List, Optional, Dict, Tuple
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import Select, insert, or_, select
 from ..models import Log
 from ..schemas import LogResponse, LogEntry
+from ..utils.error_handling import InventoryError
+from ..utils.log_details import DETAIL_COLUMNS, pack_details, unpack_details
+from .analytics import record_rollups
+from .log_archive import LogArchive, log_archive
+from .log_writer import LogWriter, log_writer
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Actions that are written synchronously instead of through the write-behind buffer
+DURABLE_ACTIONS = {"disposal"}
+# Logs returned per page of get_logs
+LOG_PAGE_SIZE = int(os.getenv("LOG_PAGE_SIZE", "500"))
+# Rows fetched from the server-side cursor per chunk of a log export
+LOG_EXPORT_BATCH = int(os.getenv("LOG_EXPORT_BATCH", "1000"))
+
+LOG_EXPORT_FORMATS = ("ndjson", "csv")
+_CSV_FIELDS = ("timestamp", "userId", "actionType", "itemId", "details")
+
+_LOG_COLUMNS = (
+    Log.id, Log.timestamp, Log.user_id, Log.action_type, Log.item_id, Log.details, Log.promoted,
+    *(getattr(Log, column) for column in DETAIL_COLUMNS)
+)
+
+def _log_record(log: Any) -> Dict[str, Any]:
+    return {
+        "timestamp": log.timestamp.isoformat(),
+        "userId": log.user_id,
+        "actionType": log.action_type,
+        "itemId": log.item_id,
+        "details": unpack_details(log)
+    }
+
+def encode_log_cursor(timestamp: datetime, log_id: int) -> str:
+    """Opaque cursor pointing just past the log row ``(timestamp, log_id)``"""
+    payload = json.dumps([timestamp.isoformat(), log_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+def decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, TypeError) as e:
+        raise InventoryError(f"Invalid log cursor: {cursor}") from e
+
+def _record_rollups(db: Session, rows: List[Dict]) -> None:
+    """Count rows into the rollups in a savepoint, so a failure keeps the log rows"""
+    try:
+        with db.begin_nested():
+            record_rollups(db, rows)
+    except Exception as e:
+        logger.error(f"Activity rollups missed {len(rows)} log rows: {str(e)}")
 
 class LoggingService:
+    def __init__(self, writer: LogWriter = None, archive: LogArchive = None):
+        self.writer = writer or log_writer
+        self.archive = archive or log_archive
+
     def add_log(
         self,
         db: Session,
         user_id: str,
         action_type: str,
         item_id: str,
-        details: Dict = None
+        details: Dict = None,
+        durable: Optional[bool] = None
     ) -> bool:
+        """Record a log row.
+
+        Rows are buffered by the shared ``LogWriter`` and bulk-inserted in the
+        background. Disposal events (or any call with ``durable=True``) are
+        written and committed immediately through the caller's session.
+        """
+        if item_id is None:
+            return False
+
+        if durable is None:
+            durable = action_type in DURABLE_ACTIONS
+
+        row = {
+            "timestamp": datetime.now(timezone.utc),
+            "user_id": user_id,
+            "action_type": action_type,
+            "item_id": item_id,  # This now references Item.itemId
+            **pack_details(details)
+        }
+        if not durable:
+            self.writer.enqueue(db.get_bind(), row)
+            return True
+
         try:
-            log_entry = Log(
-                timestamp=datetime.now(timezone.utc),
-                user_id=user_id,
-                action_type=action_type,
-                item_id=item_id,  # This now references Item.itemId
-                details=details
-            )
-            db.add(log_entry)
+            db.add(Log(**row))
+            _record_rollups(db, [row])
             db.commit()
             return True
         except Exception as e:
             db.rollback()
             return False
 
+    def add_logs(
+        self,
+        db: Session,
+        entries: List[Dict],
+        durable: bool = False
+    ) -> int:
+        """Record many log rows at once.
+
+        Each entry holds ``user_id``, ``action_type``, ``item_id`` and optional
+        ``details``, whose hot fields are stored in typed columns. Durable
+        rows are inserted with a single executemany in the caller's
+        transaction, so they commit together with the change they describe;
+        other rows go through the write-behind buffer.
+        """
+        timestamp = datetime.now(timezone.utc)
+        rows = [
+            {
+                "timestamp": entry.get("timestamp", timestamp),
+                "user_id": entry["user_id"],
+                "action_type": entry["action_type"],
+                "item_id": entry["item_id"],
+                **pack_details(entry.get("details"))
+            }
+            for entry in entries
+            if entry.get("item_id") is not None
+        ]
+        if not rows:
+            return 0
+
+        if durable:
+            db.execute(insert(Log), rows)
+            _record_rollups(db, rows)
+        else:
+            bind = db.get_bind()
+            for row in rows:
+                self.writer.enqueue(bind, row)
+        return len(rows)
+
+    def flush(self) -> int:
+        """Write out any buffered log rows"""
+        return self.writer.flush()
+
     def get_logs(
         self,
         db: Session,
@@ -36,45 +158,145 @@ class LoggingService:
         end_date: datetime,
         item_id: str = None,
         user_id: str = None,
-        action_type: str = None
-    ) -> Dict[str, List[Dict]]:
+        action_type: str = None,
+        cursor: Optional[str] = None,
+        limit: int = LOG_PAGE_SIZE,
+        from_container: str = None
+    ) -> Dict[str, Any]:
+        """One page of logs in the date range, ordered by ``(timestamp, id)``.
+
+        Pages are read with a keyset after ``cursor``; the response carries
+        the ``nextCursor`` of the following page, or None on the last one.
+        Rows still in the database are merged with those already archived.
+        """
+        # Make buffered rows visible to this query
+        self.flush()
+
+        stmt = self._log_query(start_date, end_date, item_id, user_id, action_type, from_container)
+        after = decode_log_cursor(cursor) if cursor else None
+        if after:
+            after_timestamp, after_id = after
+            stmt = stmt.where(
+                Log.timestamp >= after_timestamp,
+                or_(Log.timestamp > after_timestamp, Log.id > after_id)
+            )
+
+        rows = db.execute(stmt.order_by(Log.timestamp, Log.id).limit(limit + 1)).all()
+        archived = [
+            log
+            for batch in self.archive.query(
+                start_date, end_date, item_id, user_id, action_type, from_container, after=after, limit=limit + 1
+            )
+            for log in batch
+        ]
+        if archived:
+            rows = sorted(archived + rows, key=lambda log: (log.timestamp, log.id))[:limit + 1]
+        page = rows[:limit]
+        next_cursor = encode_log_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None
+
+        return {
+            "logs": [_log_record(log) for log in page],
+            "nextCursor": next_cursor
+        }
+
+    def iter_logs(
+        self,
+        db: Session,
+        start_date: datetime,
+        end_date: datetime,
+        item_id: str = None,
+        user_id: str = None,
+        action_type: str = None,
+        from_container: str = None,
+        batch_size: int = LOG_EXPORT_BATCH
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield every matching log in batches: archived segments first, then the
+        database rows read through a server-side cursor"""
+        for logs in self.archive.query(start_date, end_date, item_id, user_id, action_type, from_container):
+            yield [_log_record(log) for log in logs]
+
+        self.flush()
+        result = db.execute(
+            self._log_query(start_date, end_date, item_id, user_id, action_type, from_container)
+            .order_by(Log.timestamp, Log.id)
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for rows in result.partitions():
+            yield [_log_record(log) for log in rows]
+
+    def export_logs(
+        self,
+        db: Session,
+        start_date: datetime,
+        end_date: datetime,
+        item_id: str = None,
+        user_id: str = None,
+        action_type: str = None,
+        fmt: str = "ndjson",
+        compress: bool = False,
+        from_container: str = None
+    ) -> Iterator[bytes]:
+        """Serialize matching logs as NDJSON or CSV one batch at a time.
+
+        With ``compress`` the output is a gzip stream. Each batch is sync-flushed
+        so clients receive data as it is read rather than when the export ends.
+        """
+        if fmt not in LOG_EXPORT_FORMATS:
+            raise InventoryError(f"Unsupported export format: {fmt}")
+
+        compressor = zlib.compressobj(wbits=31) if compress else None
+
+        def emit(text: str, final: bool = False) -> bytes:
+            data = text.encode()
+            if compressor is None:
+                return data
+            return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=_CSV_FIELDS, lineterminator="\n")
+            writer.writeheader()
+            yield emit(buffer.getvalue())
+
+        for batch in self.iter_logs(db, start_date, end_date, item_id, user_id, action_type, from_container):
+            if fmt == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows({**record, "details": json.dumps(record["details"])} for record in batch)
+                yield emit(buffer.getvalue())
+            else:
+                yield emit("".join(json.dumps(record) + "\n" for record in batch))
+
+        if compressor is not None:
+            yield emit("", final=True)
+
+    @staticmethod
+    def _log_query(
+        start_date: datetime,
+        end_date: datetime,
+        item_id: Optional[str],
+        user_id: Optional[str],
+        action_type: Optional[str],
+        from_container: Optional[str] = None
+    ) -> Select:
         # Ensure dates are timezone-aware
         if start_date.tzinfo is None:
             start_date = start_date.replace(tzinfo=timezone.utc)
         if end_date.tzinfo is None:
             end_date = end_date.replace(tzinfo=timezone.utc)
-            
-        query = db.query(Log)
-        
-        # Apply date range filter
-        query = query.filter(and_(
+
+        stmt = select(*_LOG_COLUMNS).where(
             Log.timestamp >= start_date,
             Log.timestamp <= end_date
-        ))
-        
+        )
+
         # Apply optional filters
         if item_id:
-            query = query.filter(Log.item_id == item_id)
+            stmt = stmt.where(Log.item_id == item_id)
         if user_id:
-            query = query.filter(Log.user_id == user_id)
+            stmt = stmt.where(Log.user_id == user_id)
         if action_type:
-            query = query.filter(Log.action_type == action_type)
-            
-        # Order by timestamp
-        query = query.order_by(Log.timestamp)
-        
-        # Convert to response format
-        logs = query.all()
-        
-        return {
-            "logs": [
-                {
-                    "timestamp": log.timestamp.isoformat(),
-                    "userId": log.user_id,
-                    "actionType": log.action_type,
-                    "itemId": log.item_id,
-                    "details": log.details or {}
-                }
-                for log in logs
-            ]
-        }
\ No newline at end of file
+            stmt = stmt.where(Log.action_type == action_type)
+        if from_container:
+            stmt = stmt.where(Log.from_container == from_container)
+        return stmt
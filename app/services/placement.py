@@ -1,13 +1,71 @@
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Sequence
 from datetime import datetime
+from itertools import permutations
 import logging
+import math
+import time
 import traceback
+import numpy as np
 from ..models import Item, Container
 from ..schemas import Position, PlacementStep, ItemPlacement, Coordinates
 from ..utils.error_handling import InventoryError
 
 logger = logging.getLogger(__name__)
 
+class _BoxGrid:
+    """Placed boxes bucketed into cubic cells at least as large as any box.
+
+    A box then spans at most two cells per axis, so finding the boxes that
+    may overlap a new one only looks at a handful of cells. Lookups work on
+    plain floats, which is faster than NumPy for the few boxes involved.
+    """
+
+    def __init__(self, cell: float, capacity: int):
+        self.cell = max(float(cell), 1e-9)
+        self.start = np.empty((capacity, 3))
+        self.end = np.empty((capacity, 3))
+        self.boxes: List[Tuple[float, ...]] = []
+        self.cells: Dict[Tuple[int, int, int], List[int]] = {}
+
+    def _cells(self, start: Sequence[float], end: Sequence[float]) -> List[Tuple[int, int, int]]:
+        cell = self.cell
+        return [
+            (i, j, k)
+            for i in range(math.floor(start[0] / cell), math.floor((end[0] - 1e-9) / cell) + 1)
+            for j in range(math.floor(start[1] / cell), math.floor((end[1] - 1e-9) / cell) + 1)
+            for k in range(math.floor(start[2] / cell), math.floor((end[2] - 1e-9) / cell) + 1)
+        ]
+
+    def add(self, start: np.ndarray, end: np.ndarray) -> None:
+        index = len(self.boxes)
+        self.start[index] = start
+        self.end[index] = end
+        box = (*start.tolist(), *end.tolist())
+        self.boxes.append(box)
+        for cell in self._cells(box[:3], box[3:]):
+            self.cells.setdefault(cell, []).append(index)
+
+    def overlaps(self, index: int, start: Sequence[float], size: Sequence[float]) -> bool:
+        bx0, by0, bz0, bx1, by1, bz1 = self.boxes[index]
+        return (
+            start[0] < bx1 - 1e-9 and start[0] + size[0] > bx0 + 1e-9 and
+            start[1] < by1 - 1e-9 and start[1] + size[1] > by0 + 1e-9 and
+            start[2] < bz1 - 1e-9 and start[2] + size[2] > bz0 + 1e-9
+        )
+
+    def blocker(self, start: Sequence[float], size: Sequence[float]) -> int:
+        """A placed box overlapping the box of ``size`` at ``start``, or -1"""
+        x0, y0, z0 = start
+        x1, y1, z1 = x0 + size[0], y0 + size[1], z0 + size[2]
+        boxes = self.boxes
+        for cell in self._cells(start, (x1, y1, z1)):
+            for index in self.cells.get(cell, ()):
+                bx0, by0, bz0, bx1, by1, bz1 = boxes[index]
+                if (x0 < bx1 - 1e-9 and x1 > bx0 + 1e-9 and y0 < by1 - 1e-9 and y1 > by0 + 1e-9
+                        and z0 < bz1 - 1e-9 and z1 > bz0 + 1e-9):
+                    return index
+        return -1
+
 class PlacementService:
     def __init__(self):
         self.container_states: Dict[str, List[Dict]] = {}
@@ -53,6 +111,128 @@ class PlacementService:
             logger.error(f"Error in placement optimization: {traceback.format_exc()}")
             raise InventoryError(f"Placement optimization failed: {str(e)}")
 
+    def pack_container(
+        self,
+        items: List[Any],
+        container: Any,
+        deadline: Optional[float] = None
+    ) -> Tuple[List[ItemPlacement], List[str]]:
+        """Pack items into one empty container, in the order given.
+
+        Uses extreme-point first fit: each item, in any rotation, goes to the
+        lowest, then frontmost, then leftmost candidate corner where it stays
+        inside the container without overlapping earlier items. Corners with no
+        room left for the smallest remaining item are dropped, and fit tests
+        only look at the placed boxes in the grid cells a corner's box spans.
+        Packing stops at ``deadline`` (a ``time.perf_counter()`` value).
+        Returns the placements and the ids of items that did not fit or were
+        not tried.
+        """
+        bounds = np.array([container.width, container.depth, container.height], dtype=float)
+        sizes = np.array([[item.width, item.depth, item.height] for item in items], dtype=float).reshape(-1, 3)
+        # Smallest side among each item and those packed after it
+        min_side = np.minimum.accumulate(sizes.min(axis=1)[::-1])[::-1]
+        grid = _BoxGrid(sizes.max() if len(items) else 1.0, len(items))
+        points = np.zeros((1, 3))
+        point_keys = {(0.0, 0.0, 0.0)}
+        # Per corner, a placed box that blocked it when last tried, or -1
+        witness = np.full(1, -1)
+        placements = []
+        unplaced = []
+
+        for index, item in enumerate(items):
+            if deadline is not None and time.perf_counter() > deadline:
+                unplaced.extend(other.itemId for other in items[index:])
+                break
+
+            rotations = sorted({tuple(dims) for dims in permutations(sizes[index].tolist())})
+            found = self._first_free_corner(points, witness, rotations, bounds, grid)
+            if found is None:
+                unplaced.append(item.itemId)
+                continue
+
+            start = points[found[0]].copy()
+            end = start + found[1]
+            grid.add(start, end)
+
+            # Only the new box can have taken the room left around the existing corners
+            next_side = min_side[index + 1] if index + 1 < len(items) else np.inf
+            keep = ~(
+                (points < end - 1e-9) & (points + next_side > start + 1e-9)
+            ).all(axis=1) & ((points + next_side) <= bounds + 1e-9).all(axis=1)
+            point_keys.difference_update(map(tuple, points[~keep].tolist()))
+            points, witness = points[keep], witness[keep]
+
+            # New corners next to, behind and on top of the item
+            new_points = []
+            for corner in ([end[0], start[1], start[2]], [start[0], end[1], start[2]], [start[0], start[1], end[2]]):
+                key = tuple(corner)
+                if key in point_keys or not all(c + next_side <= b + 1e-9 for c, b in zip(corner, bounds)):
+                    continue
+                if grid.blocker(corner, (next_side,) * 3) < 0:
+                    point_keys.add(key)
+                    new_points.append(corner)
+            if new_points:
+                points = np.vstack([points, new_points])
+                witness = np.concatenate([witness, np.full(len(new_points), -1)])
+
+            placements.append(ItemPlacement(
+                itemId=item.itemId,
+                containerId=container.id,
+                position=Position(
+                    start_coordinates=Coordinates(width=start[0], depth=start[1], height=start[2]),
+                    end_coordinates=Coordinates(width=end[0], depth=end[1], height=end[2])
+                )
+            ))
+
+        return placements, unplaced
+
+    def _first_free_corner(
+        self,
+        points: np.ndarray,
+        witness: np.ndarray,
+        rotations: List[Tuple[float, float, float]],
+        bounds: np.ndarray,
+        grid: "_BoxGrid"
+    ) -> Optional[Tuple[int, np.ndarray]]:
+        """Lowest/frontmost/leftmost corner where some rotation fits, and that rotation.
+
+        Returns the corner's index in ``points`` and the box size. A corner is
+        first tested against its ``witness`` box alone, and ``witness`` records
+        the box that blocks each corner found not to fit.
+        """
+        if not len(points):
+            return None
+        known = witness >= 0
+        blockers = np.where(known, witness, 0)
+        # A witness still blocks a rotation when the box reaches past this room on every axis
+        room = grid.start[blockers] - points + 1e-9
+        known &= (points < grid.end[blockers] - 1e-9).all(axis=1)
+        space = bounds + 1e-9 - points
+        usable = np.empty((len(points), len(rotations)), dtype=bool)
+        for r, (width, depth, height) in enumerate(rotations):
+            inside = (space[:, 0] >= width) & (space[:, 1] >= depth) & (space[:, 2] >= height)
+            blocked = known & (room[:, 0] < width) & (room[:, 1] < depth) & (room[:, 2] < height)
+            usable[:, r] = inside & ~blocked
+
+        candidates = np.flatnonzero(usable.any(axis=1))
+        if not len(candidates):
+            return None
+        corners = points[candidates]
+        candidates = candidates[np.lexsort((corners[:, 0], corners[:, 1], corners[:, 2]))]
+        for offset in range(0, len(candidates), 32):
+            block = candidates[offset:offset + 32]
+            for candidate, corner, fits in zip(block.tolist(), points[block].tolist(), usable[block].tolist()):
+                blocker = int(witness[candidate])
+                for rotation, fit in zip(rotations, fits):
+                    if not fit or (blocker >= 0 and grid.overlaps(blocker, corner, rotation)):
+                        continue
+                    blocker = grid.blocker(corner, rotation)
+                    if blocker < 0:
+                        return candidate, np.array(rotation)
+                    witness[candidate] = blocker
+        return None
+
     def _prepare_items(self, items: List[Any]) -> List[Item]:
         """Convert and sort items by priority, expiry date, and volume"""
         item_models = []
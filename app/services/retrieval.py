@@ -0,0 +1,354 @@
+import os
+from typing import List, Dict, Optional, Tuple, Any, Set
+from sqlalchemy.orm import Session
+from sqlalchemy import select, or_
+import numpy as np
+from ..models import Item
+from ..schemas import RetrievalSessionRequest, RetrievalSessionResponse, SessionStep
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of partial target assignments explored before settling for the best plan found
+RETRIEVAL_SEARCH_BUDGET = int(os.getenv("RETRIEVAL_SEARCH_BUDGET", "20000"))
+
+_AXES = ("width", "depth", "height")
+
+_LAYOUT_COLUMNS = (
+    Item.itemId,
+    Item.name,
+    Item.mass,
+    Item.priority,
+    Item.position,
+    Item.container_id,
+    Item.is_waste
+)
+
+def blocking_matrix(positions: List[Dict]) -> np.ndarray:
+    """Compute which items block which inside one container.
+
+    ``blocks[i, j]`` is True when item ``j`` sits in front of item ``i`` (smaller
+    start depth) and overlaps its width/height face, so ``j`` has to be moved
+    before ``i`` can be pulled out.
+    """
+    if not positions:
+        return np.zeros((0, 0), dtype=bool)
+    start = np.array([[float(p["startCoordinates"][axis]) for axis in _AXES] for p in positions])
+    end = np.array([[float(p["endCoordinates"][axis]) for axis in _AXES] for p in positions])
+
+    in_front = start[None, :, 1] < start[:, None, 1]
+    width_overlap = (start[None, :, 0] < end[:, None, 0]) & (end[None, :, 0] > start[:, None, 0])
+    height_overlap = (start[None, :, 2] < end[:, None, 2]) & (end[None, :, 2] > start[:, None, 2])
+    return in_front & width_overlap & height_overlap
+
+class ContainerLayout:
+    """Positions and blocking relations of the items stored in one container"""
+
+    def __init__(self, container_id: str, rows: List[Any]):
+        self.container_id = container_id
+        self.rows = [row for row in rows if row.position]
+        self.index = {row.itemId: i for i, row in enumerate(self.rows)}
+        self.blocks = blocking_matrix([row.position for row in self.rows])
+        self.depth = np.array([float(row.position["startCoordinates"]["depth"]) for row in self.rows])
+        self._closures: Dict[str, Set[str]] = {}
+
+    def closure(self, item_id: str) -> Set[str]:
+        """Every item that has to leave the container before ``item_id`` can"""
+        if item_id not in self._closures:
+            self._closures[item_id] = self.closure_of([item_id]) - {item_id}
+        return self._closures[item_id]
+
+    def closure_of(self, item_ids: List[str]) -> Set[str]:
+        reach = np.zeros(len(self.rows), dtype=bool)
+        for item_id in item_ids:
+            if item_id in self.index:
+                reach[self.index[item_id]] = True
+        frontier = reach.copy()
+        while frontier.any():
+            found = self.blocks[frontier].any(axis=0) & ~reach
+            reach |= found
+            frontier = found
+        return {self.rows[i].itemId for i in np.flatnonzero(reach)}
+
+    def removal_order(self, item_ids: Set[str]) -> List[Any]:
+        """Order items front to back so every blocker leaves before what it blocks"""
+        rows = [self.rows[self.index[item_id]] for item_id in item_ids if item_id in self.index]
+        return sorted(rows, key=lambda row: (self.depth[self.index[row.itemId]], row.itemId))
+
+class RetrievalSessionService:
+    """Plans the retrieval of several items as one session.
+
+    Each container is visited once: the union of blockers for all targets in
+    the container is removed front to back, every target is retrieved, and
+    the blockers are then placed back in reverse order. Targets given by name
+    may be satisfied by any active item with that name; the planner picks the
+    combination that moves the least mass, exploring at most ``search_budget``
+    partial assignments before returning the best plan found.
+    """
+
+    def plan_session(
+        self,
+        db: Session,
+        request: RetrievalSessionRequest
+    ) -> RetrievalSessionResponse:
+        budget = request.search_budget or RETRIEVAL_SEARCH_BUDGET
+        candidates, unresolved = self._resolve_targets(db, request)
+        target_rows = [row for rows in candidates for row in rows]
+        layouts = self.load_layouts(db, {
+            row.container_id for row in target_rows if row.container_id and row.position
+        }, include=target_rows)
+
+        choice, budget_exhausted = self._choose_candidates(candidates, layouts, budget)
+        for rows, row in zip(candidates, choice):
+            if row is None:
+                # More targets asked for this name than there are items
+                unresolved.append({"itemId": None, "itemName": rows[0].name})
+        choice = [row for row in choice if row is not None]
+        steps, container_order, moved_mass, blockers_moved = self._build_steps(choice, layouts)
+
+        return RetrievalSessionResponse(
+            success=True,
+            steps=steps,
+            containerOrder=container_order,
+            retrievedItems=[row.itemId for row in choice],
+            unresolvedTargets=unresolved,
+            movedMass=round(moved_mass, 3),
+            blockersMoved=blockers_moved,
+            budgetExhausted=budget_exhausted
+        )
+
+    def load_layouts(
+        self,
+        db: Session,
+        container_ids: Set[str],
+        include: List[Any] = ()
+    ) -> Dict[str, ContainerLayout]:
+        """Load the active contents of several containers in one query.
+
+        Rows passed in ``include`` (typically waste targets, which are not
+        active) are added to their container's layout as well.
+        """
+        if not container_ids:
+            return {}
+
+        rows = db.execute(
+            select(*_LAYOUT_COLUMNS)
+            .where(Item.container_id.in_(container_ids), Item.is_waste == False)
+        ).all()
+
+        rows_by_container: Dict[str, List[Any]] = {container_id: [] for container_id in container_ids}
+        seen = set()
+        for row in list(rows) + list(include):
+            if row.container_id in rows_by_container and row.itemId not in seen:
+                seen.add(row.itemId)
+                rows_by_container[row.container_id].append(row)
+        return {
+            container_id: ContainerLayout(container_id, container_rows)
+            for container_id, container_rows in rows_by_container.items()
+        }
+
+    def plan_container(
+        self,
+        layout: ContainerLayout,
+        target_ids: List[str]
+    ) -> Tuple[List[Any], List[Any]]:
+        """Return the front-to-back pass over a container and the blockers to restore.
+
+        The pass lists every blocker to remove and every target to retrieve in
+        a valid order; the blockers are returned separately so callers can put
+        them back in reverse order once all targets are out.
+        """
+        targets = set(target_ids)
+        involved = layout.closure_of(list(targets)) | (targets & set(layout.index))
+        sequence = layout.removal_order(involved)
+        blockers = [row for row in sequence if row.itemId not in targets]
+        return sequence, blockers
+
+    def _resolve_targets(
+        self,
+        db: Session,
+        request: RetrievalSessionRequest
+    ) -> Tuple[List[List[Any]], List[Dict]]:
+        item_ids = {target.item_id for target in request.targets if target.item_id}
+        names = {target.item_name for target in request.targets if not target.item_id}
+
+        conditions = []
+        if item_ids:
+            conditions.append(Item.itemId.in_(item_ids))
+        if names:
+            conditions.append(Item.name.in_(names) & (Item.is_waste == False))
+
+        rows = db.execute(select(*_LAYOUT_COLUMNS).where(or_(*conditions))).all()
+        by_id = {row.itemId: row for row in rows}
+        by_name: Dict[str, List[Any]] = {}
+        for row in rows:
+            if row.name in names and not row.is_waste:
+                by_name.setdefault(row.name, []).append(row)
+
+        candidates = []
+        unresolved = []
+        seen_ids = set()
+        for target in request.targets:
+            if target.item_id:
+                # Asking for the same item twice retrieves it once
+                if target.item_id in seen_ids:
+                    continue
+                seen_ids.add(target.item_id)
+                options = [by_id[target.item_id]] if target.item_id in by_id else []
+            else:
+                options = by_name.get(target.item_name, [])
+            if options:
+                candidates.append(options)
+            else:
+                unresolved.append({"itemId": target.item_id, "itemName": target.item_name})
+        return candidates, unresolved
+
+    def _blockers(self, row: Any, layouts: Dict[str, ContainerLayout]) -> Set[str]:
+        layout = layouts.get(row.container_id)
+        if not layout or row.itemId not in layout.index:
+            return set()
+        return layout.closure(row.itemId)
+
+    def _cost(self, chosen: List[Any], layouts: Dict[str, ContainerLayout], masses: Dict[str, float]) -> float:
+        """Mass moved by a plan: targets once, blockers out and back in"""
+        chosen = [row for row in chosen if row is not None]
+        chosen_ids = {row.itemId for row in chosen}
+        blockers = set()
+        for row in chosen:
+            blockers |= self._blockers(row, layouts)
+        blockers -= chosen_ids
+        return sum(masses[i] for i in chosen_ids) + 2 * sum(masses[i] for i in blockers)
+
+    def _choose_candidates(
+        self,
+        candidates: List[List[Any]],
+        layouts: Dict[str, ContainerLayout],
+        budget: int
+    ) -> Tuple[List[Any], bool]:
+        masses: Dict[str, float] = {}
+        for rows in candidates:
+            for row in rows:
+                masses[row.itemId] = float(row.mass)
+        for layout in layouts.values():
+            for row in layout.rows:
+                masses[row.itemId] = float(row.mass)
+
+        # Branch on the most constrained targets first
+        order = sorted(range(len(candidates)), key=lambda i: len(candidates[i]))
+
+        # Greedy incumbent: cheapest marginal candidate per target
+        best: List[Optional[Any]] = [None] * len(candidates)
+        chosen: List[Any] = []
+        for i in order:
+            taken = {row.itemId for row in chosen}
+            options = [row for row in candidates[i] if row.itemId not in taken]
+            if not options:
+                continue
+            pick = min(options, key=lambda row: self._cost(chosen + [row], layouts, masses))
+            chosen.append(pick)
+            best[i] = pick
+        best_cost = self._cost(chosen, layouts, masses)
+
+        expansions = 0
+        exhausted = False
+        assignment: List[Any] = []
+
+        def explore(depth: int, union: Set[str]):
+            nonlocal best, best_cost, expansions, exhausted
+            if exhausted:
+                return
+            expansions += 1
+            if expansions > budget:
+                exhausted = True
+                return
+            if depth == len(order):
+                cost = self._cost(assignment, layouts, masses)
+                if cost < best_cost:
+                    best_cost = cost
+                    for position, row in zip(order, assignment):
+                        best[position] = row
+                return
+
+            # Every item already involved moves at least once, and so does
+            # one candidate of each remaining target
+            bound = sum(masses[i] for i in union) + sum(
+                min(0.0 if row.itemId in union else masses[row.itemId] for row in candidates[i])
+                for i in order[depth:]
+            )
+            if bound >= best_cost:
+                return
+
+            taken = {row.itemId for row in assignment if row is not None}
+            options = sorted(
+                (row for row in candidates[order[depth]] if row.itemId not in taken),
+                key=lambda row: masses[row.itemId] + sum(
+                    masses[i] for i in self._blockers(row, layouts) - union
+                )
+            )
+            if not options:
+                assignment.append(None)
+                explore(depth + 1, union)
+                assignment.pop()
+                return
+            for row in options:
+                assignment.append(row)
+                explore(depth + 1, union | {row.itemId} | self._blockers(row, layouts))
+                assignment.pop()
+
+        if len(candidates) > 0 and any(len(rows) > 1 for rows in candidates):
+            explore(0, set())
+
+        return best, exhausted
+
+    def _build_steps(
+        self,
+        choice: List[Any],
+        layouts: Dict[str, ContainerLayout]
+    ) -> Tuple[List[SessionStep], List[str], float, int]:
+        steps: List[SessionStep] = []
+        container_order: List[str] = []
+        targets_by_container: Dict[Optional[str], List[str]] = {}
+        rows_by_id = {row.itemId: row for row in choice}
+
+        for row in choice:
+            container_id = row.container_id if row.container_id in layouts else None
+            if container_id not in targets_by_container:
+                targets_by_container[container_id] = []
+                if container_id:
+                    container_order.append(container_id)
+            targets_by_container[container_id].append(row.itemId)
+
+        moved_mass = 0.0
+        blockers_moved = 0
+
+        def add_step(action: str, row: Any, container_id: Optional[str]):
+            nonlocal moved_mass
+            steps.append(SessionStep(
+                step=len(steps) + 1,
+                action=action,
+                itemId=row.itemId,
+                itemName=row.name,
+                containerId=container_id,
+                mass=float(row.mass)
+            ))
+            moved_mass += float(row.mass)
+
+        # Items that are not stored anywhere need no preparation
+        for item_id in targets_by_container.pop(None, []):
+            add_step("retrieve", rows_by_id[item_id], rows_by_id[item_id].container_id)
+
+        for container_id in container_order:
+            layout = layouts[container_id]
+            target_ids = targets_by_container[container_id]
+            sequence, blockers = self.plan_container(layout, target_ids)
+
+            for row in sequence:
+                add_step("remove" if row.itemId not in target_ids else "retrieve", row, container_id)
+            for item_id in target_ids:
+                if item_id not in layout.index:
+                    add_step("retrieve", rows_by_id[item_id], container_id)
+            for row in reversed(blockers):
+                add_step("place", row, container_id)
+            blockers_moved += len(blockers)
+
+        return steps, container_order, moved_mass, blockers_moved
@@ -0,0 +1,164 @@
+import os
+import time
+from bisect import bisect_right
+from typing import List, Dict, Tuple, Any, Optional
+import numpy as np
+from .placement import PlacementService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock budget for the manifest search; the best manifest found so far is used when it runs out
+RETURN_PLAN_TIME_BUDGET_MS = int(os.getenv("RETURN_PLAN_TIME_BUDGET_MS", "2000"))
+
+# Rounds of re-selection after items are found not to fit the container geometry
+_MAX_PACKING_ROUNDS = 4
+
+class ReturnManifestOptimizer:
+    """Chooses which waste items go into the undocking container.
+
+    Selection is a two-constraint knapsack (mass against ``maxWeight`` and
+    volume against the container volume) maximising either returned mass or
+    item count. It is solved by depth-first branch and bound over items
+    sorted by value density, pruned with a surrogate-relaxation bound, and
+    stopped after ``time_budget_ms`` with the best manifest found. The
+    chosen items are then packed into the container by the placement engine;
+    items that do not physically fit are excluded and the selection re-run.
+    ``placements`` in the result are in packing order, heaviest first.
+    """
+
+    def __init__(self, placement_service: PlacementService = None):
+        self.placement_service = placement_service or PlacementService()
+
+    def optimize(
+        self,
+        items: List[Any],
+        container: Any,
+        max_weight: float,
+        objective: str = "mass",
+        time_budget_ms: Optional[int] = None
+    ) -> Tuple[List[Any], Dict[str, Any]]:
+        budget = (time_budget_ms or RETURN_PLAN_TIME_BUDGET_MS) / 1000
+        deadline = time.perf_counter() + budget
+        max_volume = container.width * container.depth * container.height
+
+        excluded = set()
+        stats = {
+            "objective": objective, "candidates": len(items), "optimal": True, "nodesExplored": 0, "packingTimedOut": False
+        }
+        selected: List[Any] = []
+        placements = {}
+
+        for _ in range(_MAX_PACKING_ROUNDS):
+            pool = [item for item in items if item.itemId not in excluded]
+            # Half of what is left goes to the search, the rest to packing its result
+            remaining = max(0.0, deadline - time.perf_counter())
+            chosen, optimal, nodes = self.select(pool, max_weight, max_volume, objective, remaining / 2)
+            stats["optimal"] = stats["optimal"] and optimal
+            stats["nodesExplored"] += nodes
+
+            # Heaviest items go in first so they end up at the bottom
+            load_order = sorted(chosen, key=lambda item: (-float(item.mass), item.itemId))
+            packed, unplaced = self.placement_service.pack_container(load_order, container, deadline)
+            placements = {placement.item_id: placement for placement in packed}
+            selected = [item for item in chosen if item.itemId in placements]
+            if not unplaced:
+                break
+            if time.perf_counter() > deadline:
+                # Items skipped at the deadline were never tried, so they are not excluded
+                stats["optimal"] = False
+                stats["packingTimedOut"] = True
+                break
+            excluded.update(unplaced)
+
+        stats["excludedByGeometry"] = sorted(excluded)
+        stats["returnedMass"] = round(sum(float(item.mass) for item in selected), 3)
+        stats["returnedCount"] = len(selected)
+        return selected, {"stats": stats, "placements": placements}
+
+    def select(
+        self,
+        items: List[Any],
+        max_weight: float,
+        max_volume: float,
+        objective: str = "mass",
+        time_budget: float = 2.0
+    ) -> Tuple[List[Any], bool, int]:
+        """Solve the selection knapsack; returns (items, proved optimal, nodes explored)"""
+        if max_weight <= 0 or max_volume <= 0:
+            return [], True, 0
+
+        mass = np.array([float(item.mass) for item in items])
+        volume = np.array([float(item.width * item.depth * item.height) for item in items])
+        feasible = np.flatnonzero((mass <= max_weight) & (volume <= max_volume))
+        if not len(feasible):
+            return [], True, 0
+
+        mass = mass[feasible]
+        volume = volume[feasible]
+        value = mass.copy() if objective == "mass" else np.ones(len(feasible))
+        integral = objective != "mass"
+
+        # Surrogate constraint: any feasible set satisfies w/W + v/V <= 2
+        usage = mass / max_weight + volume / max_volume
+        order = np.argsort(-(value / np.maximum(usage, 1e-12)), kind="stable")
+        mass, volume, value, usage = mass[order], volume[order], value[order], usage[order]
+        count = len(order)
+
+        prefix_usage = np.concatenate([[0.0], np.cumsum(usage)]).tolist()
+        prefix_value = np.concatenate([[0.0], np.cumsum(value)]).tolist()
+        mass_l, volume_l, value_l, usage_l = mass.tolist(), volume.tolist(), value.tolist(), usage.tolist()
+
+        def bound(k: int, weight: float, vol: float, val: float) -> float:
+            capacity = (max_weight - weight) / max_weight + (max_volume - vol) / max_volume
+            j = bisect_right(prefix_usage, prefix_usage[k] + capacity, lo=k) - 1
+            estimate = val + prefix_value[j] - prefix_value[k]
+            if j < count:
+                estimate += (capacity - (prefix_usage[j] - prefix_usage[k])) / usage_l[j] * value_l[j]
+            if objective == "mass":
+                estimate = min(estimate, val + max_weight - weight)
+            return estimate
+
+        # Greedy incumbent in density order
+        best_value, best_chain = 0.0, None
+        weight = vol = 0.0
+        for i in range(count):
+            if weight + mass_l[i] <= max_weight and vol + volume_l[i] <= max_volume:
+                weight += mass_l[i]
+                vol += volume_l[i]
+                best_value += value_l[i]
+                best_chain = (i, best_chain)
+
+        margin = 1 - 1e-9 if integral else 1e-9
+        deadline = time.perf_counter() + time_budget
+        nodes = 0
+        optimal = True
+        # Each frame: (next index, weight, volume, value, chain of taken indices)
+        stack = [(0, 0.0, 0.0, 0.0, None)]
+        while stack:
+            nodes += 1
+            if nodes % 2048 == 0 and time.perf_counter() > deadline:
+                optimal = False
+                break
+
+            k, weight, vol, val, chain = stack.pop()
+            if val > best_value:
+                best_value, best_chain = val, chain
+            if k >= count or bound(k, weight, vol, val) < best_value + margin:
+                continue
+
+            stack.append((k + 1, weight, vol, val, chain))
+            if weight + mass_l[k] <= max_weight and vol + volume_l[k] <= max_volume:
+                stack.append((k + 1, weight + mass_l[k], vol + volume_l[k], val + value_l[k], (k, chain)))
+
+        chosen = []
+        while best_chain is not None:
+            index, best_chain = best_chain
+            chosen.append(items[int(feasible[order[index]])])
+        chosen.reverse()
+
+        logger.info(
+            f"Selected {len(chosen)} of {len(items)} waste items "
+            f"({'optimal' if optimal else 'time budget reached'}, {nodes} nodes)"
+        )
+        return chosen, optimal, nodes
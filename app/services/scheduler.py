@@ -0,0 +1,189 @@
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, sessionmaker
+from ..models import SchedulerLease
+from ..utils.database import engine, writer_engine
+from ..utils.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background waste sweeps; 0 disables the scanner
+WASTE_SCAN_INTERVAL_S = float(os.getenv("WASTE_SCAN_INTERVAL_S", "300"))
+# Random spread applied to every interval, as a fraction of it
+WASTE_SCAN_JITTER = float(os.getenv("WASTE_SCAN_JITTER", "0.1"))
+
+# Seconds between log archival runs; 0 disables archival
+LOG_ARCHIVE_INTERVAL_S = float(os.getenv("LOG_ARCHIVE_INTERVAL_S", "3600"))
+# Identifies this worker process when taking leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Jobs run in a worker thread, on connections of their own
+JobSession = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine(engine))
+
+def acquire_lease(db: Session, name: str, owner: str, ttl_seconds: float) -> bool:
+    """Take or renew a named lease unless another owner holds an unexpired one"""
+    # Stored naive in UTC, like the other timestamps in the database
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    stmt = insert(SchedulerLease).values(name=name, owner=owner, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SchedulerLease.name],
+        set_={"owner": owner, "expires_at": expires_at},
+        where=(SchedulerLease.expires_at < now) | (SchedulerLease.owner == owner)
+    )
+    db.execute(stmt)
+    db.commit()
+    holder = db.execute(select(SchedulerLease.owner).where(SchedulerLease.name == name)).scalar()
+    return holder == owner
+
+def release_lease(db: Session, name: str, owner: str) -> None:
+    db.execute(delete(SchedulerLease).where(SchedulerLease.name == name, SchedulerLease.owner == owner))
+    db.commit()
+
+class PeriodicJob:
+    """A job run every ``interval`` seconds (plus jitter) by at most one worker at a time"""
+
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        func: Callable[[Session], Dict[str, Any]],
+        jitter: float = 0.1
+    ):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.jitter = jitter
+        self.running = threading.Lock()
+        self.last_run: Optional[datetime] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[datetime] = None
+
+    def next_delay(self) -> float:
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "lastRun": self.last_run.isoformat() if self.last_run else None,
+            "nextRun": self.next_run.isoformat() if self.next_run else None,
+            "lastResult": self.last_result,
+            "lastError": self.last_error
+        }
+
+class Scheduler:
+    """Runs periodic maintenance jobs inside the application lifespan.
+
+    Jobs run in a worker thread so a long sweep never stalls the event loop.
+    Within a process a job never overlaps itself; across uvicorn workers a
+    database lease, held until it expires one interval after the run
+    started, makes sure a job runs at most once per interval.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = JobSession, owner: str = WORKER_ID):
+        self.session_factory = session_factory
+        self.owner = owner
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, job: PeriodicJob) -> None:
+        self.jobs[job.name] = job
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        for job in self.jobs.values():
+            if job.interval > 0:
+                self._tasks.append(loop.create_task(self._loop(job)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def run_job(self, job: PeriodicJob) -> Optional[Dict[str, Any]]:
+        """Run a job once if this worker can take it; returns its result or None when skipped"""
+        if not job.running.acquire(blocking=False):
+            metrics.increment(f"{job.name}.skipped")
+            return None
+
+        db = self.session_factory()
+        try:
+            if not acquire_lease(db, job.name, self.owner, job.interval or 60):
+                metrics.increment(f"{job.name}.skipped")
+                return None
+
+            started = time.perf_counter()
+            try:
+                result = job.func(db) or {}
+                job.last_error = None
+            except Exception as e:
+                db.rollback()
+                job.last_error = str(e)
+                metrics.increment(f"{job.name}.failures")
+                logger.error(f"Scheduled job {job.name} failed: {str(e)}")
+                # Let the next worker to wake up retry
+                release_lease(db, job.name, self.owner)
+                return None
+
+            elapsed = time.perf_counter() - started
+            job.last_run = datetime.now(timezone.utc)
+            job.last_result = result
+            metrics.record_timing(job.name, elapsed)
+            metrics.increment(f"{job.name}.runs")
+            for key, value in result.items():
+                if isinstance(value, (int, float)):
+                    metrics.increment(f"{job.name}.{key}", value)
+            return result
+        finally:
+            db.close()
+            job.running.release()
+
+    def status(self) -> Dict[str, Any]:
+        return {name: job.status() for name, job in self.jobs.items()}
+
+    async def _loop(self, job: PeriodicJob) -> None:
+        while True:
+            delay = job.next_delay()
+            job.next_run = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(self.run_job, job)
+            except Exception as e:
+                logger.error(f"Scheduler loop for {job.name} failed: {str(e)}")
+
+def _sweep_waste(db: Session) -> Dict[str, Any]:
+    from .waste import WasteManagementService
+
+    waste_items = WasteManagementService().identify_waste_items(db)
+    if waste_items:
+        logger.info(f"Background sweep flagged {len(waste_items)} waste items")
+    return {"itemsFlagged": len(waste_items)}
+
+def _archive_logs(db: Session) -> Dict[str, Any]:
+    from .log_writer import log_writer
+    from .log_archive import log_archive
+    # Buffered rows must reach the table before old ones are moved out
+    log_writer.flush()
+    return log_archive.archive(db)
+
+scheduler = Scheduler()
+scheduler.add_job(PeriodicJob("wasteScan", WASTE_SCAN_INTERVAL_S, _sweep_waste, WASTE_SCAN_JITTER))
+scheduler.add_job(PeriodicJob("logArchive", LOG_ARCHIVE_INTERVAL_S, _archive_logs, WASTE_SCAN_JITTER))
+metrics.register("scheduler", scheduler.status)
@@ -1,17 +1,77 @@
 from typing import List, Dict, Optional, Tuple, Any
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, case, bindparam
 from ..models import Item, Container
 from ..schemas import SearchResponse, RetrievalStep
 from .logging import LoggingService
+from .search_cache import SearchCache, search_cache
+from ..utils.events import publish_inventory_change, read_version, INVENTORY_VERSION
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Columns needed to build a search response. Statements are built once at import
+# so every request reuses the same compiled SQL from SQLAlchemy's statement cache,
+# and results come back as plain rows instead of identity-mapped ORM objects.
+_ITEM_DETAIL_COLUMNS = (
+    Item.itemId,
+    Item.name,
+    Item.container_id,
+    Item.width,
+    Item.depth,
+    Item.height,
+    Item.mass,
+    Item.priority,
+    Item.expiry_date,
+    Item.usage_limit,
+    Item.uses_remaining,
+    Item.preferred_zone,
+    Item.position,
+    Item.is_waste,
+    Container.zone
+)
+
+_SEARCH_BY_ID = (
+    select(*_ITEM_DETAIL_COLUMNS)
+    .outerjoin(Container, Item.container_id == Container.id)
+    .where(Item.itemId == bindparam("item_id"))
+    .limit(1)
+)
+
+_SEARCH_BY_NAME = (
+    select(*_ITEM_DETAIL_COLUMNS)
+    .outerjoin(Container, Item.container_id == Container.id)
+    .where(Item.name == bindparam("item_name"))
+    .limit(1)
+)
+
+_CONTAINER_ITEMS = (
+    select(*_ITEM_DETAIL_COLUMNS)
+    .outerjoin(Container, Item.container_id == Container.id)
+    .where(Item.container_id == bindparam("container_id"), Item.is_waste == False)
+)
+
+_BLOCKING_CANDIDATES = select(
+    Item.itemId,
+    Item.name,
+    Item.priority,
+    Item.position
+).where(
+    Item.container_id == bindparam("container_id"),
+    Item.itemId != bindparam("item_id"),
+    Item.is_waste == False  # Exclude waste items
+)
+
+_ITEM_COUNTS = select(
+    func.count(Item.itemId),
+    func.coalesce(func.sum(case((Item.is_waste == False, 1), else_=0)), 0)
+)
+
 class SearchService:
-    def __init__(self):
+    def __init__(self, cache: SearchCache = None):
         self.logging_service = LoggingService()
+        self.cache = cache or search_cache
 
     def search_item(
         self,
@@ -19,55 +79,60 @@ class SearchService:
         item_id: Optional[str] = None,
         item_name: Optional[str] = None
     ) -> Dict[str, Any]:
-        query = db.query(Item)
-        search_result = None
-        
-        if item_id:
-            query = query.filter(Item.itemId == str(item_id))
-            search_result = query.first()
-        elif item_name:
-            search_result = query.filter(Item.name == item_name).first()
+        """Search for an item by id or name.
+
+        Complete responses are cached until the next inventory change. Cached
+        responses are shared between callers and must not be mutated.
+        """
+        cache_key = ("id", str(item_id)) if item_id else ("name", item_name)
+        version = read_version(db, INVENTORY_VERSION)
+
+        response = self.cache.get(cache_key, version)
+        if response is None:
+            response = self._search(db, item_id, item_name)
+            self.cache.put(cache_key, version, response)
 
         # Log the search activity
         self.logging_service.add_log(
             db=db,
             user_id="system",  # Replace with actual user ID when authentication is implemented
             action_type="search",
-            item_id=search_result.itemId if search_result else None,
+            item_id=response["item"]["itemId"] if response["found"] else None,
             details={
                 "timestamp": datetime.now(timezone.utc).isoformat(),
                 "searchType": "id" if item_id else "name",
                 "searchTerm": item_id or item_name,
-                "found": bool(search_result)
+                "found": response["found"]
             }
         )
 
+        return response
+
+    def _search(
+        self,
+        db: Session,
+        item_id: Optional[str] = None,
+        item_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        search_result = None
+
+        if item_id:
+            search_result = db.execute(_SEARCH_BY_ID, {"item_id": str(item_id)}).first()
+        elif item_name:
+            search_result = db.execute(_SEARCH_BY_NAME, {"item_name": item_name}).first()
+
+        total_items, active_items = db.execute(_ITEM_COUNTS).one()
+
         if not search_result:
             return {
                 "success": True,
                 "found": False,
-                "totalItems": db.query(func.count(Item.itemId)).scalar() or 0,
-                "activeItems": db.query(func.count(Item.itemId)).filter(Item.is_waste == False).scalar() or 0
+                "totalItems": total_items or 0,
+                "activeItems": active_items or 0
             }
 
         # Generate item details
-        item_details = {
-            "itemId": str(search_result.itemId),
-            "name": search_result.name,
-            "containerId": search_result.container_id,
-            "width": search_result.width,
-            "depth": search_result.depth,
-            "height": search_result.height,
-            "mass": search_result.mass,
-            "priority": search_result.priority,
-            "expiryDate": search_result.expiry_date.isoformat() if search_result.expiry_date else None,
-            "usageLimit": search_result.usage_limit,
-            "usesRemaining": search_result.uses_remaining,
-            "preferredZone": search_result.preferred_zone,
-            "zone": search_result.container.zone if search_result.container else None,
-            "position": search_result.position,
-            "isWaste": search_result.is_waste  # Include waste status
-        }
+        item_details = self._item_details(search_result)
 
         # Determine status for waste items
         if search_result.is_waste:
@@ -96,8 +161,46 @@ class SearchService:
             "found": True,
             "item": item_details,
             "retrievalSteps": retrieval_steps,
-            "totalItems": db.query(func.count(Item.itemId)).scalar() or 0,
-            "activeItems": db.query(func.count(Item.itemId)).filter(Item.is_waste == False).scalar() or 0
+            "totalItems": total_items or 0,
+            "activeItems": active_items or 0
+        }
+
+    def list_container_items(self, db: Session, container_id: str) -> List[Dict[str, Any]]:
+        """List the active items stored in a container"""
+        rows = db.execute(_CONTAINER_ITEMS, {"container_id": container_id}).all()
+        return [{
+            "itemId": row.itemId,
+            "name": row.name,
+            "width": row.width,
+            "depth": row.depth,
+            "height": row.height,
+            "mass": row.mass,
+            "priority": row.priority,
+            "position": row.position,
+            "expiryDate": row.expiry_date.isoformat() if row.expiry_date else None,
+            "usageLimit": row.usage_limit,
+            "usesRemaining": row.uses_remaining,
+            "preferredZone": row.preferred_zone
+        } for row in rows]
+
+    def _item_details(self, row) -> Dict[str, Any]:
+        """Build the item payload of a search response from a projected row"""
+        return {
+            "itemId": str(row.itemId),
+            "name": row.name,
+            "containerId": row.container_id,
+            "width": row.width,
+            "depth": row.depth,
+            "height": row.height,
+            "mass": row.mass,
+            "priority": row.priority,
+            "expiryDate": row.expiry_date.isoformat() if row.expiry_date else None,
+            "usageLimit": row.usage_limit,
+            "usesRemaining": row.uses_remaining,
+            "preferredZone": row.preferred_zone,
+            "zone": row.zone,
+            "position": row.position,
+            "isWaste": row.is_waste  # Include waste status
         }
 
     def _calculate_retrieval_steps(
@@ -160,11 +263,10 @@ class SearchService:
 
         # Get all items in the same container
         blocking_items = []
-        container_items = db.query(Item).filter(
-            Item.container_id == target_item.container_id,
-            Item.itemId != target_item.itemId,
-            Item.is_waste == False  # Exclude waste items
-        ).all()
+        container_items = db.execute(_BLOCKING_CANDIDATES, {
+            "container_id": target_item.container_id,
+            "item_id": target_item.itemId
+        }).all()
 
         target_position = target_item.position
         target_front_access = float(target_position["startCoordinates"]["depth"])
@@ -253,6 +355,8 @@ class SearchService:
                     }
                 )
 
+            publish_inventory_change(db, "retrieval", item_ids=[item_id])
+
         db.commit()
         return True
 
@@ -291,5 +395,6 @@ class SearchService:
             }
         )
 
+        publish_inventory_change(db, "placement", item_ids=[item_id])
         db.commit()
         return True
\ No newline at end of file
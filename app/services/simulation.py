@@ -1,14 +1,58 @@
+import os
+import pickle
+import tempfile
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict
+from typing import Any, List, Dict, Iterator, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, update, or_
 from sqlalchemy.orm import Session
-from ..models import Item
+from ..models import Item, SimulationCheckpoint
 from ..schemas import SimulationRequest, SimulationResponse
 from .logging import LoggingService
+from .simulation_kernel import SimulationKernel, DayResult
+from .inventory_snapshot import InventorySnapshot, snapshot_cache
+from ..utils.events import publish_inventory_change
+from ..utils.error_handling import InventoryError
+from ..utils.profiling import PhaseProfiler
 import logging
 
 logger = logging.getLogger(__name__)
 
+_DAY = timedelta(days=1)
+
+# Log rows a running simulation holds in memory before spooling them to disk
+SIMULATION_LOG_BATCH = int(os.getenv("SIMULATION_LOG_BATCH", "5000"))
+
+_STATE_COLUMNS = (
+    Item.itemId,
+    Item.name,
+    Item.usage_limit,
+    Item.uses_remaining,
+    Item.expiry_date,
+    Item.is_waste
+)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
 class SimulationService:
+    """Advances the inventory through simulated days.
+
+    The state of every item the run can touch (the items being used and the
+    items expiring before its last day) is loaded with one query into a
+    ``SimulationKernel``, which applies each day's usage and expiries as
+    array operations and skips idle days straight to the next expiry. The
+    final state is written back with one bulk UPDATE and the log rows with
+    one bulk insert, in the same transaction. Dry runs read a cached
+    ``InventorySnapshot`` instead and write nothing.
+
+    Each run starts from the persisted simulation clock and records a
+    checkpoint holding the new clock and a delta of the rows it changed,
+    so later runs resume where it stopped and any run can be rolled back.
+    """
+
     def __init__(self):
         self.logging_service = LoggingService()
 
@@ -17,130 +61,395 @@ class SimulationService:
         db: Session,
         request: SimulationRequest
     ) -> SimulationResponse:
-        current_date = datetime.now(timezone.utc)
-        target_date = None
+        if request.dry_run:
+            return self.project(snapshot_cache.get(db), request, self.current_time(db))
+        return self._collect(self.iter_simulation(db, request))
+
+    def project(
+        self,
+        snapshot: InventorySnapshot,
+        request: SimulationRequest,
+        start: Optional[datetime] = None
+    ) -> SimulationResponse:
+        """Run a what-if simulation against a snapshot without writing anything.
+
+        Needs no database session, so several projections can run in
+        parallel threads against the same snapshot.
+        """
+        return self._collect(self.iter_projection(snapshot, request, start))
+
+    def iter_simulation(self, db: Session, request: SimulationRequest) -> Iterator[Dict[str, Any]]:
+        """Run a simulation, yielding one record per day and a final summary.
+
+        Memory stays bounded by the number of items: each day's lists are
+        only in its own record, and log rows are spooled to a temporary file
+        in batches as the run goes. Nothing is written to the database until
+        the last day, so no transaction stays open while records are yielded;
+        the logs and the new item state are then inserted and committed
+        together, and a run abandoned part way (e.g. a dropped stream) leaves
+        the database untouched.
+        """
+        profiler = PhaseProfiler("simulation")
+        # The session's own connection, so concurrent requests are not counted
+        profiler.attach(db.connection())
+        try:
+            with profiler.phase("load"):
+                # Resume from the simulated clock left by the previous run
+                current_date = self.current_time(db)
+                num_days, target_date = self._horizon(request, current_date)
+                usage_ids = self._usage_ids(request)
+                last_day = current_date + (num_days - 1) * _DAY
+                rows = self._load_state(db, usage_ids, last_day)
+                kernel = SimulationKernel.from_rows(rows, current_date)
+                initial_uses = kernel.uses.copy()
+                unknown = self._unknown_ids(usage_ids, kernel)
+
+            log_entries: List[Dict] = []
+            totals = {"totalItemsUsed": 0, "totalItemsDepleted": 0, "totalItemsExpired": 0}
+            days = self._iter_days(rows, kernel, usage_ids, current_date, num_days, totals, log_entries, profiler)
+            with tempfile.TemporaryFile() as spool:
+                for record in days:
+                    if len(log_entries) >= SIMULATION_LOG_BATCH:
+                        with profiler.phase("logging"):
+                            pickle.dump(log_entries, spool)
+                        log_entries.clear()
+                    yield record
+
+                with profiler.phase("logging"):
+                    spooled = spool.tell()
+                    spool.seek(0)
+                    while spool.tell() < spooled:
+                        self.logging_service.add_logs(db, pickle.load(spool), durable=True)
+                    self.logging_service.add_logs(db, log_entries, durable=True)
+            with profiler.phase("writeBack"):
+                delta = self._write_back(db, kernel, initial_uses)
+                checkpoint = SimulationCheckpoint(simulated_at=target_date.replace(tzinfo=None), delta=delta)
+                db.add(checkpoint)
+                publish_inventory_change(db, "simulation")
+            with profiler.phase("commit"):
+                db.commit()
+        finally:
+            profiler.detach()
+        profiler.publish()
+        logger.info("Simulation completed successfully")
+
+        yield {
+            "type": "summary",
+            "success": True,
+            "newDate": target_date.isoformat(),
+            "days": num_days,
+            **totals,
+            "unknownItems": unknown,
+            "dryRun": False,
+            "checkpointId": checkpoint.id,
+            "profile": profiler.result() if request.profile else None
+        }
+
+    def iter_projection(
+        self,
+        snapshot: InventorySnapshot,
+        request: SimulationRequest,
+        start: Optional[datetime] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Same records as ``iter_simulation``, computed on a snapshot and never written"""
+        profiler = PhaseProfiler("simulation.projection")
+        with profiler.phase("load"):
+            current_date = start or datetime.now(timezone.utc)
+            num_days, target_date = self._horizon(request, current_date)
+            usage_ids = self._usage_ids(request)
+            rows, kernel = snapshot.checkout(usage_ids, current_date, num_days)
+            unknown = self._unknown_ids(usage_ids, kernel)
+
+        log_entries: List[Dict] = []
+        totals = {"totalItemsUsed": 0, "totalItemsDepleted": 0, "totalItemsExpired": 0}
+        for record in self._iter_days(rows, kernel, usage_ids, current_date, num_days, totals, log_entries, profiler):
+            log_entries.clear()
+            yield record
+        profiler.publish()
+
+        yield {
+            "type": "summary",
+            "success": True,
+            "newDate": target_date.isoformat(),
+            "days": num_days,
+            **totals,
+            "unknownItems": unknown,
+            "dryRun": True,
+            "checkpointId": None,
+            "profile": profiler.result() if request.profile else None
+        }
+
+    def current_time(self, db: Session) -> datetime:
+        """The simulated clock: the date reached by the latest checkpoint, or now"""
+        simulated_at = db.execute(
+            select(SimulationCheckpoint.simulated_at)
+            .order_by(SimulationCheckpoint.id.desc())
+            .limit(1)
+        ).scalar()
+        return _as_utc(simulated_at) if simulated_at else datetime.now(timezone.utc)
+
+    def list_checkpoints(self, db: Session) -> List[Dict[str, Any]]:
+        checkpoints = db.execute(
+            select(SimulationCheckpoint).order_by(SimulationCheckpoint.id)
+        ).scalars()
+        return [
+            {
+                "checkpointId": checkpoint.id,
+                "simulatedAt": _as_utc(checkpoint.simulated_at).isoformat(),
+                "createdAt": _as_utc(checkpoint.created_at).isoformat(),
+                "itemsChanged": len(checkpoint.delta or {})
+            }
+            for checkpoint in checkpoints
+        ]
+
+    def rollback(self, db: Session, checkpoint_id: Optional[int] = None) -> datetime:
+        """Undo every run after ``checkpoint_id`` (all of them when None) and return the clock.
 
+        The deltas of the undone runs are folded into one set of original
+        values, so only the rows they changed are written, with one UPDATE.
+        """
+        stmt = select(SimulationCheckpoint).order_by(SimulationCheckpoint.id)
+        if checkpoint_id is not None:
+            if db.get(SimulationCheckpoint, checkpoint_id) is None:
+                raise InventoryError("Checkpoint not found", {"checkpointId": checkpoint_id})
+            stmt = stmt.where(SimulationCheckpoint.id > checkpoint_id)
+        undone = db.execute(stmt).scalars().all()
+
+        # The earliest undone run holds each row's value before the rollback point
+        original: Dict[str, List] = {}
+        for checkpoint in undone:
+            for item_id, (old_uses, _, old_waste, _) in (checkpoint.delta or {}).items():
+                original.setdefault(item_id, [old_uses, old_waste])
+
+        existing = set(db.execute(select(Item.itemId).where(Item.itemId.in_(original))).scalars())
+        rows = []
+        for item_id, (old_uses, old_waste) in original.items():
+            if item_id not in existing:
+                continue  # Removed since, e.g. undocked
+            row = {"itemId": item_id, "is_waste": old_waste}
+            if old_uses is not None:
+                row["uses_remaining"] = old_uses
+            rows.append(row)
+        if rows:
+            db.execute(update(Item), rows)
+
+        for checkpoint in undone:
+            db.delete(checkpoint)
+        publish_inventory_change(db, "simulation_rollback")
+        db.commit()
+        logger.info(f"Rolled back {len(undone)} simulation runs, restoring {len(rows)} items")
+        return self.current_time(db)
+
+    def _horizon(self, request: SimulationRequest, start: datetime) -> Tuple[int, datetime]:
+        """Days to simulate from ``start`` and the date the clock ends on"""
         if request.num_of_days:
-            target_date = current_date + timedelta(days=request.num_of_days)
-        elif request.to_timestamp:
-            target_date = request.to_timestamp
-        else:
-            raise ValueError("Either num_of_days or to_timestamp must be provided")
+            return request.num_of_days, start + timedelta(days=request.num_of_days)
+
+        target_date = _as_utc(request.to_timestamp)
+        if target_date <= start:
+            raise InventoryError(
+                "toTimestamp must be after the simulation clock",
+                {"toTimestamp": target_date.isoformat(), "simulatedTime": start.isoformat()}
+            )
+        # Only whole days are simulated and the clock stops after the last one,
+        # so the rest of a partial day is simulated by a later, further target
+        num_days = (target_date - start) // _DAY
+        return num_days, start + num_days * _DAY
+
+    def _unknown_ids(self, usage_ids: List[str], kernel: SimulationKernel) -> List[str]:
+        """Usage ids that match no active item, each reported once"""
+        unknown = [item_id for item_id in dict.fromkeys(usage_ids) if item_id not in kernel.index]
+        if unknown:
+            logger.warning(f"Simulation ignores unknown or inactive items: {', '.join(unknown)}")
+        return unknown
 
+    def _usage_ids(self, request: SimulationRequest) -> List[str]:
+        return [str(entry["itemId"]) for entry in request.items_to_be_used_per_day if entry.get("itemId")]
+
+    def _iter_days(
+        self,
+        rows: List[Any],
+        kernel: SimulationKernel,
+        usage_ids: List[str],
+        start: datetime,
+        num_days: int,
+        totals: Dict[str, int],
+        log_entries: List[Dict],
+        profiler: PhaseProfiler
+    ) -> Iterator[Dict[str, Any]]:
+        """Advance ``kernel`` day by day, yielding each day's record and adding to ``totals``"""
+        for result in kernel.run(num_days, kernel.usage_counts(usage_ids), profiler):
+            day_changes = {
+                "itemsUsedToday": [],
+                "itemsDepletedToday": [],
+                "itemsExpiredToday": [],
+                "totalItemsUsed": 0,
+                "totalItemsDepleted": 0,
+                "totalItemsExpired": 0
+            }
+            with profiler.phase("reports"):
+                daily_report = self._report_day(rows, result, start + result.day * _DAY, day_changes, log_entries)
+            for key in totals:
+                totals[key] += day_changes[key]
+
+            yield {
+                "type": "day",
+                "day": result.day + 1,
+                **daily_report,
+                "itemsUsedToday": day_changes["itemsUsedToday"],
+                "itemsDepletedToday": day_changes["itemsDepletedToday"],
+                "itemsExpiredToday": day_changes["itemsExpiredToday"],
+                **totals
+            }
+
+    def _collect(self, records: Iterator[Dict[str, Any]]) -> SimulationResponse:
+        """Gather streamed records into the classic response, which lists every day's changes"""
         changes = {
             "dailyReports": [],
             "itemsUsedToday": [],
             "itemsDepletedToday": [],
-            "itemsExpiredToday": [],
-            "totalItemsUsed": 0,
-            "totalItemsDepleted": 0,
-            "totalItemsExpired": 0
+            "itemsExpiredToday": []
         }
+        for record in records:
+            if record["type"] == "day":
+                changes["dailyReports"].append({"date": record["date"], "items": record["items"]})
+                changes["itemsUsedToday"].extend(record["itemsUsedToday"])
+                changes["itemsDepletedToday"].extend(record["itemsDepletedToday"])
+                changes["itemsExpiredToday"].extend(record["itemsExpiredToday"])
+            else:
+                summary = record
 
-        for day in range(request.num_of_days):
-            current_simulation_date = current_date + timedelta(days=day)
-            logger.info(f"Processing day {day + 1}: {current_simulation_date}")
-            
-            daily_report = {
-                "date": current_simulation_date.isoformat(),
-                "items": []
-            }
+        return SimulationResponse(
+            success=True,
+            newDate=summary["newDate"],
+            changes={
+                **changes,
+                "totalItemsUsed": summary["totalItemsUsed"],
+                "totalItemsDepleted": summary["totalItemsDepleted"],
+                "totalItemsExpired": summary["totalItemsExpired"],
+                "unknownItems": summary["unknownItems"]
+            },
+            dryRun=summary["dryRun"],
+            checkpointId=summary["checkpointId"],
+            profile=summary["profile"]
+        )
 
-            # Process daily item usage
-            for item_usage in request.items_to_be_used_per_day:
-                item_id = item_usage.get("itemId")
-                if not item_id:
-                    continue
-
-                item = db.query(Item).filter(Item.id == str(item_id)).first()
-                if not item or item.is_waste:
-                    continue
-
-                old_uses = item.uses_remaining if item.uses_remaining is not None else None
-                
-                if item.usage_limit is not None and item.uses_remaining is not None:
-                    if item.uses_remaining > 0:
-                        item.uses_remaining = max(0, item.uses_remaining - 1)
-                        changes["totalItemsUsed"] += 1
-                        changes["itemsUsedToday"].append({
-                            "itemId": item.id,
-                            "name": item.name,
-                            "remainingUses": item.uses_remaining
-                        })
-
-                        item_status = "Active"
-                        if item.uses_remaining == 0:
-                            item_status = "Depleted"
-                            changes["totalItemsDepleted"] += 1
-                            item.is_waste = True
-                            changes["itemsDepletedToday"].append({
-                                "itemId": item.id,
-                                "name": item.name
-                            })
-                        
-                        daily_report["items"].append({
-                            "itemId": item.id,
-                            "name": item.name,
-                            "usesRemaining": item.uses_remaining,
-                            "status": item_status
-                        })
-                        
-                        # Log usage
-                        self.logging_service.add_log(
-                            db=db,
-                            user_id="simulation",
-                            action_type="retrieval",
-                            item_id=item.id,
-                            details={
-                                "simulatedDate": current_simulation_date.isoformat(),
-                                "oldUsesRemaining": old_uses,
-                                "newUsesRemaining": item.uses_remaining,
-                                "simulated": True
-                            }
-                        )
-
-            # Check for expired items on this day
-            expired_items = db.query(Item).filter(
-                Item.expiry_date <= current_simulation_date,
-                Item.is_waste == False
-            ).all()
-
-            for item in expired_items:
-                changes["totalItemsExpired"] += 1
-                changes["itemsExpiredToday"].append({
-                    "itemId": item.id,
-                    "name": item.name,
-                    "expiryDate": item.expiry_date.isoformat()
-                })
-                item.is_waste = True
+    def _load_state(self, db: Session, usage_ids: List[str], last_day: datetime) -> List[Any]:
+        """Active items that are used or expire during the run, used items first in request order"""
+        # Expiry dates are stored without a zone, in UTC
+        cutoff = last_day.astimezone(timezone.utc).replace(tzinfo=None)
+        rows = db.execute(
+            select(*_STATE_COLUMNS).where(
+                Item.is_waste == False,
+                or_(Item.itemId.in_(set(usage_ids)), Item.expiry_date <= cutoff)
+            )
+        ).all()
+        first_use = {}
+        for position, item_id in enumerate(usage_ids):
+            first_use.setdefault(item_id, position)
+        return sorted(rows, key=lambda row: (first_use.get(row.itemId, len(usage_ids)), row.itemId))
 
-                daily_report["items"].append({
-                    "itemId": item.id,
-                    "name": item.name,
-                    "status": "Expired",
-                    "expiryDate": item.expiry_date.isoformat()
+    def _report_day(
+        self,
+        rows: List[Any],
+        result: DayResult,
+        simulated_date: datetime,
+        changes: Dict[str, Any],
+        log_entries: List[Dict]
+    ) -> Dict[str, Any]:
+        """Build one day's report from a kernel result and collect its log rows"""
+        daily_report = {"date": simulated_date.isoformat(), "items": []}
+
+        # Repeated usages of an item are aggregated into one entry per day
+        for index, times_used, uses_after in zip(result.used.tolist(), result.times_used.tolist(), result.uses_after.tolist()):
+            row = rows[index]
+            changes["totalItemsUsed"] += times_used
+            changes["itemsUsedToday"].append({
+                "itemId": row.itemId,
+                "name": row.name,
+                "timesUsed": times_used,
+                "remainingUses": uses_after
+            })
+
+            item_status = "Active"
+            if uses_after == 0:
+                item_status = "Depleted"
+                changes["totalItemsDepleted"] += 1
+                changes["itemsDepletedToday"].append({
+                    "itemId": row.itemId,
+                    "name": row.name
                 })
 
-                # Log expiration
-                self.logging_service.add_log(
-                    db=db,
-                    user_id="simulation",
-                    action_type="disposal",
-                    item_id=item.id,
-                    details={
-                        "reason": "Expired",
-                        "expiryDate": item.expiry_date.isoformat(),
-                        "simulatedDate": current_simulation_date.isoformat()
-                    }
-                )
-
-            changes["dailyReports"].append(daily_report)
+            daily_report["items"].append({
+                "itemId": row.itemId,
+                "name": row.name,
+                "timesUsed": times_used,
+                "usesRemaining": uses_after,
+                "status": item_status
+            })
+            log_entries.append({
+                "user_id": "simulation",
+                "action_type": "retrieval",
+                "item_id": row.itemId,
+                "details": {
+                    "simulatedDate": simulated_date.isoformat(),
+                    "oldUsesRemaining": uses_after + times_used,
+                    "newUsesRemaining": uses_after,
+                    "timesUsed": times_used,
+                    "simulated": True
+                }
+            })
 
-        db.commit()
-        logger.info("Simulation completed successfully")
+        for index in result.expired.tolist():
+            row = rows[index]
+            expiry_date = _as_utc(row.expiry_date).isoformat()
+            changes["totalItemsExpired"] += 1
+            changes["itemsExpiredToday"].append({
+                "itemId": row.itemId,
+                "name": row.name,
+                "expiryDate": expiry_date
+            })
+            daily_report["items"].append({
+                "itemId": row.itemId,
+                "name": row.name,
+                "status": "Expired",
+                "expiryDate": expiry_date
+            })
+            log_entries.append({
+                "user_id": "simulation",
+                "action_type": "disposal",
+                "item_id": row.itemId,
+                "details": {
+                    "reason": "Expired",
+                    "expiryDate": expiry_date,
+                    "simulatedDate": simulated_date.isoformat()
+                }
+            })
 
-        return SimulationResponse(
-            success=True,
-            newDate=target_date,
-            changes=changes
-        )
\ No newline at end of file
+        return daily_report
+
+    def _write_back(
+        self,
+        db: Session,
+        kernel: SimulationKernel,
+        initial_uses: np.ndarray
+    ) -> Dict[str, List]:
+        """Persist the changed rows with one bulk UPDATE; returns their checkpoint delta"""
+        changed = np.flatnonzero(kernel.waste | (kernel.uses != initial_uses))
+        delta = {}
+        if len(changed):
+            rows = []
+            for i in changed.tolist():
+                row = {"itemId": kernel.item_ids[i], "is_waste": bool(kernel.waste[i])}
+                if kernel.limited[i]:
+                    row["uses_remaining"] = int(kernel.uses[i])
+                rows.append(row)
+                # Simulated rows always start out active
+                delta[kernel.item_ids[i]] = [
+                    int(initial_uses[i]) if kernel.limited[i] else None,
+                    row.get("uses_remaining"),
+                    False,
+                    row["is_waste"]
+                ]
+            db.execute(update(Item), rows)
+        return delta
@@ -0,0 +1,145 @@
+import math
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator, List, NamedTuple, Sequence, Tuple
+import numpy as np
+
+_DAY = timedelta(days=1)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def expiry_day(expiry_date: datetime, start: datetime) -> int:
+    """Index of the first simulated day on or after ``expiry_date``"""
+    return max(0, math.ceil((_as_utc(expiry_date) - start) / _DAY))
+
+class DayResult(NamedTuple):
+    day: int
+    used: np.ndarray          # Indices of the items used today
+    times_used: np.ndarray    # How many times each of them was used
+    uses_after: np.ndarray    # Their remaining uses at the end of the day
+    depleted: np.ndarray      # Indices of the items that ran out today
+    expired: np.ndarray       # Indices of the items that expired today
+
+class SimulationKernel:
+    """Item state of a simulation run held in NumPy arrays.
+
+    Each day applies every usage decrement and the expiry check as array
+    operations over all items at once. Items whose usage is unlimited keep
+    ``limited`` False and are never decremented, matching the original
+    day-by-day loop.
+    """
+
+    def __init__(
+        self,
+        item_ids: Sequence[str],
+        uses: np.ndarray,
+        limited: np.ndarray,
+        expiry: np.ndarray,
+        waste: np.ndarray
+    ):
+        self.item_ids = list(item_ids)
+        self.index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.uses = np.asarray(uses, dtype=np.int64)
+        self.limited = np.asarray(limited, dtype=bool)
+        self.expiry = np.asarray(expiry, dtype=float)
+        self.waste = np.asarray(waste, dtype=bool)
+
+    @classmethod
+    def from_rows(cls, rows: List[Any], start: datetime) -> "SimulationKernel":
+        """Snapshot rows carrying itemId, usage_limit, uses_remaining, expiry_date and is_waste"""
+        return cls(
+            [row.itemId for row in rows],
+            [row.uses_remaining or 0 for row in rows],
+            [row.usage_limit is not None and row.uses_remaining is not None for row in rows],
+            [expiry_day(row.expiry_date, start) if row.expiry_date else np.inf for row in rows],
+            [bool(row.is_waste) for row in rows]
+        )
+
+    def copy(self) -> "SimulationKernel":
+        return SimulationKernel(self.item_ids, self.uses.copy(), self.limited, self.expiry, self.waste.copy())
+
+    def usage_counts(self, item_ids: Sequence[str]) -> np.ndarray:
+        """Times each item is used per day, from a list of usage entries"""
+        indices = [self.index[item_id] for item_id in item_ids if item_id in self.index]
+        return np.bincount(np.array(indices, dtype=np.int64), minlength=len(self.item_ids))
+
+    def step(self, day: int, counts: np.ndarray, profiler: Any = None) -> DayResult:
+        """Apply one day of usage, then that day's expiries"""
+        with profiler.phase("usage") if profiler else nullcontext():
+            usable = ~self.waste & self.limited
+            times_used = np.where(usable, np.minimum(self.uses, counts), 0)
+            used = np.flatnonzero(times_used)
+            self.uses -= times_used
+
+            ran_out = np.zeros(len(self.uses), dtype=bool)
+            ran_out[used] = self.uses[used] == 0
+            self.waste |= ran_out
+
+        with profiler.phase("expiry") if profiler else nullcontext():
+            expiring = ~self.waste & (self.expiry <= day)
+            self.waste |= expiring
+
+        return DayResult(
+            day, used, times_used[used], self.uses[used],
+            np.flatnonzero(ran_out), np.flatnonzero(expiring)
+        )
+
+    def run(self, num_days: int, counts: np.ndarray, profiler: Any = None) -> Iterator[DayResult]:
+        """Yield the result of every day; idle stretches are skipped to the next expiry.
+
+        ``profiler``, when given, is a ``PhaseProfiler`` timing the usage and
+        expiry phases of each day.
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        day = 0
+        while day < num_days:
+            if not (~self.waste & self.limited & (self.uses > 0) & (counts > 0)).any():
+                pending = self.expiry[~self.waste]
+                next_event = int(min(pending.min(), num_days)) if len(pending) else num_days
+                while day < next_event:
+                    yield DayResult(day, empty, empty, empty, empty, empty)
+                    day += 1
+                if day >= num_days:
+                    break
+            yield self.step(day, counts, profiler)
+            day += 1
+
+def run_trials(
+    uses: np.ndarray,
+    limited: np.ndarray,
+    expiry: np.ndarray,
+    rates: np.ndarray,
+    num_days: int,
+    trials: int,
+    seed: np.random.SeedSequence
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Simulate ``trials`` independent runs with Poisson daily usage.
+
+    Every array is per item; the state of all trials is advanced together as
+    a (trials, items) matrix. Returns the day each item was depleted and the
+    day it expired in each trial, with ``num_days`` meaning it did not happen.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(uses)
+    remaining = np.broadcast_to(uses, (trials, count)).copy()
+    waste = np.zeros((trials, count), dtype=bool)
+    depleted_day = np.full((trials, count), num_days, dtype=np.int32)
+    expired_day = np.full((trials, count), num_days, dtype=np.int32)
+    used = limited & (rates > 0)
+
+    for day in range(num_days):
+        counts = rng.poisson(rates, size=(trials, count))
+        active = ~waste & used
+        remaining -= np.where(active, np.minimum(remaining, counts), 0)
+        ran_out = active & (remaining == 0)
+        depleted_day[ran_out] = day
+        waste |= ran_out
+
+        expiring = ~waste & (expiry <= day)
+        expired_day[expiring] = day
+        waste |= expiring
+
+    return depleted_day, expired_day
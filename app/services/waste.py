@@ -1,109 +1,266 @@
-from typing import List, Dict, Tuple
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timezone
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm import Session
 from ..models import Item, Container
 from ..schemas import WasteItem, ReturnPlanRequest, ReturnManifest, Position
 from .logging import LoggingService
+from .return_optimizer import ReturnManifestOptimizer
+from .retrieval import RetrievalSessionService
+from .expiry import ExpiryIndex, expiry_index
+from ..utils.events import publish_inventory_change, read_version, INVENTORY_VERSION
+from ..utils.error_handling import InventoryError
+from ..utils.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _is_expired(item: Item, current_date: datetime) -> bool:
+    expiry_date = item.expiry_date
+    if not expiry_date:
+        return False
+    if expiry_date.tzinfo is None:
+        expiry_date = expiry_date.replace(tzinfo=timezone.utc)
+    return expiry_date <= current_date
+
+# Page size of the paginated waste listing, and rows fetched per round trip when streaming
+WASTE_PAGE_SIZE = int(os.getenv("WASTE_PAGE_SIZE", "100"))
+WASTE_STREAM_BATCH = int(os.getenv("WASTE_STREAM_BATCH", "1000"))
+
+_WASTE_COLUMNS = (
+    Item.itemId, Item.name, Item.container_id, Item.position,
+    Item.expiry_date, Item.usage_limit, Item.uses_remaining
+)
+
+def _waste_record(row: Any, current_date: datetime) -> Dict[str, Any]:
+    """Listing entry for a waste row; position stays null for unplaced items.
+
+    Positions use the ``Position`` schema's keys, as in ``identify_waste_items``.
+    """
+    position = None
+    if row.position:
+        position = {
+            "start_coordinates": row.position["startCoordinates"],
+            "end_coordinates": row.position["endCoordinates"]
+        }
+    return {
+        "itemId": row.itemId,
+        "name": row.name,
+        "reason": "Expired" if _is_expired(row, current_date) else "Out of Uses",
+        "containerId": row.container_id,
+        "position": position
+    }
 
 class WasteManagementService:
-    def __init__(self):
+    def __init__(self, expiry_index: ExpiryIndex = expiry_index):
         self.logging_service = LoggingService()
+        self.expiry_index = expiry_index
+        self.optimizer = ReturnManifestOptimizer()
+        self.retrieval_planner = RetrievalSessionService()
 
     def identify_waste_items(self, db: Session) -> List[WasteItem]:
+        """Mark newly expired or used-up items as waste and return them.
+
+        Expired items come from the in-memory expiry index, so each scan only
+        touches items whose expiry passed since the previous one; used-up
+        items are found through the ``(is_waste, uses_remaining)`` index. All
+        of them are flagged with one UPDATE and logged with one batch insert.
+        """
         current_date = datetime.now(timezone.utc)
         waste_items = []
 
-        # Query items that are expired or out of uses
-        items = db.query(Item).filter(
-            ((Item.expiry_date.isnot(None) & (Item.expiry_date <= current_date)) |
-            (Item.usage_limit.isnot(None) & (Item.uses_remaining <= 0))) &
-            (Item.is_waste == False)
-        ).all()
-
-        for item in items:
-            # Create position model from JSON if it exists
-            position = None
-            if item.position:
-                position = Position(
-                    start_coordinates=item.position["startCoordinates"],
-                    end_coordinates=item.position["endCoordinates"]
+        version = read_version(db, INVENTORY_VERSION)
+        candidate_ids = set(self.expiry_index.pop_due(db, current_date))
+        try:
+            candidate_ids.update(db.execute(
+                select(Item.itemId).where(
+                    Item.is_waste == False,
+                    Item.usage_limit.isnot(None),
+                    Item.uses_remaining <= 0
                 )
+            ).scalars())
 
-            # Convert expiry_date to timezone-aware if needed
-            if item.expiry_date and item.expiry_date.tzinfo is None:
-                expiry_date = item.expiry_date.replace(tzinfo=timezone.utc)
-            else:
-                expiry_date = item.expiry_date
-
-            waste_item = WasteItem(
-                itemId=str(item.id),  # Ensure string format and use itemId alias
-                name=item.name,
-                reason="Expired" if expiry_date and expiry_date <= current_date else "Out of Uses",
-                containerId=item.container_id or "unknown",  # Use containerId alias
-                position=position or Position(
-                    start_coordinates={"width": 0, "depth": 0, "height": 0},
-                    end_coordinates={"width": 0, "depth": 0, "height": 0}
+            if not candidate_ids:
+                return waste_items
+
+            # Re-check the candidates; index entries may be stale
+            items = db.execute(
+                select(
+                    Item.itemId, Item.name, Item.container_id, Item.position,
+                    Item.expiry_date, Item.usage_limit, Item.uses_remaining
+                ).where(Item.itemId.in_(candidate_ids), Item.is_waste == False)
+            ).all()
+
+            log_entries = []
+            for item in items:
+                expired = _is_expired(item, current_date)
+                used_up = item.usage_limit is not None and (item.uses_remaining or 0) <= 0
+                if not expired and not used_up:
+                    continue
+
+                # Create position model from JSON if it exists
+                position = None
+                if item.position:
+                    position = Position(
+                        start_coordinates=item.position["startCoordinates"],
+                        end_coordinates=item.position["endCoordinates"]
+                    )
+
+                waste_item = WasteItem(
+                    itemId=str(item.itemId),  # Ensure string format and use itemId alias
+                    name=item.name,
+                    reason="Expired" if expired else "Out of Uses",
+                    containerId=item.container_id or "unknown",  # Use containerId alias
+                    position=position or Position(
+                        start_coordinates={"width": 0, "depth": 0, "height": 0},
+                        end_coordinates={"width": 0, "depth": 0, "height": 0}
+                    )
                 )
+                waste_items.append(waste_item)
+
+                log_entries.append({
+                    "user_id": "system",
+                    "action_type": "disposal",
+                    "item_id": item.itemId,
+                    "details": {
+                        "reason": waste_item.reason,
+                        "container": item.container_id,
+                        "identified_at": current_date.isoformat()
+                    }
+                })
+
+            if not waste_items:
+                return waste_items
+
+            # Mark items as waste and log them in the same transaction
+            waste_ids = [waste_item.itemId for waste_item in waste_items]
+            db.execute(
+                update(Item)
+                .where(Item.itemId.in_(waste_ids), Item.is_waste == False)
+                .values(is_waste=True)
+                .execution_options(synchronize_session=False)
             )
-            waste_items.append(waste_item)
-
-            # Mark item as waste in database
-            item.is_waste = True
-            db.add(item)
-
-            # Log waste identification
-            self.logging_service.add_log(
-                db=db,
-                user_id="system",
-                action_type="disposal",
-                item_id=item.id,
-                details={
-                    "reason": waste_item.reason,
-                    "container": item.container_id,
-                    "identified_at": current_date.isoformat()
-                }
-            )
+            self.logging_service.add_logs(db, log_entries, durable=True)
 
-        db.commit()
+            publish_inventory_change(db, "waste", item_ids=waste_ids)
+            db.commit()
+        except Exception:
+            # Popped entries are no longer in the heap; rebuild it on the next scan
+            self.expiry_index.invalidate()
+            raise
+        self.expiry_index.acknowledge(db, version)
         return waste_items
 
+    def list_waste(
+        self,
+        db: Session,
+        cursor: Optional[str] = None,
+        limit: int = WASTE_PAGE_SIZE
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of waste items ordered by id, after the ``cursor`` item id.
+
+        Returns the page and the cursor of the next one, or None on the last
+        page. Pages are read with a keyset on ``itemId``, so every page costs
+        the same however deep into the listing it is.
+        """
+        stmt = select(*_WASTE_COLUMNS).where(Item.is_waste == True)
+        if cursor:
+            stmt = stmt.where(Item.itemId > cursor)
+        rows = db.execute(stmt.order_by(Item.itemId).limit(limit + 1)).all()
+
+        current_date = datetime.now(timezone.utc)
+        page = [_waste_record(row, current_date) for row in rows[:limit]]
+        next_cursor = page[-1]["itemId"] if len(rows) > limit else None
+        return page, next_cursor
+
+    def iter_waste(
+        self,
+        db: Session,
+        batch_size: int = WASTE_STREAM_BATCH
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield every waste item in batches, reading through a server-side cursor"""
+        result = db.execute(
+            select(*_WASTE_COLUMNS)
+            .where(Item.is_waste == True)
+            .order_by(Item.itemId)
+            .execution_options(yield_per=batch_size)
+        )
+        current_date = datetime.now(timezone.utc)
+        for rows in result.partitions():
+            yield [_waste_record(row, current_date) for row in rows]
+
     def plan_waste_return(
         self,
         db: Session,
         request: ReturnPlanRequest
     ) -> Tuple[List[dict], List[dict], ReturnManifest]:
-        # Get all waste items
-        waste_items = db.query(Item).filter(Item.is_waste == True).all()
-        
-        # Sort waste items by priority (higher priority items returned first)
-        waste_items.sort(key=lambda x: (-x.priority, x.expiry_date or datetime.max))
-        
         return_plan = []
         retrieval_steps = []
-        total_volume = 0
-        total_weight = 0
-        return_items = []
-        step_counter = 1
+        manifest = None
+        for kind, record in self.iter_return_plan(db, request):
+            if kind == "manifest":
+                manifest = record
+            elif kind == "retrieval":
+                retrieval_steps.append(record)
+            else:
+                return_plan.append(record)
+        return return_plan, retrieval_steps, manifest
+
+    def iter_return_plan(
+        self,
+        db: Session,
+        request: ReturnPlanRequest
+    ) -> Iterator[Tuple[str, Any]]:
+        """Yield the manifest, then every retrieval and return step in order.
+
+        Chosen items are packed into the undocking container heaviest first
+        and moved in exactly that order, so each ``"return"`` record carries
+        the position the item is packed at. Blockers are cleared just before
+        the target they block; targets that are themselves in the way are
+        staged in temporary storage until their turn, and the other blockers
+        go back once the last target has left their container. All queries run
+        before the manifest is yielded, so the remaining records can be
+        streamed without touching the session.
+        """
+        undocking_container_id = request.undocking_container_id
 
         # Get undocking container dimensions
         undocking_container = db.query(Container).filter(
-            Container.id == request.undockingContainerId
+            Container.id == undocking_container_id
         ).first()
         
         if not undocking_container:
-            raise InventoryError("Undocking container not found")
+            raise InventoryError(
+                "Undocking container not found",
+                {"containerId": undocking_container_id}
+            )
+
+        # Get all waste items
+        waste_items = db.query(Item).filter(Item.is_waste == True).all()
 
-        # Calculate available space in undocking container
-        available_space = undocking_container.width * undocking_container.depth * undocking_container.height
+        # Pick the manifest that returns the most waste within the weight,
+        # volume and geometry limits of the undocking container
+        waste_items, optimization = self.optimizer.optimize(
+            waste_items,
+            undocking_container,
+            request.max_weight,
+            request.objective,
+            request.time_budget_ms
+        )
+
+        # Load items in the order they were packed
+        placements = optimization["placements"]
+        items_by_id = {item.itemId: item for item in waste_items}
+        packed = [items_by_id[item_id] for item_id in placements]
 
-        for item in waste_items:
-            # Calculate item volume and check constraints
+        current_date = datetime.now(timezone.utc)
+        return_items = []
+        total_volume = 0
+        total_weight = 0
+        for item in packed:
             item_volume = item.width * item.depth * item.height
-            
-            # Check if item fits within remaining weight and volume limits
-            if (total_weight + item.mass > request.maxWeight or
-                total_volume + item_volume > available_space):
-                continue
 
             # Add to return manifest
             return_items.append({
@@ -111,109 +268,91 @@ class WasteManagementService:
                 "name": item.name,
                 "mass": item.mass,
                 "volume": item_volume,
-                "reason": "Expired" if (item.expiry_date and item.expiry_date <= datetime.now(timezone.utc)) 
-                         else "Out of Uses"
+                "reason": "Expired" if _is_expired(item, current_date) else "Out of Uses"
             })
 
-            # Generate retrieval steps if item is currently in a container
-            if item.container_id and item.container_id != request.undockingContainerId:
-                # Get blocking items that need to be moved
-                blocking_items = self._find_blocking_items(db, item)
-                
-                # Add steps to move blocking items
-                for blocking_item in blocking_items:
-                    retrieval_steps.append({
-                        "step": step_counter,
-                        "action": "move",
-                        "itemId": blocking_item.id,
-                        "itemName": blocking_item.name,
-                        "fromContainer": item.container_id,
-                        "toContainer": "temporary"
-                    })
-                    step_counter += 1
-
-                # Add step to move waste item to undocking container
-                retrieval_steps.append({
-                    "step": step_counter,
-                    "action": "move",
-                    "itemId": item.id,
-                    "itemName": item.name,
-                    "fromContainer": item.container_id,
-                    "toContainer": request.undockingContainerId
-                })
-                step_counter += 1
-
-                # Add steps to return blocking items
-                for blocking_item in reversed(blocking_items):
-                    retrieval_steps.append({
-                        "step": step_counter,
-                        "action": "move",
-                        "itemId": blocking_item.id,
-                        "itemName": blocking_item.name,
-                        "fromContainer": "temporary",
-                        "toContainer": item.container_id
-                    })
-                    step_counter += 1
-
-                # Add to return plan
-                return_plan.append({
-                    "step": step_counter,
-                    "itemId": item.id,
-                    "itemName": item.name,
-                    "fromContainer": item.container_id,
-                    "toContainer": request.undockingContainerId,
-                    "mass": item.mass,
-                    "volume": item_volume
-                })
-                step_counter += 1
-
             total_volume += item_volume
             total_weight += item.mass
 
-        manifest = ReturnManifest(
-            undockingContainerId=request.undockingContainerId,
-            undockingDate=request.undockingDate,
+        # Count the targets still waiting in each source container
+        remaining: Dict[str, int] = {}
+        for item in packed:
+            if item.container_id and item.container_id != undocking_container_id:
+                remaining[item.container_id] = remaining.get(item.container_id, 0) + 1
+
+        # Load every source container once; blockers are shared by all targets in it
+        layouts = self.retrieval_planner.load_layouts(
+            db,
+            set(remaining),
+            include=[item for item in packed if item.container_id in remaining]
+        )
+
+        # Every query has run by now; the steps below are computed from memory
+        yield "manifest", ReturnManifest(
+            undockingContainerId=undocking_container_id,
+            undockingDate=request.undocking_date,
             returnItems=return_items,
             totalVolume=total_volume,
-            totalWeight=total_weight
+            totalWeight=total_weight,
+            optimization=optimization["stats"]
         )
 
-        return return_plan, retrieval_steps, manifest
+        step_counter = 1
+        taken_out: Dict[str, set] = {container_id: set() for container_id in remaining}
+        parked: Dict[str, List[Any]] = {container_id: [] for container_id in remaining}
+        staged = set()
+
+        def move(item_id, item_name, from_container, to_container):
+            return {
+                "step": step_counter,
+                "action": "move",
+                "itemId": item_id,
+                "itemName": item_name,
+                "fromContainer": from_container,
+                "toContainer": to_container
+            }
+
+        for item in packed:
+            source = item.container_id
+            if source in remaining and item.itemId not in staged:
+                # Clear whatever is still in front of this item
+                layout = layouts[source]
+                blockers = layout.removal_order(layout.closure(item.itemId) - taken_out[source])
+                for row in blockers:
+                    yield "retrieval", move(row.itemId, row.name, source, "temporary")
+                    step_counter += 1
+                    taken_out[source].add(row.itemId)
+                    if row.itemId in placements:
+                        staged.add(row.itemId)
+                    else:
+                        parked[source].append(row)
+                taken_out[source].add(item.itemId)
+
+            from_container = "temporary" if item.itemId in staged else source
+            placement = placements[item.itemId]
+            yield "retrieval", move(item.itemId, item.name, from_container, undocking_container_id)
+            yield "return", {
+                "step": step_counter,
+                "itemId": item.id,
+                "itemName": item.name,
+                "fromContainer": from_container,
+                "toContainer": undocking_container_id,
+                "mass": item.mass,
+                "volume": item.width * item.depth * item.height,
+                "position": {
+                    "startCoordinates": placement.position.startCoordinates,
+                    "endCoordinates": placement.position.endCoordinates
+                }
+            }
+            step_counter += 1
 
-    def _find_blocking_items(self, db: Session, target_item: Item) -> List[Item]:
-        """Find items that need to be moved to access the target item"""
-        blocking_items = []
-        
-        if not target_item.container_id or not target_item.position:
-            return blocking_items
-
-        # Get all items in the same container
-        container_items = db.query(Item).filter(
-            Item.container_id == target_item.container_id,
-            Item.id != target_item.id,
-            Item.is_waste == False
-        ).all()
-
-        target_pos = target_item.position
-        for item in container_items:
-            if not item.position:
-                continue
-
-            # Check if item blocks access to target
-            if (item.position["startCoordinates"]["depth"] < target_pos["startCoordinates"]["depth"] and
-                self._check_path_blocked(item.position, target_pos)):
-                blocking_items.append(item)
-
-        # Sort by position (items closer to the front first)
-        blocking_items.sort(key=lambda x: x.position["startCoordinates"]["depth"])
-        return blocking_items
-
-    def _check_path_blocked(self, blocking_pos: Dict, target_pos: Dict) -> bool:
-        """Check if an item blocks the retrieval path"""
-        return (blocking_pos["startCoordinates"]["width"] < target_pos["endCoordinates"]["width"] and
-                blocking_pos["endCoordinates"]["width"] > target_pos["startCoordinates"]["width"] and
-                blocking_pos["startCoordinates"]["height"] < target_pos["endCoordinates"]["height"] and
-                blocking_pos["endCoordinates"]["height"] > target_pos["startCoordinates"]["height"])
+            if source in remaining:
+                remaining[source] -= 1
+                if remaining[source] == 0:
+                    # Put the blockers back once every target has left the container
+                    for row in reversed(parked[source]):
+                        yield "retrieval", move(row.itemId, row.name, "temporary", source)
+                        step_counter += 1
 
     def complete_undocking(
         self,
@@ -221,43 +360,61 @@ class WasteManagementService:
         undocking_container_id: str,
         timestamp: datetime
     ) -> bool:
+        started = time.perf_counter()
         try:
-            # Get all waste items in the undocking container
-            items = db.query(Item).filter(
-                Item.container_id == undocking_container_id,
-                Item.is_waste == True
+            # Project only what the manifest totals and log rows need
+            rows = db.execute(
+                select(Item.itemId, Item.mass, Item.width, Item.depth, Item.height).where(
+                    Item.container_id == undocking_container_id,
+                    Item.is_waste == True
+                )
             ).all()
 
-            # Calculate total values for logging
-            total_items = len(items)
-            total_mass = sum(item.mass for item in items)
-            total_volume = sum(item.width * item.depth * item.height for item in items)
-
-            # Delete waste items from database
-            for item in items:
-                # Log undocking disposal
-                self.logging_service.add_log(
-                    db=db,
-                    user_id="system",
-                    action_type="disposal",
-                    item_id=item.id,
-                    details={
-                        "undockingContainerId": undocking_container_id,
-                        "timestamp": timestamp.isoformat(),
-                        "disposalType": "undocking",
-                        "totalItems": total_items,
-                        "totalMass": total_mass,
-                        "totalVolume": total_volume
-                    }
+            total_items = len(rows)
+            total_mass = sum(row.mass for row in rows)
+            total_volume = sum(row.width * row.depth * row.height for row in rows)
+            details = {
+                "undockingContainerId": undocking_container_id,
+                "timestamp": timestamp.isoformat(),
+                "disposalType": "undocking",
+                "totalItems": total_items,
+                "totalMass": total_mass,
+                "totalVolume": total_volume
+            }
+
+            # Log rows, deletion and container clear commit as one transaction
+            self.logging_service.add_logs(
+                db,
+                [
+                    {"user_id": "system", "action_type": "disposal", "item_id": row.itemId, "details": details}
+                    for row in rows
+                ],
+                durable=True
+            )
+            db.execute(
+                delete(Item).where(
+                    Item.container_id == undocking_container_id,
+                    Item.is_waste == True
                 )
-                db.delete(item)
+            )
 
             # Clear container references
-            db.query(Item).filter(
-                Item.container_id == undocking_container_id
-            ).update({"container_id": None, "position": None})
+            db.execute(
+                update(Item)
+                .where(Item.container_id == undocking_container_id)
+                .values(container_id=None, position=None)
+            )
 
+            publish_inventory_change(db, "undocking", container_id=undocking_container_id)
             db.commit()
+
+            elapsed = time.perf_counter() - started
+            metrics.record_timing("undocking", elapsed)
+            metrics.increment("undocking.itemsRemoved", total_items)
+            logger.info(
+                f"Undocked {total_items} waste items ({total_mass:.2f} kg) from "
+                f"{undocking_container_id} in {elapsed * 1000:.1f} ms"
+            )
             return True
             
         except Exception as e:
@@ -1,13 +1,191 @@
 import pandas as pd
+import numpy as np
 import logging
-from typing import List, Dict, Tuple, Optional
+import os
+import threading
+from typing import List, Dict, Tuple, Optional, Any
 from io import StringIO
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ..models import Item, Container
+from .events import publish_inventory_change
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+# Expected arrangement, as written by the export endpoint
+ARRANGEMENT_CSV_PATH = os.getenv("ARRANGEMENT_CSV_PATH", "arrangement.csv")
+
+_COORDINATE_COLUMNS = ["startWidth", "startDepth", "startHeight", "endWidth", "endDepth", "endHeight"]
+_COORDINATE_PATTERN = r"\(\s*([^,()]+),\s*([^,()]+),\s*([^,()]+)\)\s*,\s*\(\s*([^,()]+),\s*([^,()]+),\s*([^,()]+)\)"
+
+def _position_values(position: Dict) -> List[float]:
+    return [
+        float(position["startCoordinates"]["width"]),
+        float(position["startCoordinates"]["depth"]),
+        float(position["startCoordinates"]["height"]),
+        float(position["endCoordinates"]["width"]),
+        float(position["endCoordinates"]["depth"]),
+        float(position["endCoordinates"]["height"])
+    ]
+
+class ArrangementSnapshot:
+    """Expected item arrangement loaded once and indexed by item id.
+
+    The CSV at ``path`` is parsed into a frame keyed by item id. It is
+    reloaded only when the file's modification time changes or when the
+    export endpoint replaces it, so lookups never rescan the file.
+    """
+
+    def __init__(self, path: str = ARRANGEMENT_CSV_PATH, tolerance: float = 0.1):
+        self.path = path
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._frame: Optional[pd.DataFrame] = None
+        self._error: Optional[str] = None
+
+    def replace(self, csv_content: str) -> None:
+        """Persist a freshly exported arrangement and index it"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(csv_content)
+            os.replace(tmp_path, self.path)
+            self._frame, self._error = self._parse(StringIO(csv_content))
+            self._mtime = os.stat(self.path).st_mtime
+
+    def frame(self) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """Return the indexed arrangement, reloading it if the file changed"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                self._frame, self._mtime = None, None
+                return None, "Arrangement CSV file not found"
+
+            if mtime != self._mtime:
+                logger.info(f"Loading arrangement snapshot from {self.path}")
+                self._frame, self._error = self._parse(self.path)
+                self._mtime = mtime
+            return self._frame, self._error
+
+    def verify(self, item_id: str, container_id: str, position: Dict) -> Tuple[bool, Optional[str]]:
+        frame, error = self.frame()
+        if frame is None:
+            return False, error
+
+        if item_id not in frame.index:
+            return False, f"Item {item_id} not found in arrangement CSV"
+        expected = frame.loc[item_id]
+
+        if expected["containerId"] != container_id:
+            return False, f"Container mismatch: expected {expected['containerId']}, found {container_id}"
+
+        coordinates = expected[_COORDINATE_COLUMNS].to_numpy(dtype=float)
+        if np.isnan(coordinates).any():
+            return False, "Invalid coordinate format in CSV"
+
+        try:
+            actual = np.array(_position_values(position))
+        except (KeyError, TypeError, ValueError) as e:
+            return False, f"Invalid position: {str(e)}"
+        if (np.abs(actual - coordinates) > self.tolerance).any():
+            return False, "Position coordinates do not match expected values"
+
+        return True, None
+
+    def verify_bulk(
+        self,
+        placements: List[Tuple[str, str, Optional[Dict]]],
+        container_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Compare many placements with the arrangement in one vectorized pass"""
+        frame, error = self.frame()
+        if frame is None:
+            return {"success": False, "message": error, "checked": 0, "verified": 0, "mismatches": []}
+
+        actual = pd.DataFrame(
+            [
+                [item_id, current_container] + (_position_values(position) if position else [np.nan] * 6)
+                for item_id, current_container, position in placements
+            ],
+            columns=["itemId", "currentContainerId"] + _COORDINATE_COLUMNS
+        ).set_index("itemId")
+
+        expected = frame
+        if container_id:
+            # Items found in the container stay matched even when the CSV puts them elsewhere
+            expected = frame[(frame["containerId"] == container_id) | frame.index.isin(actual.index)]
+
+        joined = actual.join(expected, how="outer", lsuffix="Actual", rsuffix="Expected")
+        actual_coords = joined[[f"{c}Actual" for c in _COORDINATE_COLUMNS]].to_numpy(dtype=float)
+        expected_coords = joined[[f"{c}Expected" for c in _COORDINATE_COLUMNS]].to_numpy(dtype=float)
+
+        not_in_csv = joined["containerId"].isna().to_numpy()
+        not_placed = joined["currentContainerId"].isna().to_numpy()
+        container_mismatch = ~not_in_csv & ~not_placed & (
+            joined["containerId"].to_numpy() != joined["currentContainerId"].to_numpy()
+        )
+        with np.errstate(invalid="ignore"):
+            coordinate_mismatch = ~not_in_csv & ~not_placed & ~container_mismatch & ~(
+                np.abs(actual_coords - expected_coords) <= self.tolerance
+            ).all(axis=1)
+
+        reasons = np.select(
+            [not_in_csv, not_placed, container_mismatch, coordinate_mismatch],
+            ["Not in arrangement CSV", "Not found in container", "Container mismatch", "Position mismatch"],
+            default=""
+        )
+        mismatched = reasons != ""
+        mismatches = [
+            {
+                "itemId": item_id,
+                "reason": reason,
+                "expectedContainer": None if pd.isna(expected_container) else expected_container,
+                "actualContainer": None if pd.isna(actual_container) else actual_container
+            }
+            for item_id, reason, expected_container, actual_container in zip(
+                joined.index[mismatched],
+                reasons[mismatched],
+                joined["containerId"].to_numpy()[mismatched],
+                joined["currentContainerId"].to_numpy()[mismatched]
+            )
+        ]
+
+        return {
+            "success": True,
+            "checked": int(len(joined)),
+            "verified": int((~mismatched).sum()),
+            "mismatches": mismatches
+        }
+
+    def _parse(self, source) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        try:
+            df = pd.read_csv(source, dtype=str)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=["Item ID", "Container ID", "Coordinates"])
+        except Exception as e:
+            logger.error(f"Error loading arrangement CSV: {str(e)}")
+            return None, f"Error verifying arrangement: {str(e)}"
+
+        if not {"Item ID", "Container ID", "Coordinates"}.issubset(df.columns):
+            return None, "Invalid arrangement CSV: expected Item ID, Container ID and Coordinates columns"
+
+        coordinates = df["Coordinates"].str.extract(_COORDINATE_PATTERN)
+        coordinates.columns = _COORDINATE_COLUMNS
+        frame = pd.DataFrame({
+            "itemId": df["Item ID"].str.strip(),
+            "containerId": df["Container ID"].str.strip()
+        })
+        for column in _COORDINATE_COLUMNS:
+            frame[column] = pd.to_numeric(coordinates[column], errors="coerce")
+
+        frame = frame.drop_duplicates("itemId", keep="first").set_index("itemId")
+        return frame, None
+
+arrangement_snapshot = ArrangementSnapshot()
+
 class CSVHandler:
     @staticmethod
     async def import_items(db: Session, file_content: bytes) -> Dict:
@@ -78,6 +256,7 @@ class CSVHandler:
                         })
                         continue
 
+                publish_inventory_change(db, "import_items")
                 db.commit()
                 logger.info(f"Successfully imported {items_imported} items")
 
@@ -148,6 +327,7 @@ class CSVHandler:
                         })
                         continue
 
+                publish_inventory_change(db, "import_containers")
                 db.commit()
                 logger.info(f"Successfully imported {containers_imported} containers")
 
@@ -177,44 +357,19 @@ class CSVHandler:
     @staticmethod
     def verify_arrangement(item_id: str, container_id: str, position: dict) -> Tuple[bool, Optional[str]]:
         """Verify if an item's position matches the arrangement in the CSV file"""
-        try:
-            with open("/home/agnij/Downloads/arrangement_2025-04-04.csv", "r") as f:
-                lines = f.readlines()[1:]  # Skip header
-                for line in lines:
-                    csv_item_id, csv_container_id, coords = line.strip().split(",")
-                    if csv_item_id == item_id:
-                        # Remove quotes and parentheses from coordinates
-                        coords = coords.strip('"()')
-                        try:
-                            start_coords, end_coords = coords.split("),(")
-                            csv_start = tuple(map(float, start_coords.split(",")))
-                            csv_end = tuple(map(float, end_coords.split(",")))
-                            
-                            # Check container match
-                            if csv_container_id != container_id:
-                                return False, f"Container mismatch: expected {csv_container_id}, found {container_id}"
-                            
-                            # Check coordinate matches with tolerance
-                            tolerance = 0.1
-                            if (abs(float(position["startCoordinates"]["width"]) - csv_start[0]) > tolerance or
-                                abs(float(position["startCoordinates"]["depth"]) - csv_start[1]) > tolerance or
-                                abs(float(position["startCoordinates"]["height"]) - csv_start[2]) > tolerance or
-                                abs(float(position["endCoordinates"]["width"]) - csv_end[0]) > tolerance or
-                                abs(float(position["endCoordinates"]["depth"]) - csv_end[1]) > tolerance or
-                                abs(float(position["endCoordinates"]["height"]) - csv_end[2]) > tolerance):
-                                return False, "Position coordinates do not match expected values"
-                            
-                            return True, None
-                        except (ValueError, IndexError) as e:
-                            return False, f"Invalid coordinate format in CSV: {str(e)}"
-                        
-                return False, f"Item {item_id} not found in arrangement CSV"
-            
-        except FileNotFoundError:
-            return False, "Arrangement CSV file not found"
-        except Exception as e:
-            logger.error(f"Error verifying arrangement: {str(e)}")
-            return False, f"Error verifying arrangement: {str(e)}"
+        return arrangement_snapshot.verify(item_id, container_id, position)
+
+    @staticmethod
+    def verify_arrangement_bulk(db: Session, container_id: Optional[str] = None) -> Dict:
+        """Verify every placed item (optionally of one container) against the arrangement CSV"""
+        query = select(Item.itemId, Item.container_id, Item.position).where(Item.container_id.isnot(None))
+        if container_id:
+            query = query.where(Item.container_id == container_id)
+        rows = db.execute(query).all()
+        return arrangement_snapshot.verify_bulk(
+            [(row.itemId, row.container_id, row.position) for row in rows],
+            container_id
+        )
 
     @staticmethod
     def export_arrangement(db: Session) -> str:
@@ -240,5 +395,13 @@ class CSVHandler:
                 })
         
         # Convert to DataFrame and then to CSV
-        df = pd.DataFrame(rows)
-        return df.to_csv(index=False)
\ No newline at end of file
+        df = pd.DataFrame(rows, columns=['Item ID', 'Container ID', 'Coordinates'])
+        csv_content = df.to_csv(index=False)
+
+        # The export becomes the arrangement that retrievals are verified against
+        try:
+            arrangement_snapshot.replace(csv_content)
+        except OSError as e:
+            logger.error(f"Could not save arrangement snapshot: {str(e)}")
+
+        return csv_content
\ No newline at end of file
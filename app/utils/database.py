@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine, inspect
+import os
+import threading
+from typing import Dict
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,8 +19,46 @@ engine = create_engine(
     poolclass=StaticPool  # Use StaticPool for better concurrency in tests
 )
 
+# Seconds a background writer waits for another connection's write lock
+WRITER_BUSY_TIMEOUT_S = float(os.getenv("WRITER_BUSY_TIMEOUT_S", "5"))
+
+def _enable_wal(dbapi_connection, connection_record):
+    # WAL lets the writer's connection commit while the shared one reads
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+event.listen(engine, "connect", _enable_wal)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_writer_engines: Dict[Engine, Engine] = {}
+_writer_engines_lock = threading.Lock()
+
+def writer_engine(bind: Engine) -> Engine:
+    """Engine with connections of its own to the database behind ``bind``.
+
+    Background writers commit through it, so they never commit or roll back a
+    request's transaction on the single connection of a ``StaticPool``. A
+    database that only exists inside that connection (SQLite in memory) has
+    no other way in, and ``bind`` itself is returned.
+    """
+    if not isinstance(bind.pool, (StaticPool, SingletonThreadPool)):
+        return bind
+    database = bind.url.database
+    if not database or database == ":memory:" or "mode=memory" in str(bind.url):
+        return bind
+    with _writer_engines_lock:
+        writer = _writer_engines.get(bind)
+        if writer is None:
+            writer = create_engine(
+                bind.url,
+                connect_args={"check_same_thread": False, "timeout": WRITER_BUSY_TIMEOUT_S}
+            )
+            event.listen(writer, "connect", _enable_wal)
+            _writer_engines[bind] = writer
+        return writer
+
 def get_db() -> Session:
     db = SessionLocal()
     try:
@@ -33,9 +75,27 @@ def init_db():
     logger.info(f"Existing tables: {existing_tables}")
     
     # Create tables if they don't exist
-    if not all(table in existing_tables for table in ['items', 'containers', 'logs']):
-        logger.info("Creating database tables...")
+    missing_tables = [table for table in Base.metadata.tables if table not in existing_tables]
+    if missing_tables:
+        logger.info(f"Creating database tables: {missing_tables}")
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
     else:
-        logger.info("All required tables already exist")
\ No newline at end of file
+        logger.info("All required tables already exist")
+
+    # Add nullable columns introduced after the tables were first created
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info(f"Adding column {table.name}.{column.name}")
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+    # Add indexes introduced after the tables were first created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
\ No newline at end of file
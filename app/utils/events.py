@@ -0,0 +1,61 @@
+from collections import defaultdict
+from typing import Callable, Dict, List
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from ..models import StateCounter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Event fired whenever stored items change location, usage or waste status
+INVENTORY_CHANGED = "inventory_changed"
+
+# Name of the shared counter bumped alongside every inventory change
+INVENTORY_VERSION = "inventory"
+
+class EventBus:
+    """In-process publish/subscribe bus for change notifications"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable]] = defaultdict(list)
+
+    def subscribe(self, event: str, handler: Callable) -> None:
+        self._handlers[event].append(handler)
+
+    def unsubscribe(self, event: str, handler: Callable) -> None:
+        if handler in self._handlers.get(event, []):
+            self._handlers[event].remove(handler)
+
+    def publish(self, event: str, **payload) -> None:
+        for handler in list(self._handlers.get(event, [])):
+            try:
+                handler(**payload)
+            except Exception as e:
+                logger.error(f"Handler for {event} failed: {str(e)}")
+
+event_bus = EventBus()
+
+def bump_version(db: Session, name: str) -> None:
+    """Increment a counter in the caller's transaction.
+
+    The counter lives in the database so that other worker processes see the
+    change once the caller commits.
+    """
+    stmt = insert(StateCounter).values(name=name, value=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StateCounter.name],
+        set_={"value": StateCounter.value + 1}
+    )
+    db.execute(stmt)
+
+def read_version(db: Session, name: str) -> int:
+    value = db.execute(
+        select(StateCounter.value).where(StateCounter.name == name)
+    ).scalar()
+    return value or 0
+
+def publish_inventory_change(db: Session, reason: str, **payload) -> None:
+    """Record an inventory change for this and every other worker"""
+    bump_version(db, INVENTORY_VERSION)
+    event_bus.publish(INVENTORY_CHANGED, reason=reason, **payload)
@@ -0,0 +1,99 @@
+import struct
+from typing import Any, Dict, Optional
+
+# Detail keys stored in typed log columns instead of the JSON blob, in
+# priority order. Bit i of ``Log.promoted`` records that key i was moved to
+# its column, so reads put each value back under its original key.
+PROMOTED_FIELDS = (
+    ("oldContainer", "from_container"),
+    ("previousContainer", "from_container"),
+    ("container", "from_container"),
+    ("containerId", "from_container"),
+    ("undockingContainerId", "from_container"),
+    ("newContainer", "to_container"),
+    ("oldPosition", "from_position"),
+    ("previousPosition", "from_position"),
+    ("position", "from_position"),
+    ("newPosition", "to_position"),
+    ("oldUsesRemaining", "old_uses"),
+    ("newUsesRemaining", "new_uses"),
+    ("usesRemaining", "new_uses"),
+)
+DETAIL_COLUMNS = ("from_container", "to_container", "from_position", "to_position", "old_uses", "new_uses")
+
+_AXES = ("width", "depth", "height")
+_CORNERS = ("startCoordinates", "endCoordinates")
+# Integer coordinates pack into 24 bytes, any others into 48; the size tells them apart
+_INT_POSITION = struct.Struct("<6i")
+_FLOAT_POSITION = struct.Struct("<6d")
+_INT32 = (-2**31, 2**31 - 1)
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def pack_position(position: Dict) -> Optional[bytes]:
+    """Binary form of a start/end coordinates dict, or None if it has any other shape"""
+    if not isinstance(position, dict) or set(position) != set(_CORNERS):
+        return None
+    values = []
+    for corner in _CORNERS:
+        coordinates = position[corner]
+        if not isinstance(coordinates, dict) or set(coordinates) != set(_AXES):
+            return None
+        values += [coordinates[axis] for axis in _AXES]
+    if all(_is_int(value) and _INT32[0] <= value <= _INT32[1] for value in values):
+        return _INT_POSITION.pack(*values)
+    if all(isinstance(value, float) for value in values):
+        return _FLOAT_POSITION.pack(*values)
+    return None
+
+def unpack_position(data: bytes) -> Dict:
+    layout = _INT_POSITION if len(data) == _INT_POSITION.size else _FLOAT_POSITION
+    values = layout.unpack(data)
+    return {
+        corner: dict(zip(_AXES, values[3 * i:3 * i + 3]))
+        for i, corner in enumerate(_CORNERS)
+    }
+
+def _encode(column: str, value: Any) -> Any:
+    """Column value for a detail, or ``...`` when it cannot be stored in that column"""
+    if value is None:
+        return None
+    if column.endswith("_container"):
+        return value if isinstance(value, str) else ...
+    if column.endswith("_position"):
+        packed = pack_position(value)
+        return ... if packed is None else packed
+    return value if _is_int(value) and _INT32[0] <= value <= _INT32[1] else ...
+
+def pack_details(details: Optional[Dict]) -> Dict[str, Any]:
+    """Insert values of a log's details: the typed columns, ``promoted`` and the remaining JSON"""
+    row: Dict[str, Any] = {column: None for column in DETAIL_COLUMNS}
+    promoted = 0
+    remaining = dict(details) if details else {}
+    taken = set()
+    for bit, (key, column) in enumerate(PROMOTED_FIELDS):
+        if key not in remaining or column in taken:
+            continue
+        value = _encode(column, remaining[key])
+        if value is ...:
+            continue
+        row[column] = value
+        promoted |= 1 << bit
+        taken.add(column)
+        del remaining[key]
+    row["promoted"] = promoted
+    row["details"] = remaining or None
+    return row
+
+def unpack_details(log: Any) -> Dict:
+    """The details dict of a log row as it was originally written"""
+    details = dict(log.details or {})
+    promoted = getattr(log, "promoted", None) or 0
+    for bit, (key, column) in enumerate(PROMOTED_FIELDS):
+        if promoted & (1 << bit):
+            value = getattr(log, column)
+            if value is not None and column.endswith("_position"):
+                value = unpack_position(value)
+            details[key] = value
+    return details
@@ -0,0 +1,55 @@
+import threading
+from typing import Any, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MetricsRegistry:
+    """Collects runtime statistics exposed by the metrics endpoint.
+
+    Components either push counters and timings into the registry or register
+    a provider callback that is asked for its current statistics on read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+        self._providers[name] = provider
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record_timing(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(name, {
+                "count": 0,
+                "totalSeconds": 0.0,
+                "maxSeconds": 0.0,
+                "lastSeconds": 0.0
+            })
+            timing["count"] += 1
+            timing["totalSeconds"] += seconds
+            timing["maxSeconds"] = max(timing["maxSeconds"], seconds)
+            timing["lastSeconds"] = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = {
+                "counters": dict(self._counters),
+                "timings": {name: dict(timing) for name, timing in self._timings.items()}
+            }
+
+        for name, provider in self._providers.items():
+            try:
+                result[name] = provider()
+            except Exception as e:
+                logger.error(f"Metrics provider {name} failed: {str(e)}")
+                result[name] = {"error": str(e)}
+        return result
+
+metrics = MetricsRegistry()
@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from sqlalchemy import event
+from .metrics import metrics
+
+class PhaseProfiler:
+    """Wall time and SQL statement counts per named phase of a run.
+
+    While attached to a connection, every statement it executes is counted
+    against the phase that is open at the time, or against ``"other"``.
+    Statements of other connections to the same engine, such as concurrent
+    requests, are not counted.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._current: Optional[str] = None
+        self._connection = None
+        self._started = time.perf_counter()
+
+    def attach(self, connection: Any) -> None:
+        if self._connection is None and connection is not None:
+            self._connection = connection
+            event.listen(connection, "before_cursor_execute", self._count_query)
+
+    def detach(self) -> None:
+        if self._connection is not None:
+            event.remove(self._connection, "before_cursor_execute", self._count_query)
+            self._connection = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        outer = self._current
+        self._current = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self._entry(name)
+            entry["seconds"] += time.perf_counter() - started
+            entry["calls"] += 1
+            self._current = outer
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "totalSeconds": round(time.perf_counter() - self._started, 6),
+            "totalQueries": int(sum(entry["queries"] for entry in self.phases.values())),
+            "phases": {
+                name: {
+                    "seconds": round(entry["seconds"], 6),
+                    "calls": int(entry["calls"]),
+                    "queries": int(entry["queries"])
+                }
+                for name, entry in self.phases.items()
+            }
+        }
+
+    def publish(self) -> None:
+        """Add this run's phases to the metrics registry"""
+        for name, entry in self.phases.items():
+            metrics.record_timing(f"{self.name}.{name}", entry["seconds"])
+            if entry["queries"]:
+                metrics.increment(f"{self.name}.{name}.queries", int(entry["queries"]))
+        metrics.record_timing(self.name, time.perf_counter() - self._started)
+
+    def _entry(self, name: str) -> Dict[str, float]:
+        return self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "queries": 0})
+
+    def _count_query(self, *_) -> None:
+        self._entry(self._current or "other")["queries"] += 1
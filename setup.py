@@ -12,6 +12,7 @@ setup(
         "python-multipart>=0.0.5",
         "aiosqlite>=0.17.0",
         "pandas>=2.0.0",
+        "numpy>=1.24.0",
         "pytest>=7.0.0",
         "httpx>=0.24.0",
     ],
@@ -13,6 +13,7 @@ from app.services.search import SearchService
 from app.services.waste import WasteManagementService
 from app.services.simulation import SimulationService
 from app.schemas import SimulationRequest
+from app.services.log_writer import log_writer
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -41,12 +42,16 @@ def test_db():
     try:
         yield db
     finally:
+        log_writer.flush()  # Write buffered logs before the tables go away
         db.close()
         Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture(scope="function")
-def client(test_db):
+def client(test_db, tmp_path, monkeypatch):
     """Create a test client that shares the test database session"""
+    from app.utils.csv_handler import arrangement_snapshot
+    # Exports write the expected arrangement; keep it out of the working tree
+    monkeypatch.setattr(arrangement_snapshot, "path", str(tmp_path / "arrangement.csv"))
     app.dependency_overrides[get_db] = lambda: test_db
     with TestClient(app) as test_client:
         yield test_client
@@ -249,4 +254,1047 @@ def test_logging(test_db, client):
     assert logs_response.status_code == 200
     logs = logs_response.json()["logs"]
     assert len(logs) > 0
-    assert logs[0]["actionType"] == "retrieval"
\ No newline at end of file
+    assert logs[0]["actionType"] == "retrieval"
+def _position(start, end):
+    keys = ("width", "depth", "height")
+    return {
+        "startCoordinates": dict(zip(keys, start)),
+        "endCoordinates": dict(zip(keys, end))
+    }
+
+def test_log_writer_keeps_out_of_session_transactions(tmp_path, monkeypatch):
+    """Flushing buffered logs never commits changes a session has not committed"""
+    from app.models import Log
+    from app.services.log_writer import LogWriter
+    from app.utils import database
+    from app.utils.log_details import pack_details
+
+    monkeypatch.setattr(database, "WRITER_BUSY_TIMEOUT_S", 0.1)
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'station.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=file_engine)
+    db = sessionmaker(bind=file_engine)()
+    writer = LogWriter()
+    try:
+        db.add(Item(itemId="001", name="Oxygen", width=10, depth=10, height=20, mass=5,
+                    priority=80, preferred_zone="Crew"))
+        db.flush()
+        writer.enqueue(file_engine, {
+            "timestamp": datetime.now(timezone.utc), "user_id": "crew", "action_type": "retrieval",
+            "item_id": "001", **pack_details(None)
+        })
+        # The session holds the write lock, so the row waits in the queue
+        assert writer.flush() == 0
+        assert writer.pending() == 1
+
+        db.rollback()
+        assert writer.flush() == 1
+        assert db.query(Item).count() == 0
+        assert db.query(Log).count() == 1
+    finally:
+        db.close()
+        database.writer_engine(file_engine).dispose()
+        file_engine.dispose()
+
+def test_search_uses_projected_rows(test_db):
+    """Search returns the container zone and blockers from projected rows"""
+    test_db.add(Container(id="contA", zone="Crew Quarters", width=100, depth=85, height=200))
+    test_db.add_all([
+        Item(itemId="001", name="Oxygen", width=10, depth=10, height=20, mass=5,
+             priority=90, preferred_zone="Crew Quarters", container_id="contA",
+             position=_position((0, 10, 0), (10, 20, 20)), is_waste=False),
+        Item(itemId="002", name="Food", width=10, depth=10, height=20, mass=3,
+             priority=50, preferred_zone="Crew Quarters", container_id="contA",
+             position=_position((0, 0, 0), (10, 10, 20)), is_waste=False)
+    ])
+    test_db.commit()
+
+    result = SearchService().search_item(test_db, item_id="001")
+    assert result["found"] is True
+    assert result["item"]["zone"] == "Crew Quarters"
+    assert result["totalItems"] == 2
+    assert [step.action for step in result["retrievalSteps"]] == ["remove", "retrieve", "place"]
+    assert result["retrievalSteps"][0].item_id == "002"
+
+    listed = SearchService().list_container_items(test_db, "contA")
+    assert {item["itemId"] for item in listed} == {"001", "002"}
+
+def test_search_cache_invalidation(test_db):
+    """Cached searches are dropped on local events and on version bumps from other workers"""
+    from app.services.search_cache import SearchCache
+    from app.utils.events import bump_version, INVENTORY_VERSION
+
+    test_db.add(Container(id="contA", zone="Crew Quarters", width=100, depth=85, height=200))
+    test_db.add(Item(itemId="001", name="Oxygen", width=10, depth=10, height=20, mass=5,
+                     priority=90, preferred_zone="Crew Quarters", is_waste=False))
+    test_db.commit()
+
+    cache = SearchCache(max_size=8)
+    service = SearchService(cache=cache)
+
+    first = service.search_item(test_db, item_id="001")
+    assert service.search_item(test_db, item_id="001") is first
+    assert cache.stats()["hits"] == 1
+
+    # A mutation in this process publishes a change event
+    from app.utils.events import event_bus, INVENTORY_CHANGED
+    event_bus.subscribe(INVENTORY_CHANGED, cache.invalidate)
+    try:
+        service.update_item_location(
+            test_db, "001", "crew", "contA",
+            _position((0, 0, 0), (10, 10, 20)), datetime.now(timezone.utc)
+        )
+        moved = service.search_item(test_db, item_id="001")
+        assert moved is not first
+        assert moved["item"]["containerId"] == "contA"
+    finally:
+        event_bus.unsubscribe(INVENTORY_CHANGED, cache.invalidate)
+
+    # Another worker only bumps the shared version counter
+    bump_version(test_db, INVENTORY_VERSION)
+    test_db.commit()
+    assert service.search_item(test_db, item_id="001") is not moved
+    assert cache.stats()["misses"] == 3
+
+def test_retrieval_session_shares_blockers(test_db):
+    """Targets in one container are retrieved in a single pass with shared blockers"""
+    from app.services.retrieval import RetrievalSessionService
+    from app.schemas import RetrievalSessionRequest
+
+    test_db.add(Container(id="contA", zone="Crew Quarters", width=100, depth=85, height=200))
+    rows = [
+        ("001", "Oxygen", (0, 20, 0), (10, 30, 20), 5),
+        ("002", "Food", (0, 10, 0), (10, 20, 20), 3),
+        ("003", "Water", (0, 0, 0), (10, 10, 20), 8),
+        ("004", "Food", (20, 0, 0), (30, 10, 20), 3),
+    ]
+    for item_id, name, start, end, mass in rows:
+        test_db.add(Item(itemId=item_id, name=name, width=10, depth=10, height=20, mass=mass,
+                         priority=50, preferred_zone="Crew Quarters", container_id="contA",
+                         position=_position(start, end), is_waste=False))
+    test_db.commit()
+
+    plan = RetrievalSessionService().plan_session(test_db, RetrievalSessionRequest(
+        targets=[{"itemId": "001"}, {"itemName": "Food"}]
+    ))
+
+    # Food 002 is already in the way of the oxygen, so it is picked over 004
+    assert sorted(plan.retrieved_items) == ["001", "002"]
+    assert [(step.action, step.item_id) for step in plan.steps] == [
+        ("remove", "003"), ("retrieve", "002"), ("retrieve", "001"), ("place", "003")
+    ]
+    assert plan.container_order == ["contA"]
+    assert plan.moved_mass == 5 + 3 + 2 * 8
+
+    # A repeated item id is retrieved once and never reported as an unresolved name
+    plan = RetrievalSessionService().plan_session(test_db, RetrievalSessionRequest(
+        targets=[{"itemId": "001"}, {"itemId": "001"}]
+    ))
+    assert plan.retrieved_items == ["001"]
+    assert plan.unresolved_targets == []
+
+def test_arrangement_snapshot(tmp_path):
+    """The arrangement CSV is indexed once, reloaded on change and verified in bulk"""
+    import os
+    from app.utils.csv_handler import ArrangementSnapshot
+
+    path = tmp_path / "arrangement.csv"
+    snapshot = ArrangementSnapshot(path=str(path))
+    assert snapshot.verify("001", "contA", _position((0, 0, 0), (10, 10, 20))) == (
+        False, "Arrangement CSV file not found"
+    )
+
+    snapshot.replace(
+        'Item ID,Container ID,Coordinates\n'
+        '001,contA,"(0,0,0),(10,10,20)"\n'
+        '002,contA,"(10,0,0),(20,10,20)"\n'
+        '004,contB,"(0,0,0),(5,5,5)"\n'
+    )
+    assert snapshot.verify("001", "contA", _position((0, 0, 0), (10, 10, 20))) == (True, None)
+    assert snapshot.verify("001", "contB", _position((0, 0, 0), (10, 10, 20)))[0] is False
+    assert snapshot.verify("002", "contA", _position((0, 0, 0), (10, 10, 20)))[1] == \
+        "Position coordinates do not match expected values"
+
+    report = snapshot.verify_bulk([
+        ("001", "contA", _position((0, 0, 0), (10, 10, 20))),
+        ("003", "contA", _position((30, 0, 0), (40, 10, 20))),
+        ("004", "contA", _position((0, 0, 0), (5, 5, 5)))
+    ], "contA")
+    assert report["checked"] == 4
+    assert report["verified"] == 1
+    assert {m["itemId"]: m["reason"] for m in report["mismatches"]} == {
+        "002": "Not found in container",
+        "003": "Not in arrangement CSV",
+        "004": "Container mismatch"
+    }
+
+    # Editing the file on disk is picked up through its modification time
+    path.write_text('Item ID,Container ID,Coordinates\n002,contB,"(0,0,0),(1,1,1)"\n')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    assert snapshot.verify("001", "contA", _position((0, 0, 0), (10, 10, 20)))[1] == \
+        "Item 001 not found in arrangement CSV"
+
+def test_return_plan_optimizes_manifest(test_db):
+    """The return manifest fills the weight limit better than a greedy pass and respects geometry"""
+    from app.schemas import ReturnPlanRequest
+
+    test_db.add(Container(id="contU", zone="Airlock", width=10, depth=10, height=10))
+    waste = [
+        ("001", 6, (5, 5, 5), 90),
+        ("002", 5, (5, 5, 5), 50),
+        ("003", 5, (5, 5, 5), 50),
+        ("004", 1, (1, 1, 20), 99),  # Too long for the container in any rotation
+    ]
+    for item_id, mass, (w, d, h), priority in waste:
+        test_db.add(Item(itemId=item_id, name=f"Waste {item_id}", width=w, depth=d, height=h,
+                         mass=mass, priority=priority, preferred_zone="Airlock", is_waste=True))
+    test_db.commit()
+
+    plan, steps, manifest = WasteManagementService().plan_waste_return(test_db, ReturnPlanRequest(
+        undockingContainerId="contU",
+        undockingDate=datetime.now(timezone.utc),
+        maxWeight=10
+    ))
+    assert sorted(item["itemId"] for item in manifest.return_items) == ["002", "003"]
+    assert manifest.total_weight == 10
+    assert manifest.optimization["optimal"] is True
+
+def test_return_optimizer_scales(test_db):
+    """Thousands of candidates are handled within the time budget"""
+    import random
+    from types import SimpleNamespace
+    from app.services.return_optimizer import ReturnManifestOptimizer
+
+    rng = random.Random(7)
+    items = [
+        SimpleNamespace(itemId=f"{i:05d}", mass=rng.uniform(0.5, 20), width=rng.uniform(1, 10),
+                        depth=rng.uniform(1, 10), height=rng.uniform(1, 10))
+        for i in range(3000)
+    ]
+    chosen, optimal, nodes = ReturnManifestOptimizer().select(items, 500, 50000, time_budget=1.0)
+    assert nodes > 0
+    assert sum(item.mass for item in chosen) <= 500
+    assert sum(item.mass for item in chosen) > 490
+
+def test_return_optimizer_packs_thousands_within_budget(test_db):
+    """Thousands of selected items are packed without overlaps, and packing stops at the deadline"""
+    import random
+    from types import SimpleNamespace
+    import numpy as np
+    from app.services.return_optimizer import ReturnManifestOptimizer
+
+    rng = random.Random(11)
+    items = [
+        SimpleNamespace(itemId=f"{i:05d}", mass=rng.uniform(0.5, 20), width=rng.uniform(1, 10),
+                        depth=rng.uniform(1, 10), height=rng.uniform(1, 10))
+        for i in range(2000)
+    ]
+    container = SimpleNamespace(id="contA", width=100, depth=100, height=100)
+    chosen, result = ReturnManifestOptimizer().optimize(items, container, 1e9, time_budget_ms=120000)
+    assert result["stats"]["packingTimedOut"] is False
+    assert len(chosen) == len(result["placements"]) > 1900
+
+    boxes = [placement.position for placement in result["placements"].values()]
+    start = np.array([[p.start_coordinates.width, p.start_coordinates.depth, p.start_coordinates.height] for p in boxes])
+    end = np.array([[p.end_coordinates.width, p.end_coordinates.depth, p.end_coordinates.height] for p in boxes])
+    assert (start >= 0).all() and (end <= 100 + 1e-9).all()
+    for i in range(len(boxes)):
+        overlap = ((start[i] < end[i + 1:] - 1e-9) & (start[i + 1:] < end[i] - 1e-9)).all(axis=1)
+        assert not overlap.any()
+
+    # Items skipped at the deadline are neither placed nor excluded by geometry
+    chosen, result = ReturnManifestOptimizer().optimize(items, container, 1e9, time_budget_ms=1)
+    assert result["stats"]["packingTimedOut"] is True and result["stats"]["optimal"] is False
+    assert result["stats"]["excludedByGeometry"] == []
+    assert len(chosen) == len(result["placements"]) < len(items)
+
+def test_return_plan_batches_blockers(test_db):
+    """Waste items sharing a container clear their common blocker once"""
+    from app.schemas import ReturnPlanRequest
+
+    test_db.add(Container(id="contA", zone="Storage", width=100, depth=85, height=200))
+    test_db.add(Container(id="contU", zone="Airlock", width=100, depth=100, height=100))
+    rows = [
+        ("001", (0, 0, 0), (30, 10, 20), False),   # Active item in front of both waste items
+        ("002", (0, 10, 0), (10, 20, 20), True),
+        ("003", (20, 10, 0), (30, 20, 20), True),
+    ]
+    for item_id, start, end, is_waste in rows:
+        test_db.add(Item(itemId=item_id, name=f"Item {item_id}", width=end[0] - start[0],
+                         depth=end[1] - start[1], height=end[2] - start[2], mass=2, priority=50,
+                         preferred_zone="Storage", container_id="contA",
+                         position=_position(start, end), is_waste=is_waste))
+    test_db.commit()
+
+    plan, steps, manifest = WasteManagementService().plan_waste_return(test_db, ReturnPlanRequest(
+        undockingContainerId="contU",
+        undockingDate=datetime.now(timezone.utc),
+        maxWeight=100
+    ))
+    assert [(step["itemId"], step["toContainer"]) for step in steps] == [
+        ("001", "temporary"), ("002", "contU"), ("003", "contU"), ("001", "contA")
+    ]
+    assert [entry["step"] for entry in plan] == [2, 3]
+
+def test_incremental_waste_detection(test_db):
+    """Expired and used-up items are flagged once, using the expiry index between scans"""
+    from app.models import Log
+    from app.services.expiry import ExpiryIndex
+
+    past = datetime.now(timezone.utc) - timedelta(days=1)
+    future = datetime.now(timezone.utc) + timedelta(days=30)
+    test_db.add_all([
+        Item(itemId="001", name="Old Food", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", expiry_date=past, is_waste=False),
+        Item(itemId="002", name="Fresh Food", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", expiry_date=future, is_waste=False),
+        Item(itemId="003", name="Empty Tank", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", usage_limit=5, uses_remaining=0, is_waste=False),
+    ])
+    test_db.commit()
+
+    index = ExpiryIndex()
+    service = WasteManagementService(expiry_index=index)
+
+    waste = service.identify_waste_items(test_db)
+    assert {item.itemId: item.reason for item in waste} == {"001": "Expired", "003": "Out of Uses"}
+    assert test_db.query(Log).filter(Log.action_type == "disposal").count() == 2
+    assert index.next_expiry() is not None
+
+    # Our own waste marking does not force the index to be rebuilt
+    assert service.identify_waste_items(test_db) == []
+    assert index.rebuilds == 1
+    assert test_db.query(Item).filter(Item.is_waste == True).count() == 2
+
+def test_expiry_index_is_shared_across_engines(tmp_path):
+    """Scans through the request engine and the scheduler's writer engine reuse one heap"""
+    from app.services.expiry import ExpiryIndex
+    from app.utils.database import writer_engine
+
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'station.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=file_engine)
+    with Session(bind=file_engine) as db:
+        db.add(Item(itemId="001", name="Old Food", width=1, depth=1, height=1, mass=1, priority=1,
+                    preferred_zone="A", expiry_date=datetime.now(timezone.utc) - timedelta(days=1),
+                    is_waste=False))
+        db.commit()
+
+    index = ExpiryIndex()
+    service = WasteManagementService(expiry_index=index)
+    flagged = []
+    try:
+        for bind in (file_engine, writer_engine(file_engine)) * 4:
+            with Session(bind=bind) as db:
+                flagged += [item.itemId for item in service.identify_waste_items(db)]
+        assert flagged == ["001"]
+        assert index.rebuilds == 1
+    finally:
+        writer_engine(file_engine).dispose()
+        file_engine.dispose()
+
+def test_failed_waste_scan_keeps_expired_items(test_db, monkeypatch):
+    """A scan that fails after popping the expiry index finds the same items next time"""
+    from app.services.expiry import ExpiryIndex
+
+    test_db.add(Item(itemId="001", name="Old Food", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", expiry_date=datetime.now(timezone.utc) - timedelta(days=1),
+                     is_waste=False))
+    test_db.commit()
+
+    service = WasteManagementService(expiry_index=ExpiryIndex())
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(service.logging_service, "add_logs", fail)
+    with pytest.raises(RuntimeError):
+        service.identify_waste_items(test_db)
+    test_db.rollback()
+    monkeypatch.undo()
+
+    assert [item.itemId for item in service.identify_waste_items(test_db)] == ["001"]
+
+def test_scheduled_waste_sweep_is_single_flight(test_db):
+    """Only the worker holding the lease runs a sweep; the sweep flags new waste"""
+    from app.services.scheduler import Scheduler, PeriodicJob, acquire_lease, release_lease, _sweep_waste
+
+    test_db.add(Item(itemId="001", name="Old Food", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", expiry_date=datetime.now(timezone.utc) - timedelta(days=1),
+                     is_waste=False))
+    test_db.commit()
+
+    worker = Scheduler(session_factory=TestingSessionLocal, owner="worker-1")
+    job = PeriodicJob("wasteScan", 60, _sweep_waste)
+    worker.add_job(job)
+
+    # Another worker holds the lease, so this one skips the sweep
+    assert acquire_lease(test_db, "wasteScan", "worker-2", 60)
+    assert worker.run_job(job) is None
+    release_lease(test_db, "wasteScan", "worker-2")
+
+    assert worker.run_job(job) == {"itemsFlagged": 1}
+    # The lease outlives the sweep, so other workers wait out the interval
+    other = Scheduler(session_factory=TestingSessionLocal, owner="worker-2")
+    assert other.run_job(job) is None
+    assert worker.run_job(job) == {"itemsFlagged": 0}
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.is_waste == True).count() == 1
+    assert worker.status()["wasteScan"]["lastResult"] == {"itemsFlagged": 0}
+
+def test_bulk_undocking(test_db):
+    """Undocking removes the container's waste in one transaction and logs every item"""
+    from app.models import Log
+    from app.utils.metrics import metrics
+
+    test_db.add(Container(id="U1", zone="Airlock", width=100, depth=100, height=100))
+    test_db.add_all([
+        Item(itemId=f"{i:03d}", name=f"Waste {i}", width=1, depth=1, height=1, mass=2, priority=1,
+             preferred_zone="Airlock", container_id="U1", position=_position((0, 0, 0), (1, 1, 1)),
+             is_waste=True)
+        for i in range(300)
+    ])
+    test_db.add(Item(itemId="999", name="Strap", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="Airlock", container_id="U1", is_waste=False))
+    test_db.commit()
+
+    service = WasteManagementService()
+    assert service.complete_undocking(test_db, "U1", datetime.now(timezone.utc))
+
+    assert test_db.query(Item).filter(Item.is_waste == True).count() == 0
+    strap = test_db.query(Item).filter(Item.itemId == "999").one()
+    assert strap.container_id is None
+    logs = test_db.query(Log).filter(Log.action_type == "disposal").all()
+    assert len(logs) == 300
+    assert logs[0].details["totalMass"] == 600
+    assert metrics.snapshot()["timings"]["undocking"]["count"] >= 1
+
+def test_return_plan_packs_heaviest_first(test_db, client):
+    """Items are moved in packing order with coordinates, staging targets that block heavier ones"""
+    import json
+
+    test_db.add(Container(id="contA", zone="Storage", width=100, depth=85, height=200))
+    test_db.add(Container(id="contU", zone="Airlock", width=20, depth=20, height=20))
+    rows = [
+        ("002", (0, 10, 0), (10, 20, 10), 9),  # Heavy, behind the light one
+        ("003", (0, 0, 0), (10, 10, 10), 1),
+    ]
+    for item_id, start, end, mass in rows:
+        test_db.add(Item(itemId=item_id, name=f"Item {item_id}", width=10, depth=10, height=10,
+                         mass=mass, priority=50, preferred_zone="Storage", container_id="contA",
+                         position=_position(start, end), is_waste=True))
+    test_db.commit()
+
+    response = client.post("/api/waste/return-plan/stream", json={
+        "undockingContainerId": "contU",
+        "undockingDate": datetime.now(timezone.utc).isoformat(),
+        "maxWeight": 100
+    })
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[0]["type"] == "manifest"
+    assert [item["itemId"] for item in records[0]["returnItems"]] == ["002", "003"]
+
+    moves = [(r["itemId"], r["fromContainer"], r["toContainer"]) for r in records if r["type"] == "retrieval"]
+    assert moves == [("003", "contA", "temporary"), ("002", "contA", "contU"), ("003", "temporary", "contU")]
+
+    returns = [r for r in records if r["type"] == "return"]
+    assert [(r["itemId"], r["step"]) for r in returns] == [("002", 2), ("003", 3)]
+    assert returns[0]["position"]["startCoordinates"] == {"width": 0, "depth": 0, "height": 0}
+    assert returns[1]["position"]["startCoordinates"] != returns[0]["position"]["startCoordinates"]
+
+def test_waste_listing_pages_and_streams(test_db, client):
+    """Waste can be paged with a cursor or streamed, with null positions for unplaced items"""
+    import json
+
+    test_db.add_all([
+        Item(itemId=f"{i:03d}", name=f"Waste {i}", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", usage_limit=1, uses_remaining=0, is_waste=True)
+        for i in range(25)
+    ])
+    test_db.add(Item(itemId="999", name="Active", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", is_waste=False))
+    test_db.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/waste/items", params=params).json()
+        seen.extend(item["itemId"] for item in page["wasteItems"])
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == [f"{i:03d}" for i in range(25)]
+    assert page["wasteItems"][0]["position"] is None
+    assert page["wasteItems"][0]["reason"] == "Out of Uses"
+
+    response = client.get("/api/waste/items/stream")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["itemId"] for record in records] == seen
+
+def test_waste_listing_includes_positions_of_placed_items(test_db, client):
+    """Placed waste items are listed and streamed with their position"""
+    import json
+    test_db.add(Container(id="contA", zone="A", width=10, depth=10, height=10))
+    test_db.add(Item(itemId="001", name="Waste", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=1, uses_remaining=0, is_waste=True,
+                     container_id="contA", position=_position((0, 0, 0), (1, 2, 3))))
+    test_db.commit()
+
+    response = client.get("/api/waste/items")
+    assert response.status_code == 200
+    item = response.json()["wasteItems"][0]
+    assert item["containerId"] == "contA"
+    assert item["position"]["end_coordinates"] == {"width": 1, "depth": 2, "height": 3}
+
+    record = json.loads(client.get("/api/waste/items/stream").text.splitlines()[0])
+    assert record["position"] == item["position"]
+
+def test_event_driven_simulation(test_db):
+    """A year of simulated days runs from one state load and matches day-by-day semantics"""
+    now = datetime.now(timezone.utc)
+    test_db.add_all([
+        Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", usage_limit=3, uses_remaining=3, is_waste=False),
+        Item(itemId="002", name="Ration", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", expiry_date=now + timedelta(days=10, hours=1), is_waste=False),
+        Item(itemId="003", name="Spare", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", is_waste=False),
+    ])
+    test_db.commit()
+
+    result = SimulationService().simulate_time(test_db, SimulationRequest(
+        numOfDays=365,
+        itemsToBeUsedPerDay=[{"itemId": "001"}],
+        profile=True
+    ))
+    # The query count does not grow with the number of days
+    assert result.profile["phases"]["load"]["calls"] == 1
+    assert result.profile["totalQueries"] < 30
+
+    changes = result.changes
+    assert len(changes.dailyReports) == 365
+    assert changes.totalItemsUsed == 3
+    assert [report.items[0]["status"] for report in changes.dailyReports[:3]] == ["Active", "Active", "Depleted"]
+    assert changes.dailyReports[11].items[0]["status"] == "Expired"
+    assert changes.totalItemsExpired == 1
+
+    test_db.expire_all()
+    waste = {item.itemId for item in test_db.query(Item).filter(Item.is_waste == True)}
+    assert waste == {"001", "002"}
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 0
+
+def test_simulation_kernel_matches_daily_loop():
+    """Array-based days give the same state as applying every usage entry one by one"""
+    import random
+    import numpy as np
+    from app.services.simulation_kernel import SimulationKernel
+
+    rng = random.Random(3)
+    count = 200
+    uses = [rng.randint(0, 20) for _ in range(count)]
+    limited = [rng.random() < 0.8 for _ in range(count)]
+    expiry = [rng.choice([np.inf, rng.randint(0, 40)]) for _ in range(count)]
+    usage = [f"{rng.randrange(count):03d}" for _ in range(150)]
+
+    kernel = SimulationKernel([f"{i:03d}" for i in range(count)], uses, limited, expiry, [False] * count)
+    list(kernel.run(30, kernel.usage_counts(usage)))
+
+    expected_uses, expected_waste = list(uses), [False] * count
+    for day in range(30):
+        for item_id in usage:
+            i = int(item_id)
+            if not expected_waste[i] and limited[i] and expected_uses[i] > 0:
+                expected_uses[i] -= 1
+                expected_waste[i] = expected_uses[i] == 0
+        for i in range(count):
+            if not expected_waste[i] and expiry[i] <= day:
+                expected_waste[i] = True
+
+    assert kernel.uses.tolist() == expected_uses
+    assert kernel.waste.tolist() == expected_waste
+
+def test_dry_run_simulation_uses_snapshot(test_db, client):
+    """What-if runs share one snapshot, run concurrently and leave the inventory untouched"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services.inventory_snapshot import SnapshotCache
+
+    now = datetime.now(timezone.utc)
+    test_db.add_all([
+        Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", usage_limit=3, uses_remaining=3, is_waste=False),
+        Item(itemId="002", name="Ration", width=1, depth=1, height=1, mass=1, priority=1,
+             preferred_zone="A", expiry_date=now + timedelta(days=5, hours=1), is_waste=False),
+    ])
+    test_db.commit()
+
+    cache = SnapshotCache()
+    service = SimulationService()
+    request = SimulationRequest(numOfDays=90, itemsToBeUsedPerDay=[{"itemId": "001"}], dryRun=True)
+    snapshot = cache.get(test_db)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: service.project(cache.get(test_db), request), range(4)))
+
+    assert cache.builds == 1
+    assert snapshot.uses.tolist() == [3, 0]  # The base rows are never written
+    for result in results:
+        assert result.dryRun is True
+        assert result.changes.totalItemsUsed == 3
+        assert result.changes.totalItemsDepleted == 1
+        assert result.changes.totalItemsExpired == 1
+
+    response = client.post("/api/simulate/day", json={
+        "numOfDays": 90, "itemsToBeUsedPerDay": [{"itemId": "001"}], "dryRun": True
+    })
+    assert response.status_code == 200
+    assert response.json()["changes"]["totalItemsUsed"] == 3
+
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.is_waste == True).count() == 0
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 3
+
+def test_monte_carlo_forecast(test_db, client):
+    """Forecasts are reproducible for a seed whether chunks run in-process or in a pool"""
+    from app.schemas import ForecastRequest
+    from app.services.forecast import ForecastService
+    from app.services.inventory_snapshot import SnapshotCache
+
+    now = datetime.now(timezone.utc)
+    test_db.add_all([
+        Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=2, priority=1,
+             preferred_zone="A", usage_limit=20, uses_remaining=20, is_waste=False),
+        Item(itemId="002", name="Ration", width=1, depth=1, height=1, mass=5, priority=1,
+             preferred_zone="A", expiry_date=now + timedelta(days=10, hours=1), is_waste=False),
+    ])
+    test_db.commit()
+
+    snapshot = SnapshotCache().get(test_db)
+    request = ForecastRequest(numOfDays=60, usageRates=[{"itemId": "001", "ratePerDay": 2}], trials=600, seed=42)
+    inline = ForecastService(workers=1, chunk_trials=100).forecast(snapshot, request)
+    pool = ForecastService(workers=2, chunk_trials=100)
+    try:
+        pooled = pool.forecast(snapshot, request)
+    finally:
+        pool.shutdown()
+
+    def day_offsets(result):
+        return [
+            {key: (datetime.fromisoformat(value) - result.startDate).days if value else None
+             for key, value in {**item["depletionDate"], **item["expiryDate"]}.items()}
+            for item in result.items
+        ]
+
+    assert day_offsets(inline) == day_offsets(pooled)
+    assert inline.weeklyWasteMass == pooled.weeklyWasteMass
+
+    wipes, ration = inline.items
+    assert wipes["depletionProbability"] == 1.0
+    # About 10 days at two uses a day
+    p50 = datetime.fromisoformat(wipes["depletionDate"]["p50"])
+    assert 7 <= (p50 - now).days <= 13
+    assert ration["expiryProbability"] == 1.0
+    assert sum(week["mean"] for week in inline.weeklyWasteMass) == 7
+
+    response = client.post("/api/simulate/forecast", json={
+        "numOfDays": 30, "usageRates": [{"itemId": "001", "ratePerDay": 1}], "trials": 50, "seed": 1
+    })
+    assert response.status_code == 200
+    assert response.json()["items"][0]["itemId"] == "001"
+
+def test_forecast_percentiles_from_day_histograms():
+    """Chunks return per-item day histograms whose percentiles match numpy's inverted_cdf"""
+    import numpy as np
+    from app.services.forecast import _day_histogram, _percentile_days
+
+    rng = np.random.default_rng(3)
+    days = rng.integers(0, 31, size=(1234, 4)).astype(np.int32)
+    histogram = _day_histogram(days, 30)
+    assert histogram.shape == (4, 31) and histogram.sum() == days.size
+    percentiles = [0, 10, 33.3, 50, 90, 100]
+    for i in range(4):
+        expected = np.percentile(days[:, i], percentiles, method="inverted_cdf")
+        assert _percentile_days(histogram[i], percentiles).tolist() == expected.tolist()
+
+def test_simulation_clock_checkpoints(test_db, client):
+    """Runs resume from the simulated clock, advance to a timestamp and roll back by delta"""
+    service = SimulationService()
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=10, uses_remaining=10, is_waste=False))
+    test_db.commit()
+    usage = [{"itemId": "001"}]
+
+    first = service.simulate_time(test_db, SimulationRequest(numOfDays=3, itemsToBeUsedPerDay=usage))
+    assert service.current_time(test_db) == first.newDate
+
+    # The second run starts where the first stopped and simulates the whole days up to the target
+    target = first.newDate + timedelta(days=2, hours=12)
+    second = service.simulate_time(test_db, SimulationRequest(toTimestamp=target, itemsToBeUsedPerDay=usage))
+    assert second.changes.dailyReports[0].date == first.newDate.isoformat()
+    assert len(second.changes.dailyReports) == 2
+    assert second.newDate == first.newDate + timedelta(days=2)
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 5
+
+    clock = client.get("/api/simulation/clock").json()
+    assert [c["checkpointId"] for c in clock["checkpoints"]] == [first.checkpointId, second.checkpointId]
+
+    response = client.post("/api/simulation/rollback", params={"checkpointId": first.checkpointId})
+    assert response.status_code == 200
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 7
+    assert service.current_time(test_db) == first.newDate
+
+    service.rollback(test_db)
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 10
+    assert service.list_checkpoints(test_db) == []
+
+def test_simulation_advances_in_part_day_steps(test_db):
+    """Part-day targets use items once per whole simulated day"""
+    service = SimulationService()
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=10, uses_remaining=10, is_waste=False))
+    test_db.commit()
+    usage = [{"itemId": "001"}]
+
+    # Pin the clock first; without a checkpoint it follows the wall clock
+    start = service.simulate_time(test_db, SimulationRequest(numOfDays=1, itemsToBeUsedPerDay=usage)).newDate
+    for step in range(1, 6):
+        service.simulate_time(test_db, SimulationRequest(
+            toTimestamp=start + step * timedelta(hours=6), itemsToBeUsedPerDay=usage
+        ))
+    assert service.current_time(test_db) == start + timedelta(days=1)
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.itemId == "001").one().uses_remaining == 8
+
+def test_streamed_simulation(test_db, client):
+    """The stream emits per-day changes and a summary, and commits the run"""
+    import json
+
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=2, uses_remaining=2, is_waste=False))
+    test_db.commit()
+
+    response = client.post("/api/simulate/stream", json={
+        "numOfDays": 4, "itemsToBeUsedPerDay": [{"itemId": "001"}]
+    })
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    days, summary = records[:-1], records[-1]
+
+    assert [record["day"] for record in days] == [1, 2, 3, 4]
+    # Each day carries only its own changes
+    assert [len(record["itemsUsedToday"]) for record in days] == [1, 1, 0, 0]
+    assert days[1]["itemsDepletedToday"] == [{"itemId": "001", "name": "Wipes"}]
+    assert summary["type"] == "summary"
+    assert summary["totalItemsUsed"] == 2 and summary["totalItemsDepleted"] == 1
+    assert summary["checkpointId"] is not None
+
+    test_db.expire_all()
+    assert test_db.query(Item).filter(Item.itemId == "001").one().is_waste is True
+
+def test_streamed_simulation_writes_nothing_until_the_end(test_db, monkeypatch):
+    """Log batches are spooled while days stream, so no insert is pending between records"""
+    from app.models import Log
+    from app.services import simulation
+
+    monkeypatch.setattr(simulation, "SIMULATION_LOG_BATCH", 1)
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=5, uses_remaining=5, is_waste=False))
+    test_db.commit()
+
+    request = SimulationRequest(numOfDays=3, itemsToBeUsedPerDay=[{"itemId": "001"}])
+    records = SimulationService().iter_simulation(test_db, request)
+    for _ in range(3):
+        next(records)
+        assert not test_db.new and test_db.query(Log).count() == 0
+    records.close()
+    assert test_db.query(Log).count() == 0
+
+    summary = list(SimulationService().iter_simulation(test_db, request))[-1]
+    assert summary["totalItemsUsed"] == 3
+    assert test_db.query(Log).filter(Log.action_type == "retrieval").count() == 3
+
+def test_simulation_aggregates_usage_and_reports_unknown_items(test_db):
+    """Repeated usages of an item count once per day and unknown ids are reported once"""
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=5, uses_remaining=5, is_waste=False))
+    test_db.commit()
+
+    result = SimulationService().simulate_time(test_db, SimulationRequest(
+        numOfDays=3,
+        itemsToBeUsedPerDay=[{"itemId": "001"}, {"itemId": "404"}, {"itemId": "001"}, {"itemId": "404"}]
+    ))
+    changes = result.changes
+    assert changes.unknownItems == ["404"]
+    assert [report.items for report in changes.dailyReports[:2]] == [
+        [{"itemId": "001", "name": "Wipes", "timesUsed": 2, "usesRemaining": 3, "status": "Active"}],
+        [{"itemId": "001", "name": "Wipes", "timesUsed": 2, "usesRemaining": 1, "status": "Active"}],
+    ]
+    assert changes.dailyReports[2].items[0]["timesUsed"] == 1
+    assert changes.totalItemsUsed == 5
+    assert test_db.query(Item).filter(Item.id == "001").one().is_waste is True
+
+def test_simulation_profile(test_db):
+    """A profiled run reports per-phase timings and query counts and feeds the metrics registry"""
+    from app.utils.metrics import metrics
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", usage_limit=5, uses_remaining=5, is_waste=False))
+    test_db.commit()
+
+    service = SimulationService()
+    result = service.simulate_time(test_db, SimulationRequest(numOfDays=2, itemsToBeUsedPerDay=[{"itemId": "001"}]))
+    assert result.profile is None
+
+    result = service.simulate_time(test_db, SimulationRequest(
+        numOfDays=2, itemsToBeUsedPerDay=[{"itemId": "001"}], profile=True
+    ))
+    phases = result.profile["phases"]
+    assert {"load", "usage", "expiry", "reports", "logging", "writeBack", "commit"} <= set(phases)
+    assert phases["usage"]["calls"] == 2
+    assert phases["load"]["queries"] > 0 and phases["commit"]["queries"] > 0
+    assert result.profile["totalQueries"] == sum(phase["queries"] for phase in phases.values())
+    assert "simulation.usage" in metrics.snapshot()["timings"]
+
+    # Queries of other sessions during the run are not counted
+    records = service.iter_simulation(test_db, SimulationRequest(
+        numOfDays=2, itemsToBeUsedPerDay=[{"itemId": "001"}], profile=True
+    ))
+    next(records)
+    other = TestingSessionLocal()
+    for _ in range(5):
+        other.query(Item).count()
+    other.close()
+    profile = list(records)[-1]["profile"]
+    assert "other" not in profile["phases"]
+
+def test_log_keyset_pagination(test_db, client):
+    """Logs page by (timestamp, id) and the filtered queries use the composite indexes"""
+    from app.services.logging import LoggingService
+    from sqlalchemy import text
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", is_waste=False))
+    test_db.commit()
+    now = datetime.now(timezone.utc)
+    # Several rows share a timestamp so the id tiebreak matters
+    LoggingService().add_logs(test_db, [
+        {"timestamp": now + timedelta(seconds=i // 2), "user_id": "crew", "action_type": "retrieval",
+         "item_id": "001", "details": {"n": i}}
+        for i in range(7)
+    ], durable=True)
+    test_db.commit()
+
+    params = {
+        "startDate": (now - timedelta(days=1)).isoformat(),
+        "endDate": (now + timedelta(days=1)).isoformat(),
+        "actionType": "retrieval",
+        "limit": 3
+    }
+    seen, cursor = [], None
+    while True:
+        page = client.get("/api/logs", params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        seen += [log["details"]["n"] for log in page["logs"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(7))
+    assert client.get("/api/logs", params={**params, "cursor": "not-a-cursor"}).status_code == 400
+
+    plan = test_db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM logs WHERE item_id = '001' AND timestamp >= '2020-01-01' "
+        "ORDER BY timestamp, id LIMIT 10"
+    )).all()
+    assert "ix_logs_item_timestamp" in " ".join(str(row) for row in plan)
+
+def test_log_export_streams_ndjson_and_gzip_csv(test_db, client):
+    """The export streams every matching log, as NDJSON or as gzip-compressed CSV"""
+    import csv, gzip, io, json
+    from app.services.logging import LoggingService
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", is_waste=False))
+    test_db.commit()
+    now = datetime.now(timezone.utc)
+    LoggingService().add_logs(test_db, [
+        {"timestamp": now, "user_id": "crew", "action_type": "retrieval", "item_id": "001", "details": {"n": i}}
+        for i in range(2500)
+    ], durable=True)
+    test_db.commit()
+
+    params = {"startDate": (now - timedelta(days=1)).isoformat(), "endDate": (now + timedelta(days=1)).isoformat()}
+    response = client.get("/api/logs/export", params=params)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["details"]["n"] for record in records] == list(range(2500))
+
+    response = client.get("/api/logs/export", params={**params, "format": "csv", "gzip": True})
+    assert response.headers["content-type"] == "application/gzip"
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert len(rows) == 2500
+    assert rows[0]["actionType"] == "retrieval" and json.loads(rows[-1]["details"]) == {"n": 2499}
+
+def test_log_archive_merges_cold_segments(test_db, tmp_path):
+    """Old logs move into day segments and reads merge them with the rows still in the database"""
+    from app.models import Log
+    from app.services.log_archive import LogArchive
+    from app.services.logging import LoggingService
+    for item_id in ("001", "002"):
+        test_db.add(Item(itemId=item_id, name=item_id, width=1, depth=1, height=1, mass=1, priority=1,
+                         preferred_zone="A", is_waste=False))
+    test_db.commit()
+    archive = LogArchive(tmp_path / "archive")
+    service = LoggingService(archive=archive)
+    now = datetime.now(timezone.utc)
+    service.add_logs(test_db, [
+        {"timestamp": now - timedelta(days=day, hours=i), "user_id": "crew", "action_type": "retrieval",
+         "item_id": "001" if day < 5 else "002", "details": {"day": day, "i": i}}
+        for day in range(10) for i in range(3)
+    ], durable=True)
+    test_db.commit()
+
+    result = archive.archive(test_db, before=now - timedelta(days=3))
+    assert result["segmentsWritten"] == len(archive.segments()) >= 6
+    assert test_db.query(Log).count() == 30 - result["logsArchived"]
+
+    start, end = now - timedelta(days=30), now + timedelta(days=1)
+    seen, cursor = [], None
+    while True:
+        page = service.get_logs(test_db, start, end, cursor=cursor, limit=4)
+        seen += [(log["details"]["day"], log["details"]["i"]) for log in page["logs"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(((day, i) for day in range(10) for i in range(3)), reverse=True)
+
+    # Segments without the item are pruned by their footers
+    only_new = service.get_logs(test_db, start, end, item_id="001", limit=100)["logs"]
+    assert {log["details"]["day"] for log in only_new} == set(range(5))
+    exported = [log for batch in service.iter_logs(test_db, start, end, item_id="002") for log in batch]
+    assert len(exported) == 15
+
+    # Ids can be reused after archiving, so a segment never replaces another
+    from types import SimpleNamespace
+    row = SimpleNamespace(id=1, timestamp=datetime(2020, 1, 1), user_id="crew", action_type="retrieval",
+                          item_id="001", details=None, promoted=0, from_container=None)
+    first = archive._write_segment(datetime(2020, 1, 1), [row])
+    second = archive._write_segment(datetime(2020, 1, 1), [row])
+    assert first != second and first.exists() and second.exists()
+
+def test_activity_rollups(test_db, client, tmp_path):
+    """Rollups count logs as they are written and a backfill rebuilds the same counts"""
+    from app.models import ItemActivityRollup
+    from app.services.analytics import AnalyticsService
+    from app.services.log_archive import LogArchive
+    from app.services.logging import LoggingService
+    test_db.add(Container(id="contA", zone="Crew Quarters", width=10, depth=10, height=10))
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="Lab", container_id="contA", is_waste=False))
+    test_db.add(Item(itemId="002", name="Filter", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="Lab", is_waste=False))
+    test_db.commit()
+    service = LoggingService()
+    now = datetime.now(timezone.utc)
+    service.add_logs(test_db, [
+        {"timestamp": now - timedelta(days=day), "user_id": "crew", "action_type": action, "item_id": item_id}
+        for day, action, item_id in [(0, "retrieval", "001"), (0, "retrieval", "001"), (1, "retrieval", "002"),
+                                     (1, "disposal", "002"), (8, "disposal", "001")]
+    ], durable=True)
+    service.add_log(test_db, "crew", "retrieval", "002")
+    log_writer.flush()
+    test_db.commit()
+
+    params = {"startDate": (now - timedelta(days=30)).date().isoformat(), "endDate": now.date().isoformat()}
+    items = client.get("/api/analytics/items", params={**params, "actionType": "retrieval", "itemId": "001"}).json()
+    assert items["activity"] == [{"day": now.date().isoformat(), "itemId": "001", "actionType": "retrieval", "count": 2}]
+    top = client.get("/api/analytics/top-items", params={**params, "actionType": "retrieval"}).json()["items"]
+    assert top == [{"itemId": "001", "count": 2}, {"itemId": "002", "count": 2}]
+    zones = client.get("/api/analytics/zones", params={**params, "actionType": "disposal", "period": "week"}).json()
+    assert {(row["zone"], row["count"]) for row in zones["activity"]} == {("Crew Quarters", 1), ("Lab", 1)}
+
+    before = test_db.query(ItemActivityRollup).count()
+    incremental = AnalyticsService().item_activity(test_db, now.date() - timedelta(days=30), now.date())
+    archive = LogArchive(tmp_path / "archive")
+    archive.archive(test_db, before=now - timedelta(days=2))
+    result = AnalyticsService().backfill(test_db, archive)
+    assert result["logsCounted"] == 6 and result["itemRows"] == before
+    assert AnalyticsService().item_activity(test_db, now.date() - timedelta(days=30), now.date()) == incremental
+
+def test_rollup_failures_keep_log_rows(test_db, monkeypatch):
+    """A failing rollup update neither drops buffered logs nor undoes durable ones"""
+    from app.models import Log
+    from app.services import log_writer as log_writer_module, logging as logging_module
+    from app.services.log_writer import LogWriter
+    from app.services.logging import LoggingService
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("rollup table missing")
+
+    monkeypatch.setattr(log_writer_module, "record_rollups", fail)
+    monkeypatch.setattr(logging_module, "record_rollups", fail)
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="A", is_waste=False))
+    test_db.commit()
+
+    writer = LogWriter()
+    service = LoggingService(writer=writer)
+    assert service.add_log(test_db, "crew", "disposal", "001")
+    service.add_logs(test_db, [{"user_id": "crew", "action_type": "placement", "item_id": "001"}], durable=True)
+    test_db.commit()
+    service.add_log(test_db, "crew", "retrieval", "001")
+    assert writer.flush() == 1
+    assert writer.stats()["rollupFailures"] == 1 and writer.rows_dropped == 0
+    assert test_db.query(Log).count() == 3
+
+def test_typed_log_details(test_db, tmp_path):
+    """Hot detail fields live in typed columns and reads rebuild the original details"""
+    from sqlalchemy import text
+    from app.models import Log
+    from app.services.log_archive import LogArchive
+    from app.services.logging import LoggingService
+    for container_id in ("contA", "contB"):
+        test_db.add(Container(id=container_id, zone="Lab", width=10, depth=10, height=10))
+    test_db.add(Item(itemId="001", name="Wipes", width=1, depth=1, height=1, mass=1, priority=1,
+                     preferred_zone="Lab", container_id="contB", position=_position((0, 0, 0), (1, 1, 1)),
+                     is_waste=False))
+    test_db.commit()
+    now = datetime.now(timezone.utc)
+    new_position = _position((2.5, 0.0, 0.0), (3.5, 1.0, 1.0))
+    SearchService().update_item_location(test_db, "001", "crew", "contA", new_position, now)
+    service = LoggingService(archive=LogArchive(tmp_path / "archive"))
+    service.add_logs(test_db, [
+        {"user_id": "crew", "action_type": "retrieval", "item_id": "001",
+         "details": {"oldUsesRemaining": 3, "newUsesRemaining": 2, "position": {"odd": True}}}
+    ], durable=True)
+    log_writer.flush()
+    test_db.commit()
+
+    placement = test_db.query(Log).filter(Log.action_type == "placement").one()
+    assert (placement.from_container, placement.to_container) == ("contB", "contA")
+    assert len(placement.from_position) == 24 and len(placement.to_position) == 48
+    assert set(placement.details) == {"timestamp"}
+
+    start, end = now - timedelta(days=1), now + timedelta(days=1)
+    moved_out = service.get_logs(test_db, start, end, action_type="placement", from_container="contB")["logs"]
+    assert moved_out[0]["details"] == {
+        "timestamp": now.isoformat(), "oldContainer": "contB", "newContainer": "contA",
+        "oldPosition": _position((0, 0, 0), (1, 1, 1)), "newPosition": new_position
+    }
+    assert service.get_logs(test_db, start, end, from_container="contA")["logs"] == []
+    retrieval = service.get_logs(test_db, start, end, action_type="retrieval")["logs"][0]
+    assert retrieval["details"] == {"oldUsesRemaining": 3, "newUsesRemaining": 2, "position": {"odd": True}}
+
+    plan = test_db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM logs WHERE from_container = 'contB' ORDER BY timestamp, id"
+    )).all()
+    assert "ix_logs_from_container_timestamp" in " ".join(str(row) for row in plan)
+
+    # Archived segments keep the full details and the container filter
+    service.archive.archive(test_db, before=now + timedelta(days=2))
+    archived = service.get_logs(test_db, start, end, from_container="contB")["logs"]
+    assert [log["details"] for log in archived] == [moved_out[0]["details"]]
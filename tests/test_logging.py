@@ -0,0 +1,69 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.models import Base, Log
+from app.services.logging import LoggingService
+from app.services.log_writer import LogWriter
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+def test_buffered_logs_are_written_on_flush(test_db):
+    """Non-durable logs are queued and bulk-inserted on flush"""
+    writer = LogWriter(batch_size=100, max_queue_size=1000)
+    service = LoggingService(writer)
+
+    for _ in range(10):
+        assert service.add_log(test_db, "crew", "search", "001", {"found": True})
+
+    assert writer.pending() == 10
+    assert test_db.query(Log).count() == 0
+
+    assert service.flush() == 10
+    assert writer.pending() == 0
+    assert test_db.query(Log).count() == 10
+
+def test_disposal_logs_are_durable(test_db):
+    """Disposal events bypass the buffer and are committed immediately"""
+    writer = LogWriter()
+    service = LoggingService(writer)
+
+    assert service.add_log(test_db, "system", "disposal", "001", {"reason": "Expired"})
+    assert writer.pending() == 0
+    assert test_db.query(Log).filter(Log.action_type == "disposal").count() == 1
+
+def test_full_queue_drains_inline(test_db):
+    """A full queue is drained by the producer instead of growing"""
+    writer = LogWriter(batch_size=5, max_queue_size=20)
+    service = LoggingService(writer)
+
+    for _ in range(20):
+        service.add_log(test_db, "crew", "retrieval", "001")
+
+    assert writer.pending() == 0
+    assert test_db.query(Log).count() == 20
+
+def test_get_logs_sees_buffered_rows(test_db):
+    """Queries flush the buffer first so callers read their own writes"""
+    service = LoggingService(LogWriter())
+    now = datetime.now(timezone.utc)
+
+    service.add_log(test_db, "crew", "retrieval", "001")
+    result = service.get_logs(test_db, now - timedelta(minutes=1), now + timedelta(minutes=1))
+    assert len(result["logs"]) == 1